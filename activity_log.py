@@ -0,0 +1,158 @@
+"""
+Асинхронний пакетний запис активності користувачів (UserActivity)
+
+Запит лише кладе запис у обмежену чергу в пам'яті процесу, а фоновий потік
+вставляє накопичені записи одним INSERT кожні ACTIVITY_LOG_FLUSH_INTERVAL_MS
+мілісекунд або щойно набереться ACTIVITY_LOG_BATCH_SIZE записів. Так запис
+журналу не додає синхронного коміту (і блокування SQLite) до часу відповіді.
+
+Якщо черга переповнена, запис відкидається (запит ніколи не блокується
+довше за ACTIVITY_LOG_PUT_TIMEOUT) і враховується в метриці dropped.
+При зупинці процесу черга дописується в базу (atexit).
+
+У режимі тестування або при ACTIVITY_LOG_ASYNC=False записи пишуться одразу.
+"""
+
+import queue
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from batch_flusher import BatchFlusher
+from models import db, UserActivity
+
+
+class ActivityLogSink(BatchFlusher):
+    """Черга записів активності з фоновим пакетним записом у базу"""
+
+    thread_name = 'activity-log-flusher'
+
+    def __init__(self, app=None):
+        super().__init__()
+        self._queue = None
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self.max_queue_depth = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Реєструє sink у додатку (app.extensions['activity_log'])"""
+        app.config.setdefault('ACTIVITY_LOG_ASYNC', True)
+        app.config.setdefault('ACTIVITY_LOG_FLUSH_INTERVAL_MS', 500)
+        app.config.setdefault('ACTIVITY_LOG_BATCH_SIZE', 200)
+        app.config.setdefault('ACTIVITY_LOG_QUEUE_SIZE', 10000)
+        app.config.setdefault('ACTIVITY_LOG_PUT_TIMEOUT', 0)
+
+        self.app = app
+        self._queue = queue.Queue(maxsize=app.config['ACTIVITY_LOG_QUEUE_SIZE'])
+        app.extensions['activity_log'] = self
+
+    @property
+    def is_async(self):
+        return bool(self.app.config.get('ACTIVITY_LOG_ASYNC')) and not self.app.testing
+
+    def flush_interval(self):
+        return self.app.config['ACTIVITY_LOG_FLUSH_INTERVAL_MS'] / 1000.0
+
+    def submit(self, user_id, action, ip_address=None, user_agent=None, url=None):
+        """
+        Додає запис активності до черги
+
+        Args:
+            user_id: ID користувача
+            action: Опис дії
+            ip_address: IP адреса
+            user_agent: User-Agent клієнта
+            url: URL запиту
+
+        Returns:
+            bool: False, якщо запис відкинуто через переповнену чергу
+        """
+        record = {
+            'user_id': user_id,
+            'action': action,
+            'ip_address': ip_address,
+            'user_agent': user_agent,
+            'url': url,
+            # Час фіксується в момент дії, а не в момент запису в базу
+            'timestamp': datetime.utcnow(),
+        }
+
+        if not self.is_async:
+            self._write_sync(record)
+            return True
+
+        self._ensure_started()
+        timeout = self.app.config.get('ACTIVITY_LOG_PUT_TIMEOUT') or 0
+        try:
+            if timeout > 0:
+                self._queue.put(record, timeout=timeout)
+            else:
+                self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            # Не засмічуємо лог при тривалому переповненні
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                self.app.logger.warning(f"Черга журналу активності переповнена, відкинуто записів: {self.dropped}")
+            return False
+
+        depth = self._queue.qsize()
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+        if depth >= self.app.config['ACTIVITY_LOG_BATCH_SIZE']:
+            self.wake()
+        return True
+
+    def _write_sync(self, record):
+        """Запис одразу в сесії запиту (тести / вимкнений асинхронний режим)"""
+        db.session.add(UserActivity(**record))
+        try:
+            db.session.commit()
+            self.written += 1
+        except Exception as e:
+            db.session.rollback()
+            self.failed += 1
+            self.app.logger.error(f"Помилка логування активності: {e}")
+
+    def _write(self, batch):
+        """Вставляє пакет записів одним INSERT у власному контексті додатку"""
+        with self.app.app_context():
+            try:
+                db.session.execute(insert(UserActivity), batch)
+                db.session.commit()
+                self.written += len(batch)
+                self.batches += 1
+            except Exception as e:
+                db.session.rollback()
+                self.failed += len(batch)
+                self.app.logger.error(f"Помилка пакетного запису активності ({len(batch)} записів): {e}")
+            finally:
+                db.session.remove()
+
+    def _take(self):
+        """Забирає з черги до ACTIVITY_LOG_BATCH_SIZE записів без очікування"""
+        batch = []
+        while len(batch) < self.app.config['ACTIVITY_LOG_BATCH_SIZE']:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def stats(self):
+        """Метрики журналу активності"""
+        return {
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+            'queue_size': self._queue.maxsize if self._queue is not None else 0,
+            'max_queue_depth': self.max_queue_depth,
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'batches': self.batches,
+        }
+
+
+activity_log = ActivityLogSink()
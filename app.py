@@ -5,13 +5,14 @@ from flask_wtf.csrf import CSRFProtect, CSRFError
 from flask_migrate import Migrate
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from flask_caching import Cache
 from datetime import datetime
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 
 import os
 import re
+import threading
 
 # Імпорт конфігурації
 from config import DevelopmentConfig
@@ -19,6 +20,47 @@ from config import DevelopmentConfig
 # Імпорт моделей
 from models import db, User
 
+# Пошуковий індекс пристроїв (реєструє DDL-події для таблиці device)
+import search_service
+import device_counters
+import photo_gc
+import valuation
+
+# Історія змін пристроїв (реєструє подію after_flush сесії)
+import device_history
+
+# Асинхронний журнал активності користувачів
+from activity_log import activity_log
+
+# Кеш перевірених JWT токенів API
+from token_cache import token_cache
+from stats_service import device_stats
+
+# Спільний кеш застосунку
+from cache_service import app_cache
+
+# Сховище згенерованих QR-кодів
+from qr_service import qr_store
+from utils_pdf import pdf_engine
+
+# Обробка фото пристроїв у пулі процесів
+from image_pipeline import photo_pipeline
+
+# Резервне копіювання у фоні
+from backup_service import backup_manager
+
+# Відстеження активності сесій (пакетний запис last_activity)
+from session_activity import session_activity
+
+# Облік SQL-запитів на запит і виявлення N+1
+from query_stats import query_inspector
+
+# Метрики Prometheus (/metrics) та журнал повільних запитів
+from metrics import metrics
+
+# Профіль SQLite: WAL, synchronous=NORMAL, busy_timeout та інші PRAGMA на з'єднанні
+from sqlite_profile import sqlite_profile
+
 # Ініціалізація Flask додатку
 app = Flask(__name__)
 app.config.from_object(DevelopmentConfig)
@@ -26,6 +68,9 @@ app.config.from_object(DevelopmentConfig)
 # Ініціалізація розширень
 db.init_app(app)
 migrate = Migrate(app, db)
+sqlite_profile.init_app(app)
+query_inspector.init_app(app)
+metrics.init_app(app)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'auth.login'
@@ -43,11 +88,39 @@ limiter = Limiter(
     storage_uri=app.config.get('RATELIMIT_STORAGE_URL', 'memory://')
 )
 
-# Ініціалізація Flask-Caching для кешування
-cache = Cache(app, config={
-    'CACHE_TYPE': 'simple',  # Для production використовуйте 'redis' або 'memcached'
-    'CACHE_DEFAULT_TIMEOUT': 300  # 5 хвилин за замовчуванням
-})
+# Спільний кеш (SQLite/Redis + кеш процесу) з інвалідацією за тегами
+app_cache.init_app(app)
+
+# QR-коди пристроїв: PNG на диску, адресовані хешем вмісту
+qr_store.init_app(app)
+
+# PDF: спільні шрифти та стилі, потокова побудова документів
+pdf_engine.init_app(app)
+
+# Фото: оригінал зберігається в запиті, варіанти - у пулі процесів
+photo_pipeline.init_app(app)
+
+# Резервні копії: онлайн-знімки SQLite / pg_dump у фоновому потоці
+backup_manager.init_app(app)
+
+# Журнал активності: записи пишуться в базу пакетами у фоновому потоці
+activity_log.init_app(app)
+
+# Кеш перевірених JWT токенів: повторні запити API не звертаються до blacklist/api_token
+token_cache.init_app(app)
+
+# Активність сесій: last_activity пишеться не частіше ніж раз на SESSION_ACTIVITY_WRITE_INTERVAL
+session_activity.init_app(app)
+
+# Статистика пристроїв: читається з device_counters, кеш на рівні міста
+device_stats.init_app(app)
+
+# flask rebuild-device-counters
+device_counters.register_commands(app)
+photo_pipeline.register_commands(app)
+photo_gc.register_commands(app)
+valuation.register_commands(app)
+sqlite_profile.register_commands(app)
 
 # Створення директорій, якщо вони не існують
 if not os.path.exists(app.config['UPLOAD_FOLDER']):
@@ -100,15 +173,52 @@ def load_user(user_id):
 # Middleware для оновлення активності сесії
 @app.before_request
 def update_session_activity():
-    """Оновлює активність сесії при кожному запиті"""
+    """Фіксує активність сесії (запис у базу пакетами у фоні, див. session_activity)"""
     from flask_login import current_user
     from flask import session as flask_session
-    from utils import update_session_activity
+    
+    # Статика, мініатюри та health-check'и не є активністю - і не завантажують користувача
+    if not session_activity.should_track(request.endpoint):
+        return
     
     if current_user.is_authenticated:
         session_id = flask_session.get('_id', flask_session.sid if hasattr(flask_session, 'sid') else None)
         if session_id:
-            update_session_activity(str(session_id))
+            session_activity.touch(str(session_id))
+
+# Відновлення після перезапуску процесу. Під gunicorn (wsgi:app) блок __main__
+# не виконується, тому задачі запускає перший запит кожного процесу
+_startup_lock = threading.Lock()
+_startup_thread = None
+
+def run_startup_tasks():
+    """
+    Відновлює похідні дані старої бази і незавершену роботу після перезапуску:
+    пошуковий індекс, лічильники пристроїв, черга фото 'pending'
+    """
+    tasks = (
+        search_service.ensure_search_index,
+        device_counters.ensure_device_counters,
+        photo_pipeline.requeue_pending,
+    )
+    with app.app_context():
+        for task in tasks:
+            try:
+                task()
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f"Помилка відновлення після запуску ({task.__name__}): {e}")
+
+@app.before_request
+def start_startup_tasks():
+    """Запускає run_startup_tasks у фоновому потоці з першим запитом процесу"""
+    global _startup_thread
+    if _startup_thread is not None or app.testing:
+        return
+    with _startup_lock:
+        if _startup_thread is None:
+            _startup_thread = threading.Thread(target=run_startup_tasks, name='startup-tasks', daemon=True)
+            _startup_thread.start()
 
 # Context processor для підрахунку прострочених пристроїв
 @app.context_processor
@@ -159,22 +269,13 @@ def readiness_check():
 @app.route('/')
 def index():
     from flask_login import current_user
-    from models import Device
     
     # Статистика для авторизованих користувачів
     stats = {}
     if current_user.is_authenticated:
-        # Якщо користувач адміністратор - показуємо всі дані
-        if current_user.is_admin:
-            base_query = Device.query
-        else:
-            # Звичайні користувачі бачать тільки дані свого міста
-            base_query = Device.query.filter_by(city_id=current_user.city_id)
-        
-        stats['total_devices'] = base_query.count()
-        stats['active_devices'] = base_query.filter_by(status='В роботі').count()
-        stats['repair_devices'] = base_query.filter_by(status='На ремонті').count()
-        stats['decommissioned_devices'] = base_query.filter_by(status='Списано').count()
+        # Адміністратор бачить усі дані, звичайні користувачі - тільки свого міста
+        city_id = None if current_user.is_admin else current_user.city_id
+        stats = device_stats.status_counters(city_id)
     
     return render_template('index.html', **stats)
 
@@ -201,23 +302,19 @@ def search():
         'users': []
     }
     
-    # Пошук пристроїв
+    # Пошук пристроїв через пошуковий індекс
     from models import Device
     from sqlalchemy import or_
+    from search_service import apply_device_search
     
     if current_user.is_admin:
         device_query = Device.query
     else:
         device_query = Device.query.filter_by(city_id=current_user.city_id)
     
-    device_query = device_query.filter(
-        or_(
-            Device.name.ilike(f'%{query}%'),
-            Device.type.ilike(f'%{query}%'),
-            Device.serial_number.ilike(f'%{query}%'),
-            Device.inventory_number.ilike(f'%{query}%'),
-            Device.location.ilike(f'%{query}%')
-        )
+    device_query = apply_device_search(
+        device_query, query,
+        fields=('name', 'type', 'serial_number', 'inventory_number', 'location')
     ).limit(limit)
     
     devices = device_query.all()
@@ -316,7 +413,8 @@ def create_admin():
 # Ініціалізація планувальника задач
 def init_scheduler():
     """Ініціалізує планувальник для автоматичних задач"""
-    from utils import backup_database, cleanup_old_backups
+    from utils import cleanup_old_backups
+    from backup_service import JOB_DONE
     
     scheduler = BackgroundScheduler()
     
@@ -325,16 +423,18 @@ def init_scheduler():
         # Обгорткові функції для backup з контекстом Flask
         def backup_with_context():
             """Обгортка для backup з контекстом Flask"""
-            with app.app_context():
-                backup_database(app.config['BACKUP_FOLDER'])
+            # Через менеджер: не перетинається з копіюванням з адмін-панелі
+            # і видно в /admin/backup/status
+            job = backup_manager.start(wait=True)
+            if job['status'] != JOB_DONE:
+                app.logger.warning(
+                    f"Планове резервне копіювання не виконано: {job['error'] or 'вже виконується інше копіювання'}"
+                )
         
         def cleanup_backups_with_context():
             """Обгортка для очищення backup з контекстом Flask"""
             with app.app_context():
-                cleanup_old_backups(
-                    app.config['BACKUP_FOLDER'], 
-                    app.config.get('BACKUP_KEEP_DAYS', 30)
-                )
+                cleanup_old_backups(app.config['BACKUP_FOLDER'])
         
         scheduler.add_job(
             func=backup_with_context,
@@ -344,24 +444,23 @@ def init_scheduler():
             replace_existing=True
         )
         
-        # Очищення старих backup щотижня
+        # Очищення старих backup за політикою GFS щодня після копіювання
         scheduler.add_job(
             func=cleanup_backups_with_context,
-            trigger=CronTrigger(day_of_week=0, hour=3, minute=0),
+            trigger=CronTrigger(hour=2, minute=30),
             id='cleanup_backups',
             name='Очищення старих backup',
             replace_existing=True
         )
     
     # Очищення прострочених сесій кожні 30 хвилин
-    from utils import cleanup_expired_sessions, cleanup_expired_blacklist
+    from utils import cleanup_expired_sessions, cleanup_expired_blacklist, cleanup_expired_api_tokens
     
     def cleanup_sessions_with_context():
         """Обгортка для очищення сесій з контекстом Flask"""
         with app.app_context():
-            count = cleanup_expired_sessions(inactivity_timeout_minutes=30)
-            if count > 0:
-                app.logger.info(f"Очищено {count} прострочених сесій")
+            # Кількість рядків і тривалість логуються в самій задачі
+            cleanup_expired_sessions(inactivity_timeout_minutes=30)
     
     scheduler.add_job(
         func=cleanup_sessions_with_context,
@@ -375,9 +474,7 @@ def init_scheduler():
     def cleanup_blacklist_with_context():
         """Обгортка для очищення blacklist з контекстом Flask"""
         with app.app_context():
-            count = cleanup_expired_blacklist()
-            if count > 0:
-                app.logger.info(f"Очищено {count} прострочених записів з blacklist")
+            cleanup_expired_blacklist()
     
     scheduler.add_job(
         func=cleanup_blacklist_with_context,
@@ -387,6 +484,20 @@ def init_scheduler():
         replace_existing=True
     )
     
+    # Видалення прострочених API токенів щодня о 3:10
+    def cleanup_api_tokens_with_context():
+        """Обгортка для очищення API токенів з контекстом Flask"""
+        with app.app_context():
+            cleanup_expired_api_tokens()
+    
+    scheduler.add_job(
+        func=cleanup_api_tokens_with_context,
+        trigger=CronTrigger(hour=3, minute=10),  # Щодня о 3:10
+        id='cleanup_expired_api_tokens',
+        name='Видалення прострочених API токенів',
+        replace_existing=True
+    )
+    
     # Очищення невикористаних фото щодня о 4:00
     from utils import cleanup_unused_photos
     
@@ -405,6 +516,38 @@ def init_scheduler():
         replace_existing=True
     )
     
+    # Обслуговування SQLite: контрольна точка WAL і нічний PRAGMA optimize
+    if sqlite_profile.enabled:
+        def sqlite_checkpoint_with_context():
+            """Обгортка для контрольної точки WAL з контекстом Flask"""
+            with app.app_context():
+                sqlite_profile.checkpoint()
+        
+        def sqlite_optimize_with_context():
+            """Обгортка для PRAGMA optimize з контекстом Flask"""
+            with app.app_context():
+                sqlite_profile.optimize()
+        
+        checkpoint_minutes = app.config.get('SQLITE_CHECKPOINT_MINUTES', 30)
+        if checkpoint_minutes:
+            scheduler.add_job(
+                func=sqlite_checkpoint_with_context,
+                trigger=IntervalTrigger(minutes=checkpoint_minutes),
+                id='sqlite_wal_checkpoint',
+                name='Контрольна точка WAL SQLite',
+                replace_existing=True
+            )
+        
+        scheduler.add_job(
+            func=sqlite_optimize_with_context,
+            trigger=CronTrigger(hour=4, minute=30),  # Щодня о 4:30
+            id='sqlite_optimize',
+            name='PRAGMA optimize SQLite',
+            replace_existing=True
+        )
+    
+    # Тривалість і помилки задач - у метриках (/metrics)
+    metrics.instrument_scheduler(scheduler)
     
     scheduler.start()
     print("Планувальник задач запущено")
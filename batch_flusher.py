@@ -0,0 +1,94 @@
+"""
+Базовий клас для пакетного запису накопиченого в пам'яті процесу
+
+Запит лише додає дані в буфер підкласу, а фоновий потік (запускається при
+першому використанні, не при імпорті) раз на flush_interval() секунд - або
+раніше, якщо підклас викликав wake() - забирає їх пакетами через _take() і
+пише через _write(). При зупинці процесу залишок дописується (atexit).
+
+Підкласи: ActivityLogSink (activity_log), VerifiedTokenCache (token_cache),
+SessionActivityTracker (session_activity).
+"""
+
+import atexit
+import threading
+
+
+class BatchFlusher:
+    """Фоновий потік, що періодично записує накопичені пакети"""
+
+    # Ім'я фонового потоку
+    thread_name = 'batch-flusher'
+
+    def __init__(self):
+        self.app = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._atexit_registered = False
+
+    def flush_interval(self):
+        """Інтервал фонового запису (секунди)"""
+        raise NotImplementedError
+
+    def _take(self):
+        """Забирає наступний пакет з буфера (порожній - більше нічого писати)"""
+        raise NotImplementedError
+
+    def _write(self, batch):
+        """Записує пакет у базу у власному контексті додатку"""
+        raise NotImplementedError
+
+    def _ensure_started(self):
+        """Запускає фоновий потік при першому використанні"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+            self._thread.start()
+            if not self._atexit_registered:
+                atexit.register(self.shutdown)
+                self._atexit_registered = True
+
+    def wake(self):
+        """Просить фоновий потік записати пакет, не чекаючи інтервалу"""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval())
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """
+        Синхронно записує все накопичене
+
+        Returns:
+            int: Кількість записаних елементів
+        """
+        if self.app is None:
+            return 0
+        total = 0
+        with self._flush_lock:
+            while True:
+                batch = self._take()
+                if not batch:
+                    break
+                self._write(batch)
+                total += len(batch)
+        return total
+
+    def shutdown(self, timeout=5.0):
+        """Зупиняє фоновий потік і дописує залишок"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
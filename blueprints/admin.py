@@ -7,11 +7,14 @@ from datetime import datetime, timedelta, date
 import os
 import json
 import io
+import math
 import pytz
 
 # Імпорти моделей та функцій
 from models import User, City, Device, DeviceHistory, UserActivity, SystemSettings, db
 from utils import admin_required, log_user_activity
+from stats_service import device_stats
+from financial_report import fleet_summary
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -21,7 +24,7 @@ admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 @login_required
 @admin_required
 def admin_users():
-    users = User.query.all()
+    users = User.query.options(joinedload(User.city)).all()
     return render_template('admin/users.html', users=users)
 
 @admin_bp.route('/user/add', methods=['GET', 'POST'])
@@ -132,8 +135,13 @@ def admin_delete_user(user_id):
 @login_required
 @admin_required
 def admin_cities():
-    cities = City.query.all()
-    return render_template('admin/cities.html', cities=cities)
+    # Кількість пристроїв і користувачів - підзапитами, без завантаження самих об'єктів
+    device_count = db.select(func.count(Device.id)).where(Device.city_id == City.id).correlate(City).scalar_subquery()
+    user_count = db.select(func.count(User.id)).where(User.city_id == City.id).correlate(City).scalar_subquery()
+    rows = db.session.execute(db.select(City, device_count, user_count).order_by(City.id)).all()
+    cities = [city for city, _, _ in rows]
+    counts = {city.id: (devices, users) for city, devices, users in rows}
+    return render_template('admin/cities.html', cities=cities, counts=counts)
 
 @admin_bp.route('/city/add', methods=['GET', 'POST'])
 @login_required
@@ -198,71 +206,27 @@ def admin_delete_city(city_id):
 @login_required
 @admin_required
 def admin_dashboard():
-    # Кешування застосовується через current_app.extensions['cache']
-    cache_key = 'admin_dashboard'
-    try:
-        cache_obj = current_app.extensions.get('cache')
-        # Перевіряємо, чи це об'єкт Cache (має метод set)
-        if cache_obj and hasattr(cache_obj, 'set'):
-            cached_data = cache_obj.get(cache_key)
-            if cached_data:
-                return render_template('admin/dashboard.html', **cached_data)
-    except (KeyError, AttributeError, TypeError):
-        # Якщо кеш не доступний, продовжуємо без кешування
-        pass
-    # Загальна статистика
-    total_devices = Device.query.count()
-    total_users = User.query.count()
-    total_cities = City.query.count()
-    
-    # Розподіл пристроїв за містами
-    devices_by_city = db.session.query(
-        City.name, func.count(Device.id)
-    ).join(City).group_by(City.name).all()
-    
-    # Розподіл пристроїв за типом
-    devices_by_type = db.session.query(
-        Device.type, func.count(Device.id)
-    ).group_by(Device.type).all()
-    
-    # Розподіл пристроїв за статусом
-    devices_by_status = db.session.query(
-        Device.status, func.count(Device.id)
-    ).group_by(Device.status).all()
-    
-    # Нові пристрої за останні 30 днів
+    # Усі лічильники пристроїв - з таблиці device_counters (кешується в device_stats)
+    stats = device_stats.get()
+    
+    # Кількість користувачів, міст та нових пристроїв за 30 днів - ще один запит
     thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    new_devices_count = Device.query.filter(Device.created_at >= thirty_days_ago).count()
-    
-    # Пристрої, додані за останні 12 місяців
-    devices_by_month = []
-    for i in range(12):
-        start_date = datetime.utcnow().replace(day=1) - timedelta(days=30*i)
-        end_date = (start_date.replace(day=28) + timedelta(days=4)).replace(day=1)
-        count = Device.query.filter(Device.created_at >= start_date, Device.created_at < end_date).count()
-        month_name = start_date.strftime('%B %Y')
-        devices_by_month.append((month_name, count))
-    devices_by_month.reverse()
-    
-    # Зберігаємо дані в кеш
+    total_users, total_cities, new_devices_count = db.session.execute(db.select(
+        db.select(func.count(User.id)).scalar_subquery(),
+        db.select(func.count(City.id)).scalar_subquery(),
+        db.select(func.count(Device.id)).where(Device.created_at >= thirty_days_ago).scalar_subquery()
+    )).one()
+    
     dashboard_data = {
-        'total_devices': total_devices,
+        'total_devices': stats['total'],
         'total_users': total_users,
         'total_cities': total_cities,
-        'devices_by_city': devices_by_city,
-        'devices_by_type': devices_by_type,
-        'devices_by_status': devices_by_status,
+        'devices_by_city': stats['by_city'],
+        'devices_by_type': stats['by_type'],
+        'devices_by_status': list(stats['by_status'].items()),
         'new_devices_count': new_devices_count,
-        'devices_by_month': devices_by_month
+        'devices_by_month': [(month.strftime('%B %Y'), count) for month, count in stats['by_month']]
     }
-    try:
-        cache_obj = current_app.extensions.get('cache')
-        # Перевіряємо, чи це об'єкт Cache (має метод set)
-        if cache_obj and hasattr(cache_obj, 'set'):
-            cache_obj.set(cache_key, dashboard_data, timeout=300)  # 5 хвилин
-    except (KeyError, AttributeError, TypeError):
-        # Якщо кеш не доступний, просто продовжуємо без кешування
-        pass
     
     return render_template('admin/dashboard.html', **dashboard_data)
 
@@ -273,12 +237,31 @@ def admin_user_activity():
     page = request.args.get('page', 1, type=int)
     per_page = 50  # Збільшуємо кількість записів на сторінку для журналу
     
-    activities = UserActivity.query.order_by(UserActivity.timestamp.desc()).paginate(
+    # Дописуємо чергу журналу, щоб показати найсвіжіші дії
+    activity_sink = current_app.extensions.get('activity_log')
+    if activity_sink is not None:
+        activity_sink.flush()
+    
+    activities = UserActivity.query.options(joinedload(UserActivity.user)).order_by(UserActivity.timestamp.desc()).paginate(
         page=page, per_page=per_page, error_out=False
     )
     
     return render_template('admin/user_activity.html', activities=activities)
 
+@admin_bp.route('/api/activity-log/stats')
+@login_required
+@admin_required
+def api_activity_log_stats():
+    """Метрики асинхронного журналу активності (черга, записані, відкинуті)"""
+    activity_sink = current_app.extensions.get('activity_log')
+    if activity_sink is None:
+        return jsonify({'enabled': False})
+    
+    stats = activity_sink.stats()
+    stats['enabled'] = True
+    stats['async'] = activity_sink.is_async
+    return jsonify(stats)
+
 # Видалено маршрути та логіку, пов'язані з Telegram-ботом
 
 @admin_bp.route('/settings/export')
@@ -346,22 +329,42 @@ def admin_import_settings():
 @login_required
 @admin_required
 def admin_create_backup():
-    from utils import backup_database
-    result = backup_database(current_app.config['BACKUP_FOLDER'])
-    if result:
-        flash(f'Резервна копія успішно створена: {result["filename"]}', 'success')
-        log_user_activity(current_user.id, 'Створено резервну копію бази даних', request.remote_addr, request.url)
+    from backup_service import backup_manager, JOB_FAILED, JOB_BACKUP, JOB_KINDS
+    # Копіювання виконується у фоновому потоці - запит не чекає на нього
+    job = backup_manager.start(incremental=request.form.get('incremental') == '1')
+    if job['kind'] != JOB_BACKUP:
+        flash(f'Зачекайте: виконується {JOB_KINDS[job["kind"]].lower()}', 'warning')
+    elif job['status'] == JOB_FAILED:
+        flash(f'Помилка при створенні резервної копії: {job["error"]}', 'danger')
     else:
-        flash('Помилка при створенні резервної копії', 'danger')
+        flash('Резервне копіювання запущено', 'success')
+        log_user_activity(current_user.id, 'Створено резервну копію бази даних', request.remote_addr, request.url)
     return redirect(url_for('admin.admin_backup'))
 
+@admin_bp.route('/backup/status')
+@login_required
+@admin_required
+def admin_backup_status():
+    """Стан поточного (або останнього) резервного копіювання"""
+    from backup_service import backup_manager
+    job = backup_manager.status(request.args.get('job'))
+    if job is None:
+        return jsonify({'status': None})
+    for key in ('started_at', 'finished_at'):
+        if job[key]:
+            job[key] = job[key].isoformat()
+    return jsonify(job)
+
 @admin_bp.route('/backup')
 @login_required
 @admin_required
 def admin_backup():
     from utils import get_backup_list
+    from backup_service import backup_manager, BACKUP_PHASES, JOB_KINDS
     backups = get_backup_list(current_app.config['BACKUP_FOLDER'])
-    return render_template('admin/backup.html', backups=backups)
+    return render_template('admin/backup.html', backups=backups,
+                           backup_job=backup_manager.status(), backup_phases=BACKUP_PHASES,
+                           job_kinds=JOB_KINDS)
 
 @admin_bp.route('/backup/<filename>/download')
 @login_required
@@ -381,33 +384,83 @@ def admin_download_backup(filename):
 @admin_required
 def admin_delete_backup(filename):
     from werkzeug.utils import secure_filename
-    backup_path = os.path.join(current_app.config['BACKUP_FOLDER'], secure_filename(filename))
+    from backup_service import BackupCatalog, manifest_path
+    catalog = BackupCatalog(current_app.config['BACKUP_FOLDER'])
+    filename = secure_filename(filename)
+    backup_path = os.path.join(current_app.config['BACKUP_FOLDER'], filename)
     
-    if os.path.exists(backup_path) and backup_path.startswith(current_app.config['BACKUP_FOLDER']):
+    if catalog.get(filename) is None:
+        flash('Файл не знайдено', 'danger')
+    elif catalog.dependents(filename):
+        # Без основи інкрементні знімки не відновити
+        flash('На цю копію спираються інкрементні копії - спочатку видаліть їх', 'danger')
+    else:
         try:
-            os.remove(backup_path)
+            for path in (backup_path, manifest_path(backup_path)):
+                if os.path.exists(path):
+                    os.remove(path)
+            catalog.remove([filename])
             flash('Резервну копію видалено', 'success')
             log_user_activity(current_user.id, f'Видалено резервну копію: {filename}', request.remote_addr, request.url)
         except Exception as e:
             flash(f'Помилка при видаленні: {e}', 'danger')
-    else:
-        flash('Файл не знайдено', 'danger')
     
     return redirect(url_for('admin.admin_backup'))
 
+def _start_backup_check(filename, kind):
+    """Запускає перевірку або пробне відновлення копії у фоні (спільне для двох маршрутів)"""
+    from werkzeug.utils import secure_filename
+    from backup_service import backup_manager, BackupCatalog, JOB_KINDS, JOB_VERIFY, JOB_DONE, JOB_FAILED
+    filename = secure_filename(filename)
+    if BackupCatalog(current_app.config['BACKUP_FOLDER']).get(filename) is None:
+        flash('Файл не знайдено', 'danger')
+        return None
+
+    start = backup_manager.start_verify if kind == JOB_VERIFY else backup_manager.start_dry_run
+    job = start(filename)
+    label = JOB_KINDS[kind]
+    if job['kind'] != kind or job['target'] != filename:
+        flash(f'Зачекайте: виконується {JOB_KINDS[job["kind"]].lower()}', 'warning')
+        return None
+    if job['status'] == JOB_DONE:
+        # Виконано одразу (тести)
+        flash(f'{label} {filename}: {job["message"]}', 'success' if job['ok'] else 'danger')
+    elif job['status'] == JOB_FAILED:
+        flash(f'{label} {filename}: {job["error"]}', 'danger')
+    else:
+        flash(f'{label} {filename} запущено', 'success')
+    return job
+
+@admin_bp.route('/backup/<filename>/verify', methods=['POST'])
+@login_required
+@admin_required
+def admin_verify_backup(filename):
+    """Перевірка контрольної суми та цілісності копії (у фоні)"""
+    from backup_service import JOB_VERIFY
+    _start_backup_check(filename, JOB_VERIFY)
+    return redirect(url_for('admin.admin_backup'))
+
+@admin_bp.route('/backup/<filename>/dry-run', methods=['POST'])
+@login_required
+@admin_required
+def admin_restore_dry_run(filename):
+    """Пробне відновлення копії в тимчасовий файл (у фоні)"""
+    from backup_service import JOB_DRY_RUN
+    if _start_backup_check(filename, JOB_DRY_RUN) is not None:
+        log_user_activity(current_user.id, f'Пробне відновлення резервної копії: {filename}', request.remote_addr, request.url)
+    return redirect(url_for('admin.admin_backup'))
+
 # API для графіків
 @admin_bp.route('/api/chart/devices-by-status')
 @login_required
 @admin_required
 def api_chart_devices_by_status():
     """Дані для кругової діаграми: розподіл за статусами"""
-    statuses = db.session.query(
-        Device.status, func.count(Device.id)
-    ).group_by(Device.status).all()
+    statuses = device_stats.get()['by_status']
     
     return jsonify({
-        'labels': [s[0] for s in statuses],
-        'data': [s[1] for s in statuses]
+        'labels': list(statuses),
+        'data': list(statuses.values())
     })
 
 @admin_bp.route('/api/chart/devices-by-type')
@@ -415,9 +468,7 @@ def api_chart_devices_by_status():
 @admin_required
 def api_chart_devices_by_type():
     """Дані для барної діаграми: розподіл за типами"""
-    types = db.session.query(
-        Device.type, func.count(Device.id)
-    ).group_by(Device.type).order_by(func.count(Device.id).desc()).limit(10).all()
+    types = device_stats.get()['by_type'][:10]
     
     return jsonify({
         'labels': [t[0] for t in types],
@@ -428,30 +479,12 @@ def api_chart_devices_by_type():
 @login_required
 @admin_required
 def api_chart_devices_by_month():
-    """Дані для лінійного графіка: динаміка додавання за 12 місяців"""
-    from datetime import datetime, timedelta
-    
-    months_data = []
-    labels = []
-    
-    for i in range(11, -1, -1):
-        start_date = datetime.now().replace(day=1) - timedelta(days=30*i)
-        if i > 0:
-            end_date = datetime.now().replace(day=1) - timedelta(days=30*(i-1))
-        else:
-            end_date = datetime.now()
-        
-        count = Device.query.filter(
-            Device.created_at >= start_date,
-            Device.created_at < end_date
-        ).count()
-        
-        months_data.append(count)
-        labels.append(start_date.strftime('%b %Y'))
+    """Дані для лінійного графіка: динаміка додавання за 12 календарних місяців"""
+    months = device_stats.get()['by_month']
     
     return jsonify({
-        'labels': labels,
-        'data': months_data
+        'labels': [month.strftime('%b %Y') for month, _ in months],
+        'data': [count for _, count in months]
     })
 
 @admin_bp.route('/api/chart/devices-by-city')
@@ -459,15 +492,60 @@ def api_chart_devices_by_month():
 @admin_required
 def api_chart_devices_by_city():
     """Дані для діаграми: розподіл за містами"""
-    cities = db.session.query(
-        City.name, func.count(Device.id)
-    ).join(Device).group_by(City.name).all()
+    cities = device_stats.get()['by_city']
     
     return jsonify({
         'labels': [c[0] for c in cities],
         'data': [c[1] for c in cities]
     })
 
+@admin_bp.route('/api/financial-summary')
+@login_required
+@admin_required
+def api_financial_summary():
+    """Фінансовий підсумок парку: залишкова вартість і ремонти по містах і типах"""
+    return jsonify(fleet_summary(request.args.get('city_id', type=int)))
+
+@admin_bp.route('/api/query-stats')
+@login_required
+@admin_required
+def api_query_stats():
+    """Кількість SQL-запитів по endpoint'ах та останні випадки N+1"""
+    return jsonify(current_app.extensions['query_inspector'].stats())
+
+@admin_bp.route('/api/valuation')
+@login_required
+@admin_required
+def api_valuation():
+    """Балансова вартість парку на дати (as_of, months) за сценаріями ставки (rate)"""
+    import valuation
+    
+    try:
+        as_of_dates = {datetime.strptime(value, '%Y-%m-%d').date() for value in request.args.getlist('as_of')}
+        rates = [float(value) for value in request.args.getlist('rate')]
+    except ValueError:
+        return jsonify({'error': 'Дати - у форматі РРРР-ММ-ДД, ставки - числа'}), 400
+    if not all(math.isfinite(rate) for rate in rates):
+        return jsonify({'error': 'Ставки мають бути скінченними числами'}), 400
+    months = request.args.get('months', type=int)
+    if months is not None:
+        # Межа до побудови дат: великі значення виходять за рік 1
+        if not 0 < months <= valuation.MAX_AS_OF_DATES:
+            return jsonify({'error': f'months - від 1 до {valuation.MAX_AS_OF_DATES}'}), 400
+        as_of_dates.update(valuation.month_ends(months))
+    as_of_dates = as_of_dates or {date.today()}
+    
+    if len(as_of_dates) > valuation.MAX_AS_OF_DATES or len(rates) > valuation.MAX_RATE_SCENARIOS:
+        return jsonify({'error': f'Не більше {valuation.MAX_AS_OF_DATES} дат і '
+                                 f'{valuation.MAX_RATE_SCENARIOS} сценаріїв ставки'}), 400
+    
+    try:
+        fleet = valuation.load_fleet(request.args.get('city_id', type=int))
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 503
+    
+    return jsonify(valuation.evaluate(fleet, as_of_dates, [None] + rates))
+
 @admin_bp.route('/maintenance-pending')
 @login_required
 @admin_required
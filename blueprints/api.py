@@ -7,10 +7,19 @@ from sqlalchemy.orm import joinedload, selectinload
 
 # Імпорти моделей та функцій
 from models import Device, City, User, DeviceHistory, db, ApiToken
-from utils import generate_inventory_number, record_device_history, verify_jwt_token, generate_jwt_token, revoke_jwt_token, refresh_access_token
+from utils import generate_inventory_number, verify_jwt_token, generate_jwt_token, revoke_jwt_token, refresh_access_token, get_cached_cities
+from search_service import apply_device_search
+from pagination import keyset_paginate, InvalidCursorError
+from device_history import track_device_history
+from stats_service import device_stats
+from financial_report import fleet_summary
+from qr_service import qr_store
 
 api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
 
+# Поля, за якими дозволено сортування в режимі cursor-пагінації
+API_CURSOR_SORT_FIELDS = ['id', 'created_at', 'name', 'type', 'inventory_number', 'serial_number', 'status', 'location']
+
 # Rate limiting для API отримується через current_app.extensions під час виконання
 
 # JWT автентифікація для API
@@ -108,18 +117,54 @@ def api_get_devices():
     if status:
         query = query.filter(Device.status.ilike(f'%{status}%'))
     if search:
-        query = query.filter(
-            db.or_(
-                Device.name.ilike(f'%{search}%'),
-                Device.serial_number.ilike(f'%{search}%'),
-                Device.inventory_number.ilike(f'%{search}%')
+        query = apply_device_search(query, search, fields=('name', 'serial_number', 'inventory_number'))
+    
+    # Keyset (cursor) пагінація: ?paging=cursor для першої сторінки, далі ?cursor=<next_cursor>
+    cursor = request.args.get('cursor', type=str)
+    if cursor or request.args.get('paging') == 'cursor':
+        sort_by = request.args.get('sort', 'id', type=str)
+        sort_order = request.args.get('order', 'asc', type=str)
+        if sort_by not in API_CURSOR_SORT_FIELDS:
+            return jsonify({'error': f'Invalid sort field: {sort_by}'}), 400
+        
+        include_total = request.args.get('include_total', 'false').lower() in ('1', 'true', 'yes')
+        try:
+            pagination = keyset_paginate(
+                query, Device, sort_by,
+                descending=sort_order == 'desc',
+                per_page=min(per_page, 100),
+                cursor=cursor,
+                with_total=include_total
             )
-        )
+        except InvalidCursorError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        response = {
+            'devices': [_serialize_device(d) for d in pagination.items],
+            'next_cursor': pagination.next_cursor,
+            'prev_cursor': pagination.prev_cursor,
+            'per_page': min(per_page, 100)
+        }
+        if include_total:
+            response['total'] = pagination.total
+        return jsonify(response)
     
     # Пагінація
     pagination = query.paginate(page=page, per_page=min(per_page, 100), error_out=False)
     
-    devices = [{
+    devices = [_serialize_device(d) for d in pagination.items]
+    
+    return jsonify({
+        'devices': devices,
+        'total': pagination.total,
+        'pages': pagination.pages,
+        'current_page': page,
+        'per_page': per_page
+    })
+
+def _serialize_device(d):
+    """Серіалізує пристрій для списку API"""
+    return {
         'id': d.id,
         'name': d.name,
         'type': d.type,
@@ -133,15 +178,7 @@ def api_get_devices():
         'created_at': d.created_at.isoformat() if d.created_at else None,
         'last_maintenance': d.last_maintenance.isoformat() if d.last_maintenance else None,
         'next_maintenance': d.next_maintenance.isoformat() if d.next_maintenance else None
-    } for d in pagination.items]
-    
-    return jsonify({
-        'devices': devices,
-        'total': pagination.total,
-        'pages': pagination.pages,
-        'current_page': page,
-        'per_page': per_page
-    })
+    }
 
 # GET /api/v1/devices/<id> - Один пристрій
 @api_bp.route('/devices/<int:device_id>', methods=['GET'])
@@ -218,12 +255,9 @@ def api_create_device():
         maintenance_interval=data.get('maintenance_interval', 365)
     )
     
+    # Історія створення записується разом з комітом пристрою
+    track_device_history(user.id)
     db.session.add(device)
-    db.session.flush()
-    
-    # Записуємо історію
-    record_device_history(device.id, user.id, 'create')
-    
     db.session.commit()
     
     return jsonify({
@@ -249,16 +283,13 @@ def api_update_device(device_id):
     if not data:
         return jsonify({'error': 'No data provided'}), 400
     
-    # Оновлюємо поля з відстеженням змін
+    # Оновлюємо поля (зміни записуються в історію при коміті)
     updateable_fields = ['name', 'type', 'location', 'status', 'notes', 'maintenance_interval']
     
+    track_device_history(user.id)
     for field in updateable_fields:
-        if field in data:
-            old_value = getattr(device, field)
-            new_value = data[field]
-            if old_value != new_value:
-                record_device_history(device.id, user.id, 'update', field, old_value, new_value)
-                setattr(device, field, new_value)
+        if field in data and getattr(device, field) != data[field]:
+            setattr(device, field, data[field])
     
     # Оновлюємо дату обслуговування, якщо надано
     if 'last_maintenance' in data:
@@ -285,11 +316,11 @@ def api_delete_device(device_id):
     if not user.is_admin and device.city_id != user.city_id:
         return jsonify({'error': 'Access denied'}), 403
     
-    # Записуємо історію видалення
-    record_device_history(device.id, user.id, 'delete', device=device)
-    
+    # Історія видалення записується в тій самій транзакції
+    track_device_history(user.id)
     db.session.delete(device)
     db.session.commit()
+    qr_store.discard(device_id)
     
     return jsonify({'message': 'Device deleted successfully'})
 
@@ -299,27 +330,14 @@ def api_delete_device(device_id):
 def api_get_cities():
     # Rate limiting застосовується через глобальні обмеження в app.py
     """Отримати список міст"""
-    # Кешуємо список міст (TTL 1 година)
-    try:
-        cache_obj = current_app.extensions.get('cache')
-        # Перевіряємо, чи це об'єкт Cache (має метод set)
-        if cache_obj and hasattr(cache_obj, 'set'):
-            cities = cache_obj.get('api_cities')
-            if cities is None:
-                cities = City.query.all()
-                cache_obj.set('api_cities', cities, timeout=3600)  # 1 година
-        else:
-            # Кеш не доступний, отримуємо дані без кешування
-            cities = City.query.all()
-    except (KeyError, AttributeError, TypeError):
-        # Якщо кеш не доступний, просто отримуємо дані без кешування
-        cities = City.query.all()
+    # Список міст зі спільного кешу (інвалідується при зміні міст)
+    cities = get_cached_cities()
     
     return jsonify({
         'cities': [{
-            'id': c.id,
-            'name': c.name,
-            'created_at': c.created_at.isoformat() if c.created_at else None
+            'id': c['id'],
+            'name': c['name'],
+            'created_at': c['created_at'].isoformat() if c['created_at'] else None
         } for c in cities]
     })
 
@@ -331,20 +349,22 @@ def api_get_stats():
     """Отримати статистику"""
     user = request.api_user
     
-    if user.is_admin:
-        base_query = Device.query
-    else:
-        base_query = Device.query.filter_by(city_id=user.city_id)
-    
-    stats = {
-        'total_devices': base_query.count(),
-        'active_devices': base_query.filter_by(status='В роботі').count(),
-        'repair_devices': base_query.filter_by(status='На ремонті').count(),
-        'decommissioned_devices': base_query.filter_by(status='Списано').count()
-    }
+    city_id = None if user.is_admin else user.city_id
+    stats = device_stats.status_counters(city_id)
     
     return jsonify(stats)
 
+# GET /api/v1/reports/financial-summary - Вартість парку по містах і типах
+@api_bp.route('/reports/financial-summary', methods=['GET'])
+@jwt_required
+def api_financial_summary():
+    """Залишкова вартість і витрати на ремонт по містах і типах (один запит)"""
+    user = request.api_user
+    
+    city_id = request.args.get('city_id', type=int) if user.is_admin else user.city_id
+    
+    return jsonify(fleet_summary(city_id))
+
 # POST /api/v1/auth/login - Генерація JWT токена
 @api_bp.route('/auth/login', methods=['POST'])
 def api_login():
@@ -1,10 +1,10 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session
 from flask_login import login_required, current_user, login_user, logout_user
 from werkzeug.security import check_password_hash
 
 # Імпорти моделей та функцій
 from models import User, db
-from utils import log_user_activity
+from utils import log_user_activity, create_user_session, deactivate_user_session
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -22,6 +22,8 @@ def login():
         
         if user and user.is_active and check_password_hash(user.password_hash, password):
             login_user(user)
+            if session.get('_id'):
+                create_user_session(user.id, session['_id'], request.remote_addr, request.headers.get('User-Agent'))
             log_user_activity(user.id, 'Вхід до системи', request.remote_addr, request.url)
             return redirect(url_for('index'))
         else:
@@ -33,5 +35,7 @@ def login():
 @login_required
 def logout():
     log_user_activity(current_user.id, 'Вихід із системи', request.remote_addr, request.url)
+    if session.get('_id'):
+        deactivate_user_session(session['_id'])
     logout_user()
     return redirect(url_for('index'))
\ No newline at end of file
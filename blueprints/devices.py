@@ -1,25 +1,30 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, abort, send_file, send_from_directory, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, flash, abort, send_file, send_from_directory, current_app, Response
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
-from sqlalchemy import func, or_
+from sqlalchemy import func
 from sqlalchemy.orm import joinedload, selectinload
 import os
 import uuid
+import mimetypes
 import io
-import openpyxl
-from openpyxl.styles import Font, PatternFill, Border, Side, Alignment
 from datetime import datetime, date
-import qrcode
-from PIL import Image
-import pytz
 
 # Імпорти моделей та функцій
-from models import Device, DevicePhoto, DeviceHistory, City, User, db, RepairExpense
-from utils import (allowed_file, record_device_history, generate_inventory_number, log_user_activity, 
-                   optimize_image, generate_thumbnails, convert_to_webp, cleanup_unused_photos)
+from models import Device, DevicePhoto, DeviceHistory, City, User, db, RepairExpense, PhotoFile
+from utils import allowed_file, generate_inventory_number, log_user_activity, get_cached_cities
+from search_service import apply_device_search
+from pagination import keyset_paginate, InvalidCursorError
+from excel_export import DeviceExcelExport, XLSX_MIMETYPE, export_filename
+from excel_import import DeviceExcelImport
+from device_history import track_device_history
+from qr_service import QR_DEVICE, QR_KINDS, QR_LABEL, qr_store, render_qr_sheet
+from image_pipeline import photo_pipeline, STATUS_PENDING
 
 devices_bp = Blueprint('devices', __name__)
 
+# Поля, за якими дозволено сортування списку пристроїв
+SORTABLE_DEVICE_FIELDS = ['name', 'type', 'serial_number', 'inventory_number', 'location', 'status', 'created_at', 'last_maintenance']
+
 # Rate limiting та кешування отримуються через current_app.extensions під час виконання
 
 @devices_bp.route('/devices')
@@ -43,36 +48,13 @@ def devices():
     price_from = request.args.get('price_from', '').strip()
     price_to = request.args.get('price_to', '').strip()
     
-    # Базовий запит з eager loading для city
-    # Кешуємо список міст (TTL 1 година)
-    cache_key = f'cities_{current_user.id if not current_user.is_admin else "all"}'
-    try:
-        cache_obj = current_app.extensions.get('cache')
-        # Перевіряємо, чи це об'єкт Cache (має метод set)
-        if cache_obj and hasattr(cache_obj, 'set'):
-            cities = cache_obj.get(cache_key)
-            if cities is None:
-                if current_user.is_admin:
-                    cities = City.query.all()
-                else:
-                    cities = [current_user.city]
-                cache_obj.set(cache_key, cities, timeout=3600)  # 1 година
-            else:
-                # Дані з кешу
-                pass
-        else:
-            # Кеш не доступний, отримуємо дані без кешування
-            if current_user.is_admin:
-                cities = City.query.all()
-            else:
-                cities = [current_user.city]
-    except (KeyError, AttributeError, TypeError):
-        # Якщо кеш не доступний, просто отримуємо дані без кешування
-        if current_user.is_admin:
-            cities = City.query.all()
-        else:
-            cities = [current_user.city]
+    # Список міст для фільтра: адміністратору - усі (зі спільного кешу), іншим - власне місто
+    if current_user.is_admin:
+        cities = get_cached_cities()
+    else:
+        cities = [current_user.city]
     
+    # Базовий запит з eager loading для city
     if current_user.is_admin:
         query = Device.query.options(joinedload(Device.city))
         if selected_city_id:
@@ -81,17 +63,9 @@ def devices():
         query = Device.query.options(joinedload(Device.city)).filter_by(city_id=current_user.city_id)
         selected_city_id = current_user.city_id
     
-    # Розширений пошук по всіх полях
+    # Розширений пошук по всіх полях (через пошуковий індекс)
     if search:
-        search_filter = or_(
-            Device.name.ilike(f'%{search}%'),
-            Device.type.ilike(f'%{search}%'),
-            Device.serial_number.ilike(f'%{search}%'),
-            Device.inventory_number.ilike(f'%{search}%'),
-            Device.location.ilike(f'%{search}%'),
-            Device.notes.ilike(f'%{search}%')
-        )
-        query = query.filter(search_filter)
+        query = apply_device_search(query, search)
     
     # Фільтр по типу пристрою
     if device_type:
@@ -132,23 +106,47 @@ def devices():
         except ValueError:
             pass
     
-    # Сортування
-    if sort_by in ['name', 'type', 'serial_number', 'inventory_number', 'location', 'status', 'created_at', 'last_maintenance']:
-        sort_column = getattr(Device, sort_by)
-        if sort_order == 'desc':
-            query = query.order_by(sort_column.desc())
-        else:
-            query = query.order_by(sort_column.asc())
-    else:
-        query = query.order_by(Device.created_at.desc())
+    # Keyset (cursor) пагінація: без OFFSET та COUNT(*) на кожній сторінці
+    cursor = request.args.get('cursor', '').strip()
+    cursor_mode = bool(cursor) or request.args.get('paging') == 'cursor'
     
-    # Застосовуємо пагінацію з оптимізацією
-    pagination = query.paginate(
-        page=page, 
-        per_page=min(per_page, 100),  # Максимум 100 записів на сторінку
-        error_out=False
-    )
-    devices = pagination.items
+    if cursor_mode:
+        if sort_by not in SORTABLE_DEVICE_FIELDS:
+            sort_by = 'created_at'
+            sort_order = 'desc'
+        try:
+            pagination = keyset_paginate(
+                query, Device, sort_by,
+                descending=sort_order == 'desc',
+                per_page=min(per_page, 100),
+                cursor=cursor or None
+            )
+        except InvalidCursorError:
+            # Курсор від іншого сортування (наприклад, після кліку по заголовку) - перша сторінка
+            pagination = keyset_paginate(
+                query, Device, sort_by,
+                descending=sort_order == 'desc',
+                per_page=min(per_page, 100)
+            )
+        devices = pagination.items
+    else:
+        # Сортування
+        if sort_by in SORTABLE_DEVICE_FIELDS:
+            sort_column = getattr(Device, sort_by)
+            if sort_order == 'desc':
+                query = query.order_by(sort_column.desc())
+            else:
+                query = query.order_by(sort_column.asc())
+        else:
+            query = query.order_by(Device.created_at.desc())
+        
+        # Застосовуємо пагінацію з оптимізацією
+        pagination = query.paginate(
+            page=page, 
+            per_page=min(per_page, 100),  # Максимум 100 записів на сторінку
+            error_out=False
+        )
+        devices = pagination.items
     
     # Отримуємо унікальні типи та статуси для фільтрів
     device_types = db.session.query(Device.type).distinct().filter(Device.type.isnot(None)).all()
@@ -159,6 +157,7 @@ def devices():
                           cities=cities,
                           selected_city_id=selected_city_id, 
                           pagination=pagination,
+                          cursor_mode=cursor_mode,
                           search=search,
                           device_type=device_type,
                           status=status,
@@ -249,47 +248,23 @@ def add_device():
         # Оновлюємо дату наступного обслуговування
         device.update_next_maintenance()
         
+        # Історія створення записується разом з комітом пристрою
+        track_device_history(current_user.id)
         db.session.add(device)
         db.session.flush()  # Отримуємо ID без коміту
         
-        # Записуємо історію створення
-        record_device_history(device.id, current_user.id, 'create')
-        
-        # Обробка файлів, якщо вони були завантажені
+        # Зберігаємо оригінали фото; варіанти створюються поза запитом (image_pipeline)
+        uploaded_photos = []
         if 'photos' in request.files:
-            photos = request.files.getlist('photos')
-            for photo in photos:
+            for photo in request.files.getlist('photos'):
                 if photo and allowed_file(photo.filename):
-                    # Генеруємо унікальне ім'я файлу
-                    filename = secure_filename(photo.filename)
-                    unique_filename = f"{uuid.uuid4()}_{filename}"
-                    
-                    # Зберігаємо файл
-                    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
-                    photo.save(file_path)
-                    
-                    # Оптимізуємо зображення
-                    optimized_path = optimize_image(file_path)
-                    if optimized_path and optimized_path != file_path:
-                        # Якщо файл було конвертовано (наприклад PNG->JPG)
-                        unique_filename = os.path.basename(optimized_path)
-                        file_path = optimized_path
-                    
-                    # Генеруємо thumbnail'и
-                    thumbnails = generate_thumbnails(file_path)
-                    
-                    # Створюємо WebP версію (якщо браузер підтримує)
-                    webp_path = convert_to_webp(file_path)
-                    
-                    # Створюємо запис у базі даних
-                    device_photo = DevicePhoto(
-                        filename=unique_filename,
-                        original_filename=filename,
-                        device_id=device.id
-                    )
-                    db.session.add(device_photo)
+                    uploaded_photos.append(_save_uploaded_photo(photo, device.id))
         
+        db.session.flush()
+        photo_jobs = [(device_photo.id, file_path) for device_photo, file_path in uploaded_photos]
         db.session.commit()
+        for photo_id, file_path in photo_jobs:
+            photo_pipeline.submit(photo_id, file_path)
         log_user_activity(current_user.id, f'Додано новий пристрій: {device.name}', request.remote_addr, request.url)
         flash('Пристрій успішно додано!')
         return redirect(url_for('devices.devices'))
@@ -332,81 +307,47 @@ def edit_device(device_id):
         abort(403)
     
     if request.method == 'POST':
+        # Зміни відстежуваних полів записуються в історію при коміті (device_history)
+        track_device_history(current_user.id)
+        
         # Визначаємо місто для пристрою
         if current_user.is_admin and request.form.get('city_id'):
-            new_city_id = request.form.get('city_id', type=int)
-            if device.city_id != new_city_id:
-                old_city = device.city.name if device.city else "Не вказано"
-                new_city = City.query.get(new_city_id).name
-                record_device_history(device.id, current_user.id, 'update', 'city', old_city, new_city)
-                device.city_id = new_city_id
+            device.city_id = request.form.get('city_id', type=int)
         
-        # Відстежуємо зміни основних полів
-        fields_to_track = {
-            'name': 'Назва',
-            'type': 'Тип',
-            'serial_number': 'Серійний номер',
-            'location': 'Розташування',
-            'status': 'Статус',
-            'notes': 'Примітки'
-        }
-        
-        for field, label in fields_to_track.items():
-            old_value = getattr(device, field)
+        # Основні поля
+        for field in ('name', 'type', 'serial_number', 'location', 'status', 'notes'):
             new_value = request.form[field]
-            if old_value != new_value:
-                record_device_history(device.id, current_user.id, 'update', label, old_value, new_value)
+            if getattr(device, field) != new_value:
                 setattr(device, field, new_value)
         
         # Обробляємо дані обслуговування
         last_maintenance = request.form.get('last_maintenance')
         if last_maintenance:
             try:
-                last_maintenance_date = datetime.strptime(last_maintenance, '%Y-%m-%d')
-                if device.last_maintenance != last_maintenance_date:
-                    old_value = device.last_maintenance.strftime('%Y-%m-%d') if device.last_maintenance else "Не вказано"
-                    record_device_history(device.id, current_user.id, 'update', 'Дата обслуговування', old_value, last_maintenance)
-                    device.last_maintenance = last_maintenance_date
+                device.last_maintenance = datetime.strptime(last_maintenance, '%Y-%m-%d').date()
             except ValueError:
                 pass  # Ігноруємо неправильний формат дати
         else:
-            if device.last_maintenance:
-                old_value = device.last_maintenance.strftime('%Y-%m-%d')
-                record_device_history(device.id, current_user.id, 'update', 'Дата обслуговування', old_value, "Не вказано")
-                device.last_maintenance = None
+            device.last_maintenance = None
         
         maintenance_interval = request.form.get('maintenance_interval', type=int)
-        if maintenance_interval and device.maintenance_interval != maintenance_interval:
-            old_value = str(device.maintenance_interval) if device.maintenance_interval else "365"
-            record_device_history(device.id, current_user.id, 'update', 'Інтервал обслуговування', old_value, str(maintenance_interval))
+        if maintenance_interval:
             device.maintenance_interval = maintenance_interval
         
         # Оновлюємо дату наступного обслуговування
         device.update_next_maintenance()
         
         # Обробляємо фінансові дані
-        purchase_price = request.form.get('purchase_price', type=float)
-        if purchase_price != device.purchase_price:
-            old_value = str(device.purchase_price) if device.purchase_price else "Не вказано"
-            record_device_history(device.id, current_user.id, 'update', 'Вартість покупки', old_value, str(purchase_price))
-            device.purchase_price = purchase_price
+        device.purchase_price = request.form.get('purchase_price', type=float)
         
         purchase_date_str = request.form.get('purchase_date', '')
         if purchase_date_str:
             try:
-                purchase_date = datetime.strptime(purchase_date_str, '%Y-%m-%d').date()
-                if purchase_date != device.purchase_date:
-                    old_value = device.purchase_date.strftime('%Y-%m-%d') if device.purchase_date else "Не вказано"
-                    record_device_history(device.id, current_user.id, 'update', 'Дата покупки', old_value, purchase_date_str)
-                    device.purchase_date = purchase_date
+                device.purchase_date = datetime.strptime(purchase_date_str, '%Y-%m-%d').date()
             except ValueError:
                 pass
         else:
-            if device.purchase_date:
-                old_value = device.purchase_date.strftime('%Y-%m-%d')
-                record_device_history(device.id, current_user.id, 'update', 'Дата покупки', old_value, "Не вказано")
-                device.purchase_date = None
-        
+            device.purchase_date = None
         
         db.session.commit()
         flash('Пристрій успішно оновлено!')
@@ -429,26 +370,43 @@ def delete_device(device_id):
     if not current_user.is_admin and device.city_id != current_user.city_id:
         abort(403)
     
-    # Видаляємо фотографії пристрою з файлової системи
-    for photo in device.photos:
-        try:
-            os.remove(os.path.join(current_app.config['UPLOAD_FOLDER'], photo.filename))
-        except:
-            # Якщо файл не знайдено, просто продовжуємо
-            pass
-    
-    # Записуємо історію видалення ПЕРЕД видаленням пристрою
-    record_device_history(device.id, current_user.id, 'delete', device=device)
+    # Історія видалення (знімок полів пристрою) записується в тій самій транзакції
+    track_device_history(current_user.id)
     
-    # Видаляємо пристрій (каскадне видалення також видалить записи фото)
+    # Видаляємо пристрій (каскадне видалення також видалить записи фото;
+    # файли фото з усіма варіантами видаляє photo_gc після коміту)
     db.session.delete(device)
     db.session.commit()
+    qr_store.discard(device_id)
     
     flash('Пристрій успішно видалено!')
     return redirect(url_for('devices.devices'))
 
 
 
+def _save_uploaded_photo(photo, device_id):
+    """
+    Зберігає оригінал завантаженого фото та додає запис DevicePhoto (status='pending')
+    
+    Returns:
+        tuple: (DevicePhoto, шлях до файлу)
+    """
+    filename = secure_filename(photo.filename)
+    unique_filename = f"{uuid.uuid4()}_{filename}"
+    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
+    photo.save(file_path)
+    
+    device_photo = DevicePhoto(
+        filename=unique_filename,
+        original_filename=filename,
+        device_id=device_id,
+        status=STATUS_PENDING
+    )
+    db.session.add(device_photo)
+    # Рядок маніфесту в тій самій транзакції - файл не вважатиметься сміттям
+    db.session.add(PhotoFile(filename=unique_filename, photo=device_photo, variant='original'))
+    return device_photo, file_path
+
 @devices_bp.route('/device/<int:device_id>/add_photo', methods=['POST'])
 @login_required
 def add_device_photo(device_id):
@@ -462,35 +420,12 @@ def add_device_photo(device_id):
     if 'photo' in request.files:
         photo = request.files['photo']
         if photo and allowed_file(photo.filename):
-            # Генеруємо унікальне ім'я файлу
-            filename = secure_filename(photo.filename)
-            unique_filename = f"{uuid.uuid4()}_{filename}"
-            
-            # Зберігаємо файл
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
-            photo.save(file_path)
-            
-            # Оптимізуємо зображення
-            optimized_path = optimize_image(file_path)
-            if optimized_path and optimized_path != file_path:
-                # Якщо файл було конвертовано
-                unique_filename = os.path.basename(optimized_path)
-                file_path = optimized_path
-            
-            # Генеруємо thumbnail'и
-            thumbnails = generate_thumbnails(file_path)
-            
-            # Створюємо WebP версію (якщо браузер підтримує)
-            webp_path = convert_to_webp(file_path)
-            
-            # Створюємо запис у базі даних
-            device_photo = DevicePhoto(
-                filename=unique_filename,
-                original_filename=filename,
-                device_id=device.id
-            )
-            db.session.add(device_photo)
+            device_photo, file_path = _save_uploaded_photo(photo, device.id)
+            db.session.flush()
+            photo_id = device_photo.id
             db.session.commit()
+            # Оптимізація, мініатюри та WebP - у пулі процесів, до готовності віддається оригінал
+            photo_pipeline.submit(photo_id, file_path)
             
             flash('Фото успішно додано!')
     
@@ -506,14 +441,7 @@ def delete_device_photo(photo_id):
     if not current_user.is_admin and device.city_id != current_user.city_id:
         abort(403)
     
-    # Видаляємо файл
-    try:
-        os.remove(os.path.join(current_app.config['UPLOAD_FOLDER'], photo.filename))
-    except:
-        # Якщо файл не знайдено, просто продовжуємо
-        pass
-    
-    # Видаляємо запис з бази даних
+    # Видаляємо запис з бази даних (файл і варіанти видаляє photo_gc після коміту)
     db.session.delete(photo)
     db.session.commit()
     
@@ -572,38 +500,50 @@ def delete_repair_expense(expense_id):
 @devices_bp.route('/uploads/<filename>')
 @login_required
 def uploaded_file(filename):
-    # Отримуємо фото, щоб перевірити права доступу
-    photo = DevicePhoto.query.filter_by(filename=filename).first_or_404()
-    device = photo.device
+    # Фото та місто пристрою одним запитом (без лінивого завантаження photo.device)
+    row = db.session.query(DevicePhoto, Device.city_id).join(
+        Device, Device.id == DevicePhoto.device_id
+    ).filter(DevicePhoto.filename == filename).first()
+    if row is None:
+        abort(404)
+    photo, city_id = row
     
     # Перевіряємо, чи має користувач доступ до цього пристрою
-    if not current_user.is_admin and device.city_id != current_user.city_id:
+    if not current_user.is_admin and city_id != current_user.city_id:
         abort(403)
     
-    # Перевіряємо чи потрібен thumbnail
+    # Варіант обирається за списком, збереженим після обробки, без перевірок на диску.
+    # Поки фото обробляється (або обробка не вдалась), варіантів немає - віддаємо оригінал
     size = request.args.get('size', 'original')
-    if size in ['thumb', 'medium', 'large']:
-        # Шукаємо thumbnail
-        base_name = os.path.splitext(filename)[0]
-        ext = os.path.splitext(filename)[1]
-        thumb_filename = f"{base_name}_{size}{ext}"
-        thumb_path = os.path.join(current_app.config['UPLOAD_FOLDER'], thumb_filename)
-        
-        if os.path.exists(thumb_path):
-            return send_from_directory(current_app.config['UPLOAD_FOLDER'], thumb_filename)
-    
-    # Перевіряємо чи браузер підтримує WebP
-    accept_header = request.headers.get('Accept', '')
-    if 'image/webp' in accept_header:
-        # Шукаємо WebP версію
-        base_name = os.path.splitext(filename)[0]
-        webp_filename = f"{base_name}.webp"
-        webp_path = os.path.join(current_app.config['UPLOAD_FOLDER'], webp_filename)
-        
-        if os.path.exists(webp_path):
-            return send_from_directory(current_app.config['UPLOAD_FOLDER'], webp_filename)
-        
-    return send_from_directory(current_app.config['UPLOAD_FOLDER'], filename)
+    if size in ('thumb', 'medium', 'large') and photo.has_variant(size):
+        variant = size
+    elif photo.has_variant('webp') and 'image/webp' in request.headers.get('Accept', ''):
+        variant = 'webp'
+    else:
+        variant = 'original'
+    served = filename if variant == 'original' else photo.variant_filename(variant)
+    etag = f'{photo.version}-{variant}'
+    
+    if etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+    elif current_app.config.get('PHOTO_ACCEL_REDIRECT'):
+        # Файл віддає проксі (nginx internal location), а не воркер Flask
+        response = current_app.response_class(mimetype=mimetypes.guess_type(served)[0])
+        response.headers['X-Accel-Redirect'] = current_app.config['PHOTO_ACCEL_REDIRECT'].rstrip('/') + '/' + served
+    else:
+        # USE_X_SENDFILE=True передає файл веб-серверу через X-Sendfile
+        response = send_from_directory(current_app.config['UPLOAD_FOLDER'], served, conditional=True, etag=False)
+    
+    response.set_etag(etag)
+    response.vary.add('Accept')
+    response.cache_control.private = True
+    if request.args.get('v') == photo.version:
+        # URL з версією змінюється разом зі станом фото - можна кешувати назавжди
+        response.cache_control.max_age = 31536000
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
 
 @devices_bp.route('/device/<int:device_id>/history')
 @login_required
@@ -614,22 +554,26 @@ def device_history(device_id):
     if not current_user.is_admin and device.city_id != current_user.city_id:
         abort(403)
     
-    history = DeviceHistory.query.filter_by(device_id=device_id).order_by(DeviceHistory.timestamp.desc()).all()
-    
-    # Налагоджувальна інформація
-    current_app.logger.info(f"Device ID: {device_id}, History count: {len(history)}")
-    for h in history:
-        current_app.logger.info(f"History: {h.action}, {h.field}, {h.timestamp}")
+    history = _device_history_entries(device_id)
     
     return render_template('device_history.html', device=device, history=history)
 
+def _device_history_entries(device_id):
+    """Історія пристрою з авторами змін (шаблон показує entry.user)"""
+    return (
+        DeviceHistory.query.options(joinedload(DeviceHistory.user))
+        .filter_by(device_id=device_id)
+        .order_by(DeviceHistory.timestamp.desc())
+        .all()
+    )
+
 @devices_bp.route('/history/<int:device_id>')
 @login_required
 def device_history_by_id(device_id):
     """Перегляд історії пристрою за ID (навіть якщо пристрій видалений)"""
     
     # Отримуємо історію для цього device_id
-    history = DeviceHistory.query.filter_by(device_id=device_id).order_by(DeviceHistory.timestamp.desc()).all()
+    history = _device_history_entries(device_id)
     
     if not history:
         abort(404)
@@ -652,7 +596,7 @@ def device_history_by_id(device_id):
             'serial_number': first_history.device_serial_number
         })()
     
-    return render_template('device_history.html', device=device, history=history, is_deleted=not Device.query.get(device_id))
+    return render_template('device_history.html', device=device, history=history, is_deleted=not isinstance(device, Device))
 
 @devices_bp.route('/device/<int:device_id>/qrcode')
 @login_required
@@ -663,39 +607,54 @@ def device_qrcode(device_id):
     if not current_user.is_admin and device.city_id != current_user.city_id:
         abort(403)
     
-    # Створюємо QR-код з інформацією про пристрій
-    qr_data = f"""
-    ID: {device.id}
-    Назва: {device.name}
-    Інв. номер: {device.inventory_number}
-    Тип: {device.type}
-    S/N: {device.serial_number}
-    Розташування: {device.location}
-    Статус: {device.status}
-    Місто: {device.city.name}
-    """
-    
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
+    # Готовий PNG зі сховища; ETag - хеш тексту QR-коду
+    kind = request.args.get('kind', QR_DEVICE)
+    if kind not in QR_KINDS:
+        abort(400)
+    path, version = qr_store.get(device, kind)
+    response = send_file(
+        path,
+        mimetype='image/png',
+        as_attachment=True,
+        download_name=f'qrcode_{device.inventory_number}.png',
+        etag=version,
+        conditional=True
     )
-    qr.add_data(qr_data)
-    qr.make(fit=True)
+    response.cache_control.private = True
+    if request.args.get('v') == version:
+        # URL з версією змінюється разом з вмістом - можна кешувати назавжди
+        response.cache_control.max_age = 31536000
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
 
-    img = qr.make_image(fill_color="black", back_color="white")
+@devices_bp.route('/devices/qrcode-sheet', methods=['GET', 'POST'])
+@login_required
+def device_qrcode_sheet():
+    """Аркуш QR-кодів вибраних пристроїв (PDF) однією відповіддю"""
+    device_ids = request.values.getlist('device_ids', type=int)
+    if not device_ids:
+        abort(400)
+    max_devices = current_app.config.get('QR_SHEET_MAX_DEVICES', 1000)
+    if len(device_ids) > max_devices:
+        abort(413)
+    
+    query = Device.query.options(joinedload(Device.city)).filter(Device.id.in_(device_ids))
+    if not current_user.is_admin:
+        query = query.filter(Device.city_id == current_user.city_id)
+    devices = query.order_by(Device.inventory_number).all()
+    if not devices:
+        abort(404)
     
-    # Зберігаємо QR-код у буфер пам'яті
-    img_buffer = io.BytesIO()
-    img.save(img_buffer)
-    img_buffer.seek(0)
+    labels = [(qr_store.get(device, QR_LABEL)[0], device.inventory_number) for device in devices]
+    log_user_activity(current_user.id, f'Аркуш QR-кодів для {len(devices)} пристроїв', request.remote_addr, request.url)
     
     return send_file(
-        img_buffer,
-        mimetype='image/png',
+        io.BytesIO(render_qr_sheet(labels)),
+        mimetype='application/pdf',
         as_attachment=True,
-        download_name=f'qrcode_{device.inventory_number}.png'
+        download_name='qr_codes.pdf'
     )
 
 @devices_bp.route('/device/<int:device_id>/print_qrcode')
@@ -741,70 +700,20 @@ def import_excel():
         
         if file and file.filename.endswith(('.xlsx', '.xls')):
             try:
-                # Читаємо Excel файл
-                workbook = openpyxl.load_workbook(file)
-                sheet = workbook.active
-                
-                imported_count = 0
-                errors = []
-                
                 # Визначаємо місто для пристроїв
                 if current_user.is_admin and request.form.get('city_id'):
                     city_id = request.form.get('city_id', type=int)
-                    city = City.query.get(city_id)
-                    city_prefix = city.name if city else ""
                 else:
                     city_id = current_user.city_id
-                    city_prefix = current_user.city.name if current_user.city else ""
                 
-                # Пропускаємо заголовок (перший рядок)
-                for row_num, row in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
-                    if not any(row):  # Пропускаємо порожні рядки
-                        continue
-                    
-                    try:
-                        name = str(row[0]) if row[0] else f"Пристрій {row_num}"
-                        device_type = str(row[1]) if row[1] else "Не вказано"
-                        serial_number = str(row[2]) if row[2] else ""
-                        location = str(row[3]) if row[3] else ""
-                        status = str(row[4]) if row[4] else "Активний"
-                        notes = str(row[5]) if row[5] else ""
-                        
-                        # Перевіряємо, чи існує пристрій з таким серійним номером
-                        if serial_number and Device.query.filter_by(serial_number=serial_number).first():
-                            errors.append(f"Рядок {row_num}: Пристрій з серійним номером {serial_number} вже існує")
-                            continue
-                        
-                        # Генеруємо унікальний інвентарний номер
-                        inventory_number = generate_inventory_number()
-                        
-                        device = Device(
-                            name=name,
-                            type=device_type,
-                            serial_number=serial_number,
-                            inventory_number=inventory_number,
-                            location=location,
-                            status=status,
-                            notes=notes,
-                            city_id=city_id
-                        )
-                        
-                        db.session.add(device)
-                        db.session.flush()  # Отримуємо ID без коміту
-                        
-                        # Записуємо історію створення
-                        record_device_history(device.id, current_user.id, 'create')
-                        
-                        imported_count += 1
-                        
-                    except Exception as e:
-                        errors.append(f"Рядок {row_num}: Помилка обробки - {str(e)}")
-                        continue
-                
-                db.session.commit()
+                # Пакетний імпорт: один запит на дублікати, блок інвентарних номерів, INSERT пакетами
+                excel_import = DeviceExcelImport(city_id, current_user.id)
+                imported_count = excel_import.run(file)
+                errors = excel_import.errors
                 
                 if imported_count > 0:
-                    flash(f'Успішно імпортовано {imported_count} пристрої(в)!', 'success')
+                    flash(f'Успішно імпортовано {imported_count} пристрої(в) '
+                          f'за {excel_import.duration:.1f} с ({excel_import.rows_per_second:.0f} рядків/с)!', 'success')
                     log_user_activity(current_user.id, f'Імпортовано {imported_count} пристроїв з Excel', request.remote_addr, request.url)
                 
                 if errors:
@@ -835,90 +744,23 @@ def import_excel():
 def export_excel():
     """Експорт пристроїв в Excel файл"""
     # Отримуємо пристрої відповідно до прав користувача
-    if current_user.is_admin:
-        devices = Device.query.all()
-    else:
-        devices = Device.query.filter_by(city_id=current_user.city_id).all()
-    
-    # Створюємо новий Excel файл
-    workbook = openpyxl.Workbook()
-    sheet = workbook.active
-    sheet.title = "Пристрої"
-    
-    # Заголовки стовпців
-    headers = [
-        'ID', 'Назва', 'Тип', 'Серійний номер', 'Інвентарний номер',
-        'Розташування', 'Статус', 'Місто', 'Дата створення', 'Примітки'
-    ]
-    
-    # Стилі для заголовків
-    header_font = Font(bold=True, color="FFFFFF")
-    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    header_alignment = Alignment(horizontal="center", vertical="center")
-    border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
-    
-    # Записуємо заголовки
-    for col, header in enumerate(headers, 1):
-        cell = sheet.cell(row=1, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-        cell.border = border
-    
-    # Записуємо дані пристроїв
-    for row, device in enumerate(devices, 2):
-        data = [
-            device.id,
-            device.name,
-            device.type,
-            device.serial_number,
-            device.inventory_number,
-            device.location,
-            device.status,
-            device.city.name if device.city else '',
-            device.created_at.strftime('%Y-%m-%d %H:%M') if device.created_at else '',
-            device.notes
-        ]
-        
-        for col, value in enumerate(data, 1):
-            cell = sheet.cell(row=row, column=col, value=value)
-            cell.border = border
-            cell.alignment = Alignment(vertical="center")
-    
-    # Автоматично підганяємо ширину стовпців
-    for column in sheet.columns:
-        max_length = 0
-        column_letter = column[0].column_letter
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)
-        sheet.column_dimensions[column_letter].width = adjusted_width
+    filters = [] if current_user.is_admin else [Device.city_id == current_user.city_id]
     
-    # Зберігаємо файл у буфер пам'яті
-    output = io.BytesIO()
-    workbook.save(output)
-    output.seek(0)
+    # Потоковий експорт: рядки читаються пакетами, файл віддається частинами
+    export = DeviceExcelExport(filters, sheet_title="Пристрої")
+    export.write_rows()
     
-    # Генеруємо ім'я файлу з поточною датою
-    filename = f'devices_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+    log_user_activity(current_user.id, f'Експортовано {export.row_count} пристроїв в Excel', request.remote_addr, request.url)
     
-    log_user_activity(current_user.id, f'Експортовано {len(devices)} пристроїв в Excel', request.remote_addr, request.url)
-    
-    return send_file(
-        output,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        as_attachment=True,
-        download_name=filename
-     )
+    return _xlsx_response(export, export_filename('devices_export'))
+
+def _xlsx_response(export, filename):
+    """Віддає XLSX експорт клієнту потоком"""
+    return Response(
+        export.iter_xlsx(),
+        mimetype=XLSX_MIMETYPE,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
 
 @devices_bp.route('/device/<int:device_id>/export_pdf')
 @login_required
@@ -932,12 +774,12 @@ def export_device_pdf(device_id):
     
     from utils_pdf import generate_device_pdf
     
-    pdf_buffer = generate_device_pdf(device)
+    pdf_file = generate_device_pdf(device)
     
     log_user_activity(current_user.id, f'Експорт PDF пристрою: {device.name}', request.remote_addr, request.url)
     
     return send_file(
-        pdf_buffer,
+        pdf_file,
         mimetype='application/pdf',
         as_attachment=True,
         download_name=f'device_{device.inventory_number}.pdf'
@@ -946,41 +788,75 @@ def export_device_pdf(device_id):
 @devices_bp.route('/devices/export_pdf', methods=['POST'])
 @login_required
 def export_devices_bulk_pdf():
-    """Масовий експорт пристроїв в PDF"""
+    """Масовий експорт пристроїв в PDF (реєстр або картка на сторінку)"""
     device_ids = request.form.getlist('device_ids', type=int)
+    mode = 'cards' if request.form.get('mode') == 'cards' else 'register'
     
     if not device_ids:
         flash('Не вибрано жодного пристрою для експорту!', 'warning')
         return redirect(url_for('devices.devices'))
     
     # Отримуємо пристрої відповідно до прав користувача
-    if current_user.is_admin:
-        devices = Device.query.filter(Device.id.in_(device_ids)).all()
-    else:
-        devices = Device.query.filter(
-            Device.id.in_(device_ids),
-            Device.city_id == current_user.city_id
-        ).all()
+    filters = [Device.id.in_(device_ids)]
+    if not current_user.is_admin:
+        filters.append(Device.city_id == current_user.city_id)
     
-    if not devices:
+    count = db.session.scalar(db.select(func.count(Device.id)).where(*filters))
+    if not count:
         flash('Не знайдено пристроїв для експорту!', 'error')
         return redirect(url_for('devices.devices'))
     
-    from utils_pdf import generate_bulk_devices_pdf
-    
-    pdf_buffer = generate_bulk_devices_pdf(devices)
+    pdf_file = _render_devices_pdf(filters, mode)
     
-    log_user_activity(current_user.id, f'Масовий експорт PDF: {len(devices)} пристроїв', request.remote_addr, request.url)
+    log_user_activity(current_user.id, f'Масовий експорт PDF: {count} пристроїв', request.remote_addr, request.url)
     
     filename = f'devices_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
     
     return send_file(
-        pdf_buffer,
+        pdf_file,
         mimetype='application/pdf',
         as_attachment=True,
         download_name=filename
     )
 
+@devices_bp.route('/devices/export_pdf/register')
+@login_required
+def export_register_pdf():
+    """Реєстр усього обладнання міста (адміністратор - усіх міст або city_id) в PDF"""
+    filters = []
+    if not current_user.is_admin:
+        filters.append(Device.city_id == current_user.city_id)
+    elif request.args.get('city_id', type=int):
+        filters.append(Device.city_id == request.args.get('city_id', type=int))
+    
+    pdf_file = _render_devices_pdf(filters, 'register')
+    
+    log_user_activity(current_user.id, 'Експорт реєстру обладнання в PDF', request.remote_addr, request.url)
+    
+    return send_file(
+        pdf_file,
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=f'devices_register_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
+    )
+
+def _render_devices_pdf(filters, mode):
+    """Будує PDF, читаючи пристрої потоково пакетами (без списку всіх об'єктів у пам'яті)"""
+    from utils_pdf import generate_bulk_devices_pdf
+    
+    query = (
+        db.select(Device)
+        .options(joinedload(Device.city))
+        .where(*filters)
+        .order_by(Device.inventory_number, Device.id)
+        .execution_options(yield_per=current_app.config['PDF_QUERY_BATCH_SIZE'])
+    )
+    result = db.session.scalars(query)
+    try:
+        return generate_bulk_devices_pdf(result, mode=mode)
+    finally:
+        result.close()
+
 @devices_bp.route('/qr-scanner')
 @login_required
 def qr_scanner():
@@ -1011,13 +887,12 @@ def bulk_update_status():
         flash('Пристрої не знайдено або у вас немає доступу', 'error')
         return redirect(url_for('devices.devices'))
     
-    # Оновлюємо статус та записуємо історію
+    # Оновлюємо статус; історія всіх змін вставляється одним пакетом з єдиним комітом
+    track_device_history(current_user.id)
     updated_count = 0
     for device in devices:
         if device.status != new_status:
-            old_status = device.status
             device.status = new_status
-            record_device_history(device.id, current_user.id, 'update', 'Статус', old_status, new_status)
             updated_count += 1
     
     db.session.commit()
@@ -1038,94 +913,21 @@ def bulk_export_excel():
         return redirect(url_for('devices.devices'))
     
     # Отримуємо пристрої
-    if current_user.is_admin:
-        devices = Device.query.filter(Device.id.in_(device_ids)).all()
-    else:
-        devices = Device.query.filter(
-            Device.id.in_(device_ids),
-            Device.city_id == current_user.city_id
-        ).all()
+    filters = [Device.id.in_(device_ids)]
+    if not current_user.is_admin:
+        filters.append(Device.city_id == current_user.city_id)
     
-    if not devices:
+    # Той самий потоковий експорт, що й export_excel
+    export = DeviceExcelExport(filters, sheet_title="Обрані пристрої")
+    export.write_rows()
+    
+    if not export.row_count:
         flash('Пристрої не знайдено', 'error')
         return redirect(url_for('devices.devices'))
     
-    # Створюємо Excel файл (використовуємо існуючу функцію)
-    workbook = openpyxl.Workbook()
-    sheet = workbook.active
-    sheet.title = "Обрані пристрої"
-    
-    # Заголовки
-    headers = ['ID', 'Назва', 'Тип', 'Серійний номер', 'Інвентарний номер',
-               'Розташування', 'Статус', 'Місто', 'Дата створення', 'Примітки']
-    
-    # Стилі
-    header_font = Font(bold=True, color="FFFFFF")
-    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    header_alignment = Alignment(horizontal="center", vertical="center")
-    border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
-    
-    # Записуємо заголовки
-    for col, header in enumerate(headers, 1):
-        cell = sheet.cell(row=1, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-        cell.border = border
-    
-    # Записуємо дані
-    for row, device in enumerate(devices, 2):
-        data = [
-            device.id,
-            device.name,
-            device.type,
-            device.serial_number,
-            device.inventory_number,
-            device.location,
-            device.status,
-            device.city.name if device.city else '',
-            device.created_at.strftime('%Y-%m-%d %H:%M') if device.created_at else '',
-            device.notes
-        ]
-        
-        for col, value in enumerate(data, 1):
-            cell = sheet.cell(row=row, column=col, value=value)
-            cell.border = border
-            cell.alignment = Alignment(vertical="center")
-    
-    # Автоматично підганяємо ширину
-    for column in sheet.columns:
-        max_length = 0
-        column_letter = column[0].column_letter
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)
-        sheet.column_dimensions[column_letter].width = adjusted_width
-    
-    # Зберігаємо в буфер
-    output = io.BytesIO()
-    workbook.save(output)
-    output.seek(0)
-    
-    filename = f'selected_devices_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+    log_user_activity(current_user.id, f'Масовий експорт Excel: {export.row_count} пристроїв', request.remote_addr, request.url)
     
-    log_user_activity(current_user.id, f'Масовий експорт Excel: {len(devices)} пристроїв', request.remote_addr, request.url)
-    
-    return send_file(
-        output,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        as_attachment=True,
-        download_name=filename
-    )
+    return _xlsx_response(export, export_filename('selected_devices'))
 
 @devices_bp.route('/devices/bulk_print_inventory', methods=['GET', 'POST'])
 @login_required
@@ -1138,30 +940,29 @@ def bulk_print_inventory():
             flash('Не вибрано жодного пристрою для друку!', 'warning')
             return redirect(url_for('devices.devices'))
         
-        # Отримуємо пристрої відповідно до прав користувача
-        if current_user.is_admin:
-            devices = Device.query.filter(Device.id.in_(device_ids)).all()
-        else:
-            devices = Device.query.filter(
-                Device.id.in_(device_ids),
-                Device.city_id == current_user.city_id
-            ).all()
+        # Отримуємо пристрої відповідно до прав користувача (шаблон показує device.city)
+        query = Device.query.options(joinedload(Device.city)).filter(Device.id.in_(device_ids))
+        if not current_user.is_admin:
+            query = query.filter(Device.city_id == current_user.city_id)
+        devices = query.all()
         
         if not devices:
             flash('Не знайдено пристроїв для друку!', 'error')
             return redirect(url_for('devices.devices'))
         
+        # Рендеримо до запису журналу: коміт журналу прострочив би завантажені пристрої
+        page = render_template('bulk_print_inventory.html', devices=devices)
         log_user_activity(current_user.id, f'Масовий друк {len(devices)} пристроїв', request.remote_addr, request.url)
         
-        return render_template('bulk_print_inventory.html', devices=devices)
+        return page
     
     # GET запит - показуємо сторінку вибору пристроїв
     # Отримуємо пристрої відповідно до прав користувача
     if current_user.is_admin:
-        devices = Device.query.all()
+        devices = Device.query.options(joinedload(Device.city)).all()
         cities = City.query.all()
     else:
-        devices = Device.query.filter_by(city_id=current_user.city_id).all()
+        devices = Device.query.options(joinedload(Device.city)).filter_by(city_id=current_user.city_id).all()
         cities = [current_user.city]
     
     return render_template('bulk_print_select.html', devices=devices, cities=cities)
@@ -0,0 +1,440 @@
+"""
+Спільний кеш застосунку з інвалідацією за тегами
+
+Два рівні:
+
+* спільне сховище для всіх процесів (worker'ів gunicorn) - Redis, якщо
+  задано CACHE_REDIS_URL, інакше SQLite файл CACHE_SQLITE_PATH;
+* локальний кеш у пам'яті процесу перед ним (CACHE_LOCAL_TTL секунд).
+
+Кожен запис кешу прив'язується до тегів ('cities', 'devices', ...). Для
+тегу в спільному сховищі зберігається номер версії, а запис запам'ятовує
+версії своїх тегів на момент збереження. app_cache.invalidate('cities')
+збільшує версію тегу - всі записи з цим тегом стають недійсними одразу
+в поточному процесі та не пізніше ніж через CACHE_LOCAL_TTL секунд в інших.
+
+Теги інвалідуються автоматично після коміту, в якому змінювались моделі
+з MODEL_TAGS (додавання/редагування міст, зміни пристроїв тощо):
+
+    cities = app_cache.get_or_set('cities:all', load_cities, timeout=3600, tags=('cities',))
+
+У тестах (app.testing) та з CACHE_BACKEND='memory' використовується лише
+кеш у пам'яті процесу.
+"""
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+
+from models import db, City, Device, DeviceCounter
+
+# Теги, які інвалідуються при зміні моделей
+MODEL_TAGS = {
+    City: ('cities',),
+    Device: ('devices',),
+    DeviceCounter: ('devices',),
+}
+
+_TAGS_KEY = 'app_cache_tags'
+_MISSING = object()
+
+
+class MemoryBackend:
+    """Кеш у пам'яті процесу з TTL та обмеженням кількості записів (LRU)"""
+
+    def __init__(self, max_size=1000):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        expires_at = time.monotonic() + timeout if timeout else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def get_versions(self, tags):
+        with self._lock:
+            return {tag: self._versions.get(tag, 0) for tag in tags}
+
+    def bump_version(self, tag):
+        with self._lock:
+            self._versions[tag] = self._versions.get(tag, 0) + 1
+            return self._versions[tag]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._versions.clear()
+
+
+class SQLiteBackend:
+    """Спільний для процесів кеш у файлі SQLite (WAL, з'єднання на потік)"""
+
+    PURGE_EVERY = 500
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache_entry '
+                '(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL)'
+            )
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache_tag_version '
+                '(tag TEXT PRIMARY KEY, version INTEGER NOT NULL)'
+            )
+
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        row = self._connect().execute(
+            'SELECT value, expires_at FROM cache_entry WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return None
+        return pickle.loads(row[0])
+
+    def set(self, key, value, timeout):
+        expires_at = time.time() + timeout if timeout else None
+        connection = self._connect()
+        connection.execute(
+            'INSERT OR REPLACE INTO cache_entry (key, value, expires_at) VALUES (?, ?, ?)',
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires_at)
+        )
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            connection.execute('DELETE FROM cache_entry WHERE expires_at <= ?', (time.time(),))
+
+    def delete(self, *keys):
+        self._connect().executemany('DELETE FROM cache_entry WHERE key = ?', [(key,) for key in keys])
+
+    def get_versions(self, tags):
+        tags = list(tags)
+        placeholders = ', '.join('?' for _ in tags)
+        rows = self._connect().execute(
+            f'SELECT tag, version FROM cache_tag_version WHERE tag IN ({placeholders})', tags
+        ).fetchall()
+        versions = dict.fromkeys(tags, 0)
+        versions.update(rows)
+        return versions
+
+    def bump_version(self, tag):
+        return self._connect().execute(
+            'INSERT INTO cache_tag_version (tag, version) VALUES (?, 1) '
+            'ON CONFLICT(tag) DO UPDATE SET version = version + 1 RETURNING version',
+            (tag,)
+        ).fetchone()[0]
+
+    def clear(self):
+        connection = self._connect()
+        connection.execute('DELETE FROM cache_entry')
+        connection.execute('DELETE FROM cache_tag_version')
+
+
+class RedisBackend:
+    """Спільний кеш у Redis (потрібен пакет redis)"""
+
+    def __init__(self, url, prefix='inventory:'):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, key, value, timeout):
+        self.client.set(self.prefix + key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), ex=timeout or None)
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*[self.prefix + key for key in keys])
+
+    def get_versions(self, tags):
+        tags = list(tags)
+        values = self.client.mget([f'{self.prefix}tag:{tag}' for tag in tags])
+        return {tag: int(value) if value is not None else 0 for tag, value in zip(tags, values)}
+
+    def bump_version(self, tag):
+        return self.client.incr(f'{self.prefix}tag:{tag}')
+
+    def clear(self):
+        keys = list(self.client.scan_iter(f'{self.prefix}*'))
+        if keys:
+            self.client.delete(*keys)
+
+
+class TieredCache:
+    """Локальний кеш процесу перед спільним сховищем, з версіями тегів"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._shared = None
+        self._local = None
+        self._tag_versions = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Реєструє кеш у додатку (app.extensions['app_cache'])"""
+        app.config.setdefault('CACHE_BACKEND', 'sqlite')
+        app.config.setdefault('CACHE_REDIS_URL', None)
+        if not app.config.get('CACHE_SQLITE_PATH'):
+            app.config['CACHE_SQLITE_PATH'] = os.path.join(app.instance_path, 'cache.sqlite')
+        app.config.setdefault('CACHE_DEFAULT_TIMEOUT', 300)
+        app.config.setdefault('CACHE_LOCAL_TTL', 5)
+        app.config.setdefault('CACHE_LOCAL_MAX_SIZE', 1000)
+
+        self.app = app
+        self._shared = None
+        self._local = None
+        app.extensions['app_cache'] = self
+
+    def _backends(self):
+        """Створює сховища при першому використанні (після налаштування конфігурації)"""
+        if self._local is None:
+            with self._lock:
+                if self._local is None:
+                    config = self.app.config
+                    self._shared = self._create_shared_backend(config)
+                    self._local = MemoryBackend(config['CACHE_LOCAL_MAX_SIZE'])
+        return self._shared, self._local
+
+    def _create_shared_backend(self, config):
+        """Спільне сховище за конфігурацією (None - лише пам'ять процесу)"""
+        backend = config['CACHE_BACKEND']
+        if self.app.testing or backend == 'memory':
+            return None
+        try:
+            if backend == 'redis' or config['CACHE_REDIS_URL']:
+                return RedisBackend(config['CACHE_REDIS_URL'])
+            return SQLiteBackend(config['CACHE_SQLITE_PATH'])
+        except Exception as e:
+            self.app.logger.warning(f"Спільний кеш недоступний ({backend}), використовується кеш процесу: {e}")
+            return None
+
+    def _shared_call(self, method, *args):
+        """Викликає метод спільного сховища; помилка сховища не ламає запит"""
+        shared, _ = self._backends()
+        if shared is None:
+            return None
+        try:
+            return getattr(shared, method)(*args)
+        except Exception as e:
+            self.errors += 1
+            self.app.logger.warning(f"Помилка спільного кешу ({method}): {e}")
+            return None
+
+    def _versions(self, tags):
+        """Поточні версії тегів (локально кешуються на CACHE_LOCAL_TTL секунд)"""
+        if not tags:
+            return ()
+        shared, local = self._backends()
+        if shared is None:
+            versions = local.get_versions(tags)
+            return tuple(versions[tag] for tag in tags)
+
+        now = time.monotonic()
+        with self._lock:
+            known = {tag: self._tag_versions.get(tag) for tag in tags}
+        missing = [tag for tag, item in known.items() if item is None or item[0] <= now]
+        if missing:
+            fetched = self._shared_call('get_versions', missing)
+            if fetched is None:
+                return None
+            expires_at = now + self.app.config['CACHE_LOCAL_TTL']
+            with self._lock:
+                for tag, version in fetched.items():
+                    self._tag_versions[tag] = (expires_at, version)
+                    known[tag] = (expires_at, version)
+        return tuple(known[tag][1] for tag in tags)
+
+    def get(self, key, tags=()):
+        """
+        Повертає значення з кешу
+
+        Args:
+            key: Ключ
+            tags: Теги, з якими значення було збережено
+
+        Returns:
+            Значення або None (немає в кеші / теги інвалідовано)
+        """
+        value = self._get(key, tuple(sorted(tags)))
+        return None if value is _MISSING else value
+
+    def _get(self, key, tags):
+        versions = self._versions(tags)
+        if versions is None:
+            self.misses += 1
+            return _MISSING
+
+        shared, local = self._backends()
+        entry = local.get(key)
+        if entry is None and shared is not None:
+            entry = self._shared_call('get', key)
+            if entry is not None and self.app.config['CACHE_LOCAL_TTL'] > 0:
+                local.set(key, entry, self.app.config['CACHE_LOCAL_TTL'])
+
+        if entry is None or entry[0] != versions:
+            self.misses += 1
+            return _MISSING
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value, timeout=None, tags=()):
+        """
+        Зберігає значення в кеші
+
+        Args:
+            key: Ключ
+            value: Значення (має серіалізуватися pickle - без ORM об'єктів)
+            timeout: Час життя в секундах (за замовчуванням CACHE_DEFAULT_TIMEOUT)
+            tags: Теги для інвалідації
+        """
+        tags = tuple(sorted(tags))
+        self._set(key, value, self._versions(tags), timeout)
+
+    def _set(self, key, value, versions, timeout):
+        """Зберігає значення під вказаними версіями тегів (None - спільне сховище недоступне)"""
+        if versions is None:
+            return
+        if timeout is None:
+            timeout = self.app.config['CACHE_DEFAULT_TIMEOUT']
+
+        entry = (versions, value)
+        shared, local = self._backends()
+        if shared is None:
+            local.set(key, entry, timeout)
+            return
+        self._shared_call('set', key, entry, timeout)
+        if self.app.config['CACHE_LOCAL_TTL'] > 0:
+            local.set(key, entry, min(timeout, self.app.config['CACHE_LOCAL_TTL']))
+
+    def get_or_set(self, key, factory, timeout=None, tags=()):
+        """Повертає значення з кешу або обчислює factory() і зберігає результат"""
+        tags = tuple(sorted(tags))
+        # Версії до обчислення: якщо під час factory() теги інвалідують,
+        # результат збережеться під старими версіями і не буде виданий
+        versions = self._versions(tags)
+        value = self._get(key, tags)
+        if value is _MISSING:
+            value = factory()
+            self._set(key, value, versions, timeout)
+        return value
+
+    def delete(self, *keys):
+        """Видаляє ключі з обох рівнів"""
+        _, local = self._backends()
+        local.delete(*keys)
+        self._shared_call('delete', *keys)
+
+    def invalidate(self, *tags):
+        """Робить недійсними всі записи з вказаними тегами"""
+        shared, local = self._backends()
+        for tag in tags:
+            if shared is None:
+                local.bump_version(tag)
+                continue
+            self._shared_call('bump_version', tag)
+            with self._lock:
+                self._tag_versions.pop(tag, None)
+
+    def clear(self):
+        """Очищає обидва рівні кешу"""
+        shared, local = self._backends()
+        local.clear()
+        with self._lock:
+            self._tag_versions.clear()
+        if shared is not None:
+            self._shared_call('clear')
+
+    def stats(self):
+        shared, _ = self._backends()
+        return {
+            'backend': type(shared).__name__ if shared is not None else 'MemoryBackend',
+            'hits': self.hits,
+            'misses': self.misses,
+            'errors': self.errors,
+        }
+
+
+app_cache = TieredCache()
+
+
+def _model_tags(model_class):
+    tags = set()
+    for model, model_tags in MODEL_TAGS.items():
+        if issubclass(model_class, model):
+            tags.update(model_tags)
+    return tags
+
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_tags_on_flush(session, flush_context):
+    tags = session.info.setdefault(_TAGS_KEY, set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        tags.update(_model_tags(type(obj)))
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _collect_tags_on_bulk(orm_execute_state):
+    """Масові insert/update/delete (імпорт з Excel, перебудова лічильників)"""
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None:
+        orm_execute_state.session.info.setdefault(_TAGS_KEY, set()).update(_model_tags(mapper.class_))
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_after_commit(session):
+    tags = session.info.pop(_TAGS_KEY, None)
+    if tags and app_cache.app is not None:
+        app_cache.invalidate(*sorted(tags))
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _reset_after_rollback(session):
+    session.info.pop(_TAGS_KEY, None)
@@ -0,0 +1,199 @@
+"""
+Матеріалізовані лічильники пристроїв (таблиця device_counters)
+
+Для кожної групи (місто, статус, тип, місяць додавання) зберігається
+кількість пристроїв. Лічильники оновлюються в тій самій транзакції, що й
+зміни пристроїв: подія after_flush рахує різницю для нових, змінених та
+видалених пристроїв і застосовує її одним upsert
+(INSERT ... ON CONFLICT DO UPDATE SET count = count + excluded.count).
+
+Масові вставки в обхід ORM (імпорт з Excel) застосовують різницю самі
+через apply_counter_deltas().
+
+Якщо лічильники розійшлися з даними (зміни напряму в базі, старі бази),
+їх можна перебудувати:
+
+    flask rebuild-device-counters
+"""
+
+from collections import Counter
+
+from sqlalchemy import delete, event, insert, inspect, select, update
+
+from models import db, Device, DeviceCounter, track_old_values
+
+# Атрибути пристрою, що визначають групу лічильника
+COUNTER_ATTRS = ('city_id', 'status', 'type', 'created_at')
+
+_DELETED_KEY = 'device_counters_deleted'
+
+
+def month_key(value):
+    """Місяць додавання пристрою у форматі YYYY-MM ('' якщо дата невідома)"""
+    return value.strftime('%Y-%m') if value else ''
+
+
+def counter_key(city_id, status, device_type, created_at):
+    """Ключ групи лічильника"""
+    return (city_id, status or '', device_type or '', month_key(created_at))
+
+
+def _device_key(device):
+    return counter_key(device.city_id, device.status, device.type, device.created_at)
+
+
+# Інакше для атрибутів, прострочених після коміту, група "до змін" збігалася б з новою
+track_old_values(Device, COUNTER_ATTRS)
+
+
+def _previous_key(device):
+    """Ключ групи пристрою до змін у поточному flush"""
+    state = inspect(device)
+    values = []
+    for attr in COUNTER_ATTRS:
+        history = state.attrs[attr].history
+        if history.deleted:
+            values.append(history.deleted[0])
+        elif history.unchanged:
+            values.append(history.unchanged[0])
+        else:
+            values.append(getattr(device, attr))
+    return counter_key(*values)
+
+
+def _upsert_statement(dialect):
+    """INSERT ... ON CONFLICT DO UPDATE для SQLite/PostgreSQL (None для інших баз)"""
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return None
+
+    statement = dialect_insert(DeviceCounter)
+    return statement.on_conflict_do_update(
+        index_elements=['city_id', 'status', 'type', 'month'],
+        set_={'count': DeviceCounter.__table__.c.count + statement.excluded.count}
+    )
+
+
+def apply_counter_deltas(connection, deltas):
+    """
+    Застосовує зміни лічильників у поточній транзакції
+
+    Args:
+        connection: З'єднання SQLAlchemy (транзакція змін пристроїв)
+        deltas: Counter {counter_key(...): зміна кількості}
+    """
+    rows = [
+        {'city_id': key[0], 'status': key[1], 'type': key[2], 'month': key[3], 'count': delta}
+        for key, delta in deltas.items() if delta
+    ]
+    if not rows:
+        return
+
+    statement = _upsert_statement(connection.dialect.name)
+    if statement is not None:
+        connection.execute(statement, rows)
+        return
+
+    # Інші бази: UPDATE, а для нових груп - INSERT
+    table = DeviceCounter.__table__
+    for row in rows:
+        result = connection.execute(
+            update(table)
+            .where(
+                table.c.city_id == row['city_id'],
+                table.c.status == row['status'],
+                table.c.type == row['type'],
+                table.c.month == row['month']
+            )
+            .values(count=table.c.count + row['count'])
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(table), row)
+
+
+def rebuild_device_counters(session=None):
+    """
+    Перераховує всі лічильники з таблиці device
+
+    Args:
+        session: Сесія SQLAlchemy (за замовчуванням db.session)
+
+    Returns:
+        int: Кількість груп
+    """
+    session = session or db.session
+    groups = Counter()
+    rows = session.execute(
+        select(Device.city_id, Device.status, Device.type, Device.created_at)
+        .execution_options(yield_per=1000)
+    )
+    for city_id, status, device_type, created_at in rows:
+        groups[counter_key(city_id, status, device_type, created_at)] += 1
+
+    session.execute(delete(DeviceCounter))
+    apply_counter_deltas(session.connection(), groups)
+    session.commit()
+    return len(groups)
+
+
+def counters_empty():
+    """Чи порожня таблиця лічильників при наявності пристроїв (стара база)"""
+    has_counters = db.session.execute(select(DeviceCounter.id).limit(1)).first() is not None
+    if has_counters:
+        return False
+    return db.session.execute(select(Device.id).limit(1)).first() is not None
+
+
+def ensure_device_counters():
+    """Заповнює лічильники, якщо таблиця порожня, а пристрої є (перший запит процесу)"""
+    if counters_empty():
+        return rebuild_device_counters()
+    return 0
+
+
+@event.listens_for(db.session, 'before_flush')
+def _remember_deleted_devices(session, flush_context, instances):
+    """
+    Запам'ятовує групи видалених пристроїв до flush
+
+    Після DELETE атрибути, що не були завантажені, вже не прочитати.
+    """
+    session.info[_DELETED_KEY] = [
+        _previous_key(device) for device in session.deleted if isinstance(device, Device)
+    ]
+
+
+@event.listens_for(db.session, 'after_flush')
+def _update_device_counters(session, flush_context):
+    """Рахує зміни груп для пристроїв з щойно виконаного flush"""
+    deltas = Counter()
+
+    for device in session.new:
+        if isinstance(device, Device):
+            deltas[_device_key(device)] += 1
+
+    for device in session.dirty:
+        if not isinstance(device, Device):
+            continue
+        old_key, new_key = _previous_key(device), _device_key(device)
+        if old_key != new_key:
+            deltas[old_key] -= 1
+            deltas[new_key] += 1
+
+    for key in session.info.pop(_DELETED_KEY, ()):
+        deltas[key] -= 1
+
+    if deltas:
+        apply_counter_deltas(session.connection(), deltas)
+
+
+def register_commands(app):
+    """Реєструє команду flask rebuild-device-counters"""
+    @app.cli.command('rebuild-device-counters')
+    def rebuild_device_counters_command():
+        """Перебудовує таблицю device_counters з таблиці device"""
+        groups = rebuild_device_counters()
+        print(f"Лічильники пристроїв перебудовано: {groups} груп")
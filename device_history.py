@@ -0,0 +1,165 @@
+"""
+Транзакційний запис історії змін пристроїв
+
+Історія формується автоматично при кожному flush сесії (подія after_flush):
+для нових, змінених та видалених пристроїв порівнюються відстежувані атрибути
+і записи DeviceHistory вставляються одним пакетним INSERT у тій самій
+транзакції, що й зміни пристроїв, тож комітяться (або відкочуються) разом
+з ними - окремих комітів на кожну зміну більше немає.
+
+Історія пишеться лише якщо для сесії вказано автора змін:
+
+    track_device_history(current_user.id)
+    device.status = 'На ремонті'
+    db.session.commit()
+"""
+
+from datetime import date, datetime
+
+from sqlalchemy import event, insert, inspect, select
+
+from models import db, Device, DeviceHistory, City, track_old_values
+
+# Відстежувані атрибути пристрою та їх назви в історії
+DEVICE_HISTORY_FIELDS = {
+    'name': 'Назва',
+    'type': 'Тип',
+    'serial_number': 'Серійний номер',
+    'location': 'Розташування',
+    'status': 'Статус',
+    'notes': 'Примітки',
+    'city_id': 'Місто',
+    'last_maintenance': 'Дата обслуговування',
+    'maintenance_interval': 'Інтервал обслуговування',
+    'purchase_price': 'Вартість покупки',
+    'purchase_date': 'Дата покупки',
+}
+
+EMPTY_VALUE = 'Не вказано'
+
+_USER_KEY = 'device_history_user_id'
+
+
+def track_device_history(user_id, session=None):
+    """
+    Вмикає запис історії змін пристроїв для поточної сесії
+
+    Args:
+        user_id: ID користувача - автора змін
+        session: Сесія SQLAlchemy (за замовчуванням db.session)
+    """
+    session = session or db.session
+    session.info[_USER_KEY] = user_id
+
+
+def _format_value(value):
+    """Перетворює значення атрибута в текст для історії"""
+    if value is None or value == '':
+        return EMPTY_VALUE
+    if isinstance(value, (date, datetime)):
+        return value.strftime('%Y-%m-%d')
+    return str(value)
+
+
+def _snapshot(device):
+    """Знімок ідентифікуючих полів пристрою (зберігається і після видалення)"""
+    return {
+        'device_name': device.name,
+        'device_inventory_number': device.inventory_number,
+        'device_type': device.type,
+        'device_serial_number': device.serial_number,
+    }
+
+
+# Інакше для атрибутів, прострочених після коміту, старе значення було б "Не вказано"
+track_old_values(Device, DEVICE_HISTORY_FIELDS)
+
+
+def _field_changes(device):
+    """
+    Повертає зміни відстежуваних атрибутів з моменту останнього flush
+
+    Returns:
+        list: (attr, old_value, new_value)
+    """
+    state = inspect(device)
+    changes = []
+    for attr in DEVICE_HISTORY_FIELDS:
+        history = state.attrs[attr].history
+        if not history.added and not history.deleted:
+            continue
+        old_value = history.deleted[0] if history.deleted else None
+        new_value = history.added[0] if history.added else None
+        if _format_value(old_value) == _format_value(new_value):
+            continue
+        changes.append((attr, old_value, new_value))
+    return changes
+
+
+def _city_names(session, city_ids):
+    """Назви міст одним запитом"""
+    if not city_ids:
+        return {}
+    return dict(session.execute(select(City.id, City.name).where(City.id.in_(city_ids))).all())
+
+
+@event.listens_for(db.session, 'after_flush')
+def _record_device_history(session, flush_context):
+    """
+    Вставляє записи DeviceHistory для змін пристроїв у щойно виконаному flush
+
+    after_flush ще бачить стан до flush (new/dirty/deleted та історію
+    атрибутів), але нові пристрої вже мають id. Записи вставляються одним
+    executemany через з'єднання поточної транзакції.
+    """
+    user_id = session.info.get(_USER_KEY)
+    if user_id is None:
+        return
+
+    rows = []
+
+    for device in session.new:
+        if isinstance(device, Device):
+            rows.append(dict(device_id=device.id, action='create', **_snapshot(device)))
+
+    updates = []
+    city_ids = set()
+    for device in session.dirty:
+        if not isinstance(device, Device):
+            continue
+        changes = _field_changes(device)
+        if changes:
+            updates.append((device, changes))
+            city_ids.update(
+                value for attr, old, new in changes if attr == 'city_id' for value in (old, new) if value
+            )
+
+    cities = _city_names(session, city_ids)
+    for device, changes in updates:
+        snapshot = _snapshot(device)
+        for attr, old_value, new_value in changes:
+            if attr == 'city_id':
+                old_value, new_value = cities.get(old_value), cities.get(new_value)
+            rows.append(dict(
+                device_id=device.id,
+                action='update',
+                field=DEVICE_HISTORY_FIELDS[attr],
+                old_value=_format_value(old_value),
+                new_value=_format_value(new_value),
+                **snapshot
+            ))
+
+    for device in session.deleted:
+        if isinstance(device, Device):
+            # Після видалення пристрою device_id в історії стає NULL, лишається знімок полів
+            rows.append(dict(device_id=None, action='delete', **_snapshot(device)))
+
+    if rows:
+        timestamp = datetime.utcnow()
+        for row in rows:
+            row.setdefault('field', None)
+            row.setdefault('old_value', None)
+            row.setdefault('new_value', None)
+            row['user_id'] = user_id
+            row['timestamp'] = timestamp
+        session.connection().execute(insert(DeviceHistory), rows)
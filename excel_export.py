@@ -0,0 +1,262 @@
+"""
+Потоковий експорт пристроїв в Excel (XLSX)
+
+Рядки читаються з бази пакетами по id (keyset) разом з назвою міста через
+JOIN, одразу серіалізуються в XML аркуша в тимчасовий файл (SpooledTemporaryFile)
+і в тому ж проході рахуються ширини стовпців. Після цього XLSX (ZIP) архів
+формується на льоту і віддається клієнту частинами - весь файл ніколи не
+тримається в пам'яті.
+
+openpyxl у write_only режимі не підходить: ширини стовпців (<cols>) мають
+бути записані до даних, а вони відомі лише після проходу по рядках.
+"""
+
+import re
+import tempfile
+import zipfile
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+from openpyxl.utils import get_column_letter
+
+from models import db, Device, City
+
+# Кількість рядків, що читаються з бази за один запит
+EXPORT_BATCH_SIZE = 1000
+
+# Розмір частини відповіді, що віддається клієнту
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Після цього розміру тимчасовий файл аркуша переноситься з пам'яті на диск
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+DEVICE_EXPORT_HEADERS = [
+    'ID', 'Назва', 'Тип', 'Серійний номер', 'Інвентарний номер',
+    'Розташування', 'Статус', 'Місто', 'Дата створення', 'Примітки'
+]
+
+# Символи, заборонені в XML 1.0
+_ILLEGAL_XML_CHARS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+# Індекси стилів у cellXfs (див. _STYLES_XML)
+_HEADER_STYLE = 1
+_CELL_STYLE = 2
+
+_CONTENT_TYPES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+
+_ROOT_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+_WORKBOOK_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '</Relationships>'
+)
+
+# Ті самі стилі, що й у попередньому експорті: заголовок - жирний білий на синьому,
+# усі клітинки - тонка рамка, вертикальне вирівнювання по центру
+_STYLES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="2">'
+    '<font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><color rgb="FFFFFFFF"/><sz val="11"/><name val="Calibri"/></font>'
+    '</fonts>'
+    '<fills count="3">'
+    '<fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill>'
+    '<fill><patternFill patternType="solid"><fgColor rgb="FF366092"/><bgColor rgb="FF366092"/></patternFill></fill>'
+    '</fills>'
+    '<borders count="2">'
+    '<border><left/><right/><top/><bottom/><diagonal/></border>'
+    '<border><left style="thin"/><right style="thin"/><top style="thin"/><bottom style="thin"/><diagonal/></border>'
+    '</borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="3">'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="1" fillId="2" borderId="1" xfId="0" applyFont="1" applyFill="1" applyBorder="1" applyAlignment="1">'
+    '<alignment horizontal="center" vertical="center"/></xf>'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="1" xfId="0" applyBorder="1" applyAlignment="1">'
+    '<alignment vertical="center"/></xf>'
+    '</cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+
+
+def _workbook_xml(sheet_title):
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        f'<sheets><sheet name="{escape(sheet_title, {chr(34): "&quot;"})}" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    )
+
+
+def _cell_xml(ref, value, style):
+    """Серіалізує одну клітинку (числа - як числа, решта - inline рядки)"""
+    if value is None or value == '':
+        return f'<c r="{ref}" s="{style}"/>'
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c r="{ref}" s="{style}"><v>{value}</v></c>'
+    text = escape(_ILLEGAL_XML_CHARS.sub('', str(value)))
+    return f'<c r="{ref}" s="{style}" t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+class _ChunkBuffer:
+    """Файлоподібний об'єкт без seek: zipfile пише в нього, генератор забирає байти"""
+
+    def __init__(self):
+        self._chunks = []
+        self._size = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def __len__(self):
+        return self._size
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        self._size = 0
+        return data
+
+
+def iter_device_export_rows(filters=(), batch_size=EXPORT_BATCH_SIZE):
+    """
+    Повертає рядки для експорту пакетами по id з назвою міста через JOIN
+
+    Args:
+        filters: SQLAlchemy умови для Device (місто користувача, вибрані id)
+        batch_size: Розмір пакета
+
+    Yields:
+        list: Значення рядка у порядку DEVICE_EXPORT_HEADERS
+    """
+    base_query = db.session.query(
+        Device.id, Device.name, Device.type, Device.serial_number, Device.inventory_number,
+        Device.location, Device.status, City.name, Device.created_at, Device.notes
+    ).outerjoin(City, Device.city_id == City.id).filter(*filters)
+
+    last_id = 0
+    while True:
+        batch = base_query.filter(Device.id > last_id).order_by(Device.id).limit(batch_size).all()
+        if not batch:
+            break
+        for row in batch:
+            values = list(row)
+            values[8] = values[8].strftime('%Y-%m-%d %H:%M') if values[8] else ''
+            yield values
+        last_id = batch[-1][0]
+
+
+class DeviceExcelExport:
+    """
+    Потоковий експорт пристроїв в XLSX
+
+    Використання:
+        export = DeviceExcelExport([Device.city_id == city_id], 'Пристрої')
+        export.write_rows()          # один прохід по базі
+        export.row_count             # кількість експортованих пристроїв
+        Response(export.iter_xlsx(), mimetype=XLSX_MIMETYPE)
+    """
+
+    def __init__(self, filters=(), sheet_title='Пристрої', headers=None, batch_size=EXPORT_BATCH_SIZE):
+        self.filters = filters
+        self.sheet_title = sheet_title
+        self.headers = headers or DEVICE_EXPORT_HEADERS
+        self.batch_size = batch_size
+        self.row_count = 0
+        self.column_widths = [len(str(header)) for header in self.headers]
+        self._sheet_data = None
+
+    def _write_row(self, row_idx, values, style):
+        cells = []
+        for col_idx, value in enumerate(values):
+            cells.append(_cell_xml(f'{get_column_letter(col_idx + 1)}{row_idx}', value, style))
+            length = len(str(value)) if value is not None else 0
+            if length > self.column_widths[col_idx]:
+                self.column_widths[col_idx] = length
+        self._sheet_data.write(f'<row r="{row_idx}">{"".join(cells)}</row>'.encode('utf-8'))
+
+    def write_rows(self):
+        """Читає пристрої з бази та серіалізує рядки аркуша, рахуючи ширини стовпців"""
+        self._sheet_data = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        self._write_row(1, self.headers, _HEADER_STYLE)
+        for values in iter_device_export_rows(self.filters, self.batch_size):
+            self.row_count += 1
+            self._write_row(self.row_count + 1, values, _CELL_STYLE)
+        return self.row_count
+
+    def _sheet_header_xml(self):
+        cols = ''.join(
+            f'<col min="{idx}" max="{idx}" width="{min(width + 2, 50)}" customWidth="1"/>'
+            for idx, width in enumerate(self.column_widths, 1)
+        )
+        last_ref = f'{get_column_letter(len(self.headers))}{self.row_count + 1}'
+        return (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+            f'<dimension ref="A1:{last_ref}"/>'
+            f'<cols>{cols}</cols>'
+            '<sheetData>'
+        )
+
+    def iter_xlsx(self):
+        """Генерує байти XLSX архіву частинами (для Response)"""
+        if self._sheet_data is None:
+            self.write_rows()
+
+        buffer = _ChunkBuffer()
+        try:
+            with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+                archive.writestr('[Content_Types].xml', _CONTENT_TYPES_XML)
+                archive.writestr('_rels/.rels', _ROOT_RELS_XML)
+                archive.writestr('xl/workbook.xml', _workbook_xml(self.sheet_title))
+                archive.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS_XML)
+                archive.writestr('xl/styles.xml', _STYLES_XML)
+                yield buffer.drain()
+
+                with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+                    sheet.write(self._sheet_header_xml().encode('utf-8'))
+                    self._sheet_data.seek(0)
+                    while True:
+                        chunk = self._sheet_data.read(STREAM_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        sheet.write(chunk)
+                        if len(buffer) >= STREAM_CHUNK_SIZE:
+                            yield buffer.drain()
+                    sheet.write(b'</sheetData></worksheet>')
+            yield buffer.drain()
+        finally:
+            self._sheet_data.close()
+
+
+def export_filename(prefix):
+    """Ім'я файлу експорту з поточною датою"""
+    return f'{prefix}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
@@ -0,0 +1,244 @@
+"""
+Пакетний імпорт пристроїв з Excel (XLSX)
+
+Аркуш читається в read_only режимі (рядки не тримаються в пам'яті як
+клітинки openpyxl), дублікати серійних номерів перевіряються одним
+set-based запитом замість запиту на кожен рядок, інвентарні номери
+резервуються одним блоком, а пристрої та записи історії вставляються
+пакетами (INSERT ... RETURNING). Весь імпорт виконується в одній транзакції:
+або імпортуються всі валідні рядки, або жоден.
+"""
+
+import time
+from collections import Counter
+from datetime import datetime
+
+import openpyxl
+from flask import current_app
+from sqlalchemy import insert
+
+from models import db, Device, DeviceHistory
+from utils import reserve_inventory_numbers
+from device_counters import apply_counter_deltas, counter_key
+
+# Кількість пристроїв, що вставляються за один INSERT
+IMPORT_CHUNK_SIZE = 500
+
+# Кількість серійних номерів в одному IN (...) при перевірці дублікатів
+SERIAL_LOOKUP_CHUNK_SIZE = 5000
+
+# Максимальні довжини текстових полів (див. модель Device)
+_MAX_LENGTHS = {
+    'name': 100,
+    'type': 50,
+    'serial_number': 100,
+    'location': 200,
+    'status': 50,
+}
+
+_FIELD_LABELS = {
+    'name': 'Назва',
+    'type': 'Тип',
+    'serial_number': 'Серійний номер',
+    'location': 'Розташування',
+    'status': 'Статус',
+}
+
+
+def _cell_text(value):
+    """Перетворює значення клітинки в рядок (цілі числа з Excel без '.0')"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+class DeviceExcelImport:
+    """
+    Пакетний імпорт пристроїв з Excel
+
+    Використання:
+        result = DeviceExcelImport(city_id, current_user.id)
+        result.run(file)
+        result.imported_count, result.errors, result.rows_per_second
+    """
+
+    def __init__(self, city_id, user_id, chunk_size=IMPORT_CHUNK_SIZE):
+        self.city_id = city_id
+        self.user_id = user_id
+        self.chunk_size = chunk_size
+        self.total_rows = 0
+        self.imported_count = 0
+        self.duration = 0.0
+        self._row_errors = []
+
+    @property
+    def errors(self):
+        """Помилки у порядку рядків аркуша"""
+        return [f"Рядок {row_num}: {message}" for row_num, message in sorted(self._row_errors, key=lambda e: e[0])]
+
+    @property
+    def rows_per_second(self):
+        """Швидкість обробки (усі непорожні рядки аркуша за секунду)"""
+        if not self.duration:
+            return 0.0
+        return self.total_rows / self.duration
+
+    def _error(self, row_num, message):
+        self._row_errors.append((row_num, message))
+
+    def _parse_row(self, row_num, row):
+        """
+        Перетворює рядок аркуша на словник полів пристрою
+
+        Returns:
+            dict або None, якщо рядок невалідний (помилка записується в errors)
+        """
+        row = tuple(row) + (None,) * (6 - len(row))
+
+        values = {
+            'name': _cell_text(row[0]) or f"Пристрій {row_num}",
+            'type': _cell_text(row[1]) or "Не вказано",
+            'serial_number': _cell_text(row[2]) or None,
+            'location': _cell_text(row[3]),
+            'status': _cell_text(row[4]) or "Активний",
+            'notes': _cell_text(row[5]),
+        }
+
+        for field, max_length in _MAX_LENGTHS.items():
+            value = values[field]
+            if value and len(value) > max_length:
+                self._error(row_num, f"Поле '{_FIELD_LABELS[field]}' довше за {max_length} символів")
+                return None
+
+        return values
+
+    def _read_rows(self, file):
+        """
+        Читає аркуш у read_only режимі та відкидає рядки з помилками
+
+        Returns:
+            list: (row_num, values) валідних рядків
+        """
+        workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+        try:
+            sheet = workbook.active
+            rows = []
+            seen_serials = {}
+
+            # Пропускаємо заголовок (перший рядок)
+            for row_num, row in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
+                if not any(cell not in (None, '') for cell in row):  # Пропускаємо порожні рядки
+                    continue
+                self.total_rows += 1
+
+                values = self._parse_row(row_num, row)
+                if values is None:
+                    continue
+
+                serial_number = values['serial_number']
+                if serial_number:
+                    if serial_number in seen_serials:
+                        self._error(
+                            row_num,
+                            f"Серійний номер {serial_number} повторюється (рядок {seen_serials[serial_number]})"
+                        )
+                        continue
+                    seen_serials[serial_number] = row_num
+
+                rows.append((row_num, values))
+            return rows
+        finally:
+            workbook.close()
+
+    def _existing_serials(self, serial_numbers):
+        """Повертає серійні номери, що вже є в базі (пакетами по SERIAL_LOOKUP_CHUNK_SIZE)"""
+        existing = set()
+        serial_numbers = list(serial_numbers)
+        for start in range(0, len(serial_numbers), SERIAL_LOOKUP_CHUNK_SIZE):
+            chunk = serial_numbers[start:start + SERIAL_LOOKUP_CHUNK_SIZE]
+            existing.update(
+                serial for (serial,) in
+                db.session.query(Device.serial_number).filter(Device.serial_number.in_(chunk))
+            )
+        return existing
+
+    def _insert_chunk(self, chunk):
+        """Вставляє пакет пристроїв, записи історії їх створення та оновлює лічильники"""
+        timestamp = datetime.utcnow()
+        result = db.session.execute(
+            insert(Device).returning(Device.id, sort_by_parameter_order=True),
+            [dict(values, created_at=timestamp) for _, values in chunk]
+        )
+        device_ids = result.scalars().all()
+
+        # Масовий INSERT не проходить через flush - лічильники оновлюються тут
+        apply_counter_deltas(db.session.connection(), Counter(
+            counter_key(values['city_id'], values['status'], values['type'], timestamp)
+            for _, values in chunk
+        ))
+
+        db.session.execute(insert(DeviceHistory), [
+            {
+                'device_id': device_id,
+                'user_id': self.user_id,
+                'action': 'create',
+                'timestamp': timestamp,
+                'device_name': values['name'],
+                'device_inventory_number': values['inventory_number'],
+                'device_type': values['type'],
+                'device_serial_number': values['serial_number'],
+            }
+            for device_id, (_, values) in zip(device_ids, chunk)
+        ])
+
+    def run(self, file):
+        """
+        Виконує імпорт
+
+        Args:
+            file: Файл або файлоподібний об'єкт XLSX
+
+        Returns:
+            int: Кількість імпортованих пристроїв
+
+        Raises:
+            Exception: Помилка читання файлу або запису в базу (транзакція відкочується)
+        """
+        started = time.perf_counter()
+        try:
+            rows = self._read_rows(file)
+
+            existing = self._existing_serials(
+                values['serial_number'] for _, values in rows if values['serial_number']
+            )
+            valid_rows = []
+            for row_num, values in rows:
+                if values['serial_number'] in existing:
+                    self._error(row_num, f"Пристрій з серійним номером {values['serial_number']} вже існує")
+                    continue
+                valid_rows.append((row_num, values))
+
+            if valid_rows:
+                inventory_numbers = reserve_inventory_numbers(len(valid_rows))
+                for (_, values), inventory_number in zip(valid_rows, inventory_numbers):
+                    values['inventory_number'] = inventory_number
+                    values['city_id'] = self.city_id
+
+                for start in range(0, len(valid_rows), self.chunk_size):
+                    self._insert_chunk(valid_rows[start:start + self.chunk_size])
+
+                db.session.commit()
+                self.imported_count = len(valid_rows)
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            self.duration = time.perf_counter() - started
+
+        current_app.logger.info(
+            f"Імпорт Excel: {self.imported_count} з {self.total_rows} рядків, "
+            f"помилок {len(self._row_errors)}, {self.duration:.2f} с ({self.rows_per_second:.0f} рядків/с)"
+        )
+        return self.imported_count
@@ -0,0 +1,129 @@
+"""
+Фінансові звіти по парку обладнання
+
+Поточна (залишкова) вартість, витрати на ремонт і загальна вартість
+рахуються в базі: Device.current_value / total_repair_expenses / total_cost
+мають SQL-вирази (hybrid_property в models.py), а суми ремонтів
+агрегуються одним підзапитом SUM ... GROUP BY device_id, який
+приєднується до device. Жоден рядок RepairExpense не завантажується в
+Python, а звіт будь-якого розміру - один запит.
+"""
+
+from datetime import date
+
+from sqlalchemy import func, select
+
+from models import db, City, Device, RepairExpense
+
+
+def repair_totals_subquery():
+    """
+    Підзапит сум ремонтів по пристроях
+
+    Returns:
+        Subquery: колонки device_id, repair_total, repair_count
+    """
+    return (
+        select(
+            RepairExpense.device_id,
+            func.sum(RepairExpense.amount).label('repair_total'),
+            func.count(RepairExpense.id).label('repair_count'),
+        )
+        .group_by(RepairExpense.device_id)
+        .subquery('repair_totals')
+    )
+
+
+def _money(value):
+    return round(float(value or 0), 2)
+
+
+def device_costs(device_ids):
+    """
+    Фінансові показники для списку пристроїв одним запитом
+
+    Args:
+        device_ids: ID пристроїв
+
+    Returns:
+        dict: device_id -> {current_value, repair_total, total_cost}
+    """
+    if not device_ids:
+        return {}
+    repairs = repair_totals_subquery()
+    repair_total = func.coalesce(repairs.c.repair_total, 0)
+    rows = db.session.execute(
+        select(
+            Device.id,
+            Device.current_value,
+            repair_total.label('repair_total'),
+            (func.coalesce(Device.purchase_price, 0) + repair_total).label('total_cost'),
+        )
+        .outerjoin(repairs, repairs.c.device_id == Device.id)
+        .where(Device.id.in_(device_ids))
+    )
+    return {
+        row.id: {
+            'current_value': None if row.current_value is None else _money(row.current_value),
+            'repair_total': _money(row.repair_total),
+            'total_cost': _money(row.total_cost),
+        }
+        for row in rows
+    }
+
+
+def fleet_summary(city_id=None):
+    """
+    Балансова вартість і витрати на ремонт по містах і типах (один запит)
+
+    Args:
+        city_id: Обмежити одним містом (None - усі міста)
+
+    Returns:
+        dict: groups (місто, тип, кількість, сума покупки, залишкова вартість,
+              витрати на ремонт, загальна вартість), totals, as_of
+    """
+    repairs = repair_totals_subquery()
+    repair_total = func.coalesce(repairs.c.repair_total, 0)
+    purchase = func.coalesce(Device.purchase_price, 0)
+
+    query = (
+        select(
+            City.id.label('city_id'),
+            City.name.label('city_name'),
+            Device.type,
+            func.count(Device.id).label('devices'),
+            func.sum(purchase).label('purchase_total'),
+            func.sum(func.coalesce(Device.current_value, 0)).label('book_value'),
+            func.sum(repair_total).label('repair_total'),
+            func.sum(func.coalesce(repairs.c.repair_count, 0)).label('repair_count'),
+            func.sum(purchase + repair_total).label('total_cost'),
+        )
+        .select_from(Device)
+        .join(City, City.id == Device.city_id)
+        .outerjoin(repairs, repairs.c.device_id == Device.id)
+        .group_by(City.id, City.name, Device.type)
+        .order_by(City.name, Device.type)
+    )
+    if city_id is not None:
+        query = query.where(Device.city_id == city_id)
+
+    money_fields = ('purchase_total', 'book_value', 'repair_total', 'total_cost')
+    groups = []
+    totals = dict.fromkeys(money_fields, 0.0)
+    totals.update(devices=0, repair_count=0)
+    for row in db.session.execute(query):
+        group = {
+            'city_id': row.city_id,
+            'city_name': row.city_name,
+            'type': row.type,
+            'devices': row.devices,
+            'repair_count': int(row.repair_count or 0),
+        }
+        group.update((field, _money(getattr(row, field))) for field in money_fields)
+        groups.append(group)
+        for field in money_fields + ('devices', 'repair_count'):
+            totals[field] += group[field]
+
+    totals.update((field, round(totals[field], 2)) for field in money_fields)
+    return {'as_of': date.today().isoformat(), 'groups': groups, 'totals': totals}
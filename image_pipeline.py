@@ -0,0 +1,336 @@
+"""
+Обробка завантажених фото пристроїв поза запитом
+
+Запит лише зберігає оригінал і створює DevicePhoto зі статусом 'pending'.
+Після коміту фото передається в пул процесів (PHOTO_PROCESS_WORKERS), де
+зображення декодується один раз, а з нього в пам'яті будуються всі
+варіанти: оптимізований JPEG, мініатюри thumb/medium/large та WebP. Після
+обробки запис отримує статус 'ready' і список створених варіантів.
+
+Поки фото не оброблене, uploaded_file() віддає оригінал. Тому файли
+пишуться через тимчасовий файл і os.replace, а оригінал PNG/GIF
+видаляється лише після коміту нового імені (через маніфест photo_gc) -
+запит під час обробки не отримає ні обрізаного файлу, ні 404.
+Версіонований URL фото (кешується браузером назавжди) повертає
+photo_url(photo, size) у шаблонах.
+
+У тестах, з PHOTO_PROCESSING_ASYNC=False або коли в черзі вже
+PHOTO_QUEUE_MAX фото, обробка виконується одразу в поточному процесі.
+"""
+
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from PIL import Image
+
+# Розміри мініатюр (ширина, висота, суфікс)
+THUMBNAIL_SIZES = (
+    (150, 150, 'thumb'),
+    (300, 300, 'medium'),
+    (800, 800, 'large'),
+)
+
+STATUS_PENDING = 'pending'
+STATUS_READY = 'ready'
+STATUS_FAILED = 'failed'
+
+
+def _to_rgb(img):
+    """Переводить зображення в RGB (прозорість - на білому тлі)"""
+    if img.mode in ('RGBA', 'LA', 'P'):
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+        return background
+    if img.mode != 'RGB':
+        return img.convert('RGB')
+    return img
+
+
+def _save_replace(img, path, format, **params):
+    """
+    Зберігає зображення у тимчасовий файл поруч і атомарно підміняє path
+
+    Файл, який у цей час віддається (оригінал JPEG поки фото в обробці),
+    читачі бачать або старим, або новим - ніколи обрізаним.
+    """
+    directory, name = os.path.split(path)
+    tmp_path = os.path.join(directory, f'.{name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    try:
+        with open(tmp_path, 'xb') as f:
+            img.save(f, format, **params)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def process_image(image_path, max_size=1920, quality=85, webp_quality=85, sizes=THUMBNAIL_SIZES):
+    """
+    Декодує зображення один раз і зберігає всі варіанти
+
+    Виконується в процесі пулу, тому не використовує Flask чи базу даних.
+
+    Args:
+        image_path: Шлях до оригіналу
+        max_size: Максимальна сторона оптимізованого зображення (px)
+        quality: Якість JPEG
+        webp_quality: Якість WebP
+        sizes: Розміри мініатюр
+
+    Returns:
+        dict: filename (ім'я оптимізованого файлу) та variants (список суфіксів + 'webp')
+    """
+    base_path, ext = os.path.splitext(image_path)
+    ext = ext.lower()
+    # PNG/GIF зберігаються як JPEG для економії місця
+    output_path = image_path if ext in ('.jpg', '.jpeg') else base_path + '.jpg'
+    output_ext = os.path.splitext(output_path)[1]
+
+    with Image.open(image_path) as source:
+        source.load()
+        img = _to_rgb(source)
+        img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+
+    # Оригінал PNG/GIF не видаляється тут: запис у базі ще вказує на нього,
+    # його звільняє _mark_ready після коміту нового імені
+    _save_replace(img, output_path, 'JPEG', quality=quality, optimize=True)
+
+    variants = []
+    for width, height, suffix in sizes:
+        thumb = img.copy()
+        thumb.thumbnail((width, height), Image.Resampling.LANCZOS)
+        _save_replace(thumb, f'{base_path}_{suffix}{output_ext}', 'JPEG', quality=quality, optimize=True)
+        variants.append(suffix)
+
+    _save_replace(img, base_path + '.webp', 'WEBP', quality=webp_quality, method=6)
+    variants.append('webp')
+
+    return {'filename': os.path.basename(output_path), 'variants': variants}
+
+
+class PhotoPipeline:
+    """Черга обробки фото на обмеженому пулі процесів"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._executor = None
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._atexit_registered = False
+        self.processed = 0
+        self.failed = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Реєструє конвеєр у додатку (app.extensions['photo_pipeline'])"""
+        app.config.setdefault('PHOTO_PROCESSING_ASYNC', True)
+        app.config.setdefault('PHOTO_PROCESS_WORKERS', 2)
+        app.config.setdefault('PHOTO_QUEUE_MAX', 100)
+        app.config.setdefault('PHOTO_MAX_SIZE', 1920)
+        app.config.setdefault('PHOTO_JPEG_QUALITY', 85)
+
+        app.config.setdefault('PHOTO_ACCEL_REDIRECT', None)
+
+        self.app = app
+        app.extensions['photo_pipeline'] = self
+        app.add_template_global(self.url_for_photo, 'photo_url')
+
+    def url_for_photo(self, photo, size=None):
+        """Версіонований URL фото (v змінюється після обробки)"""
+        from flask import url_for
+        return url_for('devices.uploaded_file', filename=photo.filename, size=size, v=photo.version)
+
+    @property
+    def async_enabled(self):
+        return bool(self.app.config.get('PHOTO_PROCESSING_ASYNC')) and not self.app.testing
+
+    def _job_kwargs(self):
+        config = self.app.config
+        return {
+            'max_size': config['PHOTO_MAX_SIZE'],
+            'quality': config['PHOTO_JPEG_QUALITY'],
+            'webp_quality': config['PHOTO_JPEG_QUALITY'],
+        }
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn: дочірні процеси не успадковують потоки та з'єднання з базою
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.app.config['PHOTO_PROCESS_WORKERS'],
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                if not self._atexit_registered:
+                    atexit.register(self.shutdown)
+                    self._atexit_registered = True
+            return self._executor
+
+    def submit(self, photo_id, image_path):
+        """
+        Ставить фото в чергу обробки (викликати після коміту DevicePhoto)
+
+        Args:
+            photo_id: ID запису DevicePhoto
+            image_path: Шлях до збереженого оригіналу
+        """
+        if self.async_enabled:
+            with self._lock:
+                queue_full = self._inflight >= self.app.config['PHOTO_QUEUE_MAX']
+                if not queue_full:
+                    self._inflight += 1
+            if not queue_full:
+                try:
+                    future = self._get_executor().submit(process_image, image_path, **self._job_kwargs())
+                except Exception as e:
+                    with self._lock:
+                        self._inflight -= 1
+                    self.app.logger.warning(f"Пул обробки фото недоступний, обробка в запиті: {e}")
+                else:
+                    future.add_done_callback(lambda f: self._on_done(photo_id, image_path, f))
+                    return
+
+        # Синхронна обробка (тести, вимкнений пул або переповнена черга)
+        try:
+            result = process_image(image_path, **self._job_kwargs())
+        except Exception as e:
+            self._mark_failed(photo_id, image_path, e)
+        else:
+            self._mark_ready(photo_id, image_path, result)
+
+    def _on_done(self, photo_id, image_path, future):
+        with self._lock:
+            self._inflight -= 1
+        error = future.exception()
+        if error is not None:
+            self._mark_failed(photo_id, image_path, error)
+        else:
+            self._mark_ready(photo_id, image_path, future.result())
+
+    def _update_photo(self, photo_id, files=None, released=(), only_pending=False, **values):
+        """Оновлює DevicePhoto у власному контексті додатку (колбек пулу - інший потік)"""
+        from models import db, DevicePhoto
+        from photo_gc import track_photo_files
+        from sqlalchemy import update
+
+        statement = update(DevicePhoto).where(DevicePhoto.id == photo_id)
+        if only_pending:
+            statement = statement.where(DevicePhoto.status == STATUS_PENDING)
+        with self.app.app_context():
+            try:
+                result = db.session.execute(statement.values(**values))
+                if files is not None:
+                    # Фото могли видалити під час обробки - тоді нові файли одразу є сміттям
+                    track_photo_files(db.session, photo_id if result.rowcount else None, files, released)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.error(f"Помилка оновлення статусу фото {photo_id}: {e}")
+            finally:
+                db.session.remove()
+
+    def _mark_ready(self, photo_id, image_path, result):
+        from photo_gc import photo_files
+
+        self.processed += 1
+        original = os.path.basename(image_path)
+        self._update_photo(
+            photo_id,
+            files=photo_files(result['filename'], result['variants']),
+            # Оригінал PNG/GIF видаляється з диска лише після коміту нового імені
+            released=[original] if original != result['filename'] else [],
+            filename=result['filename'],
+            variants=','.join(result['variants']),
+            status=STATUS_READY,
+            processed_at=datetime.utcnow()
+        )
+
+    def _mark_failed(self, photo_id, image_path, error):
+        self.failed += 1
+        self.app.logger.error(f"Помилка обробки фото {image_path}: {error}")
+        # Після перезапуску кілька процесів можуть обробляти одне фото: помилка
+        # одного (оригінал PNG вже видалено) не скасовує успіх іншого
+        self._update_photo(photo_id, only_pending=True, status=STATUS_FAILED, processed_at=datetime.utcnow())
+
+    def requeue_pending(self):
+        """
+        Повторно ставить у чергу фото, що лишились у статусі 'pending' (перезапуск процесу)
+
+        Викликається з першим запитом кожного процесу (app.run_startup_tasks).
+
+        Returns:
+            int: Кількість фото
+        """
+        from models import DevicePhoto
+
+        upload_folder = self.app.config['UPLOAD_FOLDER']
+        with self.app.app_context():
+            pending = [
+                (photo.id, os.path.join(upload_folder, photo.filename))
+                for photo in DevicePhoto.query.filter_by(status=STATUS_PENDING)
+            ]
+        for photo_id, path in pending:
+            self.submit(photo_id, path)
+        return len(pending)
+
+    def sync_variants(self):
+        """
+        Звіряє список варіантів готових фото з файлами на диску
+
+        uploaded_file() не перевіряє файли під час запиту, тож після ручного
+        видалення/копіювання файлів список варіантів слід оновити.
+
+        Returns:
+            int: Кількість оновлених записів
+        """
+        from models import db, DevicePhoto
+
+        upload_folder = self.app.config['UPLOAD_FOLDER']
+        suffixes = [suffix for _, _, suffix in THUMBNAIL_SIZES] + ['webp']
+        updated = 0
+        with self.app.app_context():
+            try:
+                for photo in DevicePhoto.query.filter_by(status=STATUS_READY):
+                    variants = ','.join(
+                        suffix for suffix in suffixes
+                        if os.path.exists(os.path.join(upload_folder, photo.variant_filename(suffix)))
+                    )
+                    if variants != (photo.variants or ''):
+                        photo.variants = variants
+                        updated += 1
+                db.session.commit()
+            finally:
+                db.session.remove()
+        return updated
+
+    def register_commands(self, app):
+        """Реєструє команду flask sync-photo-variants"""
+        @app.cli.command('sync-photo-variants')
+        def sync_photo_variants_command():
+            """Оновлює список варіантів фото за файлами в UPLOAD_FOLDER"""
+            updated = self.sync_variants()
+            print(f"Варіанти фото оновлено: {updated} записів")
+
+    def shutdown(self, wait=True):
+        """Зупиняє пул процесів (дочікується поточних завдань)"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    def stats(self):
+        with self._lock:
+            inflight = self._inflight
+        return {'inflight': inflight, 'processed': self.processed, 'failed': self.failed}
+
+
+photo_pipeline = PhotoPipeline()
@@ -0,0 +1,305 @@
+"""
+Метрики застосунку у форматі Prometheus (/metrics)
+
+Збираються в пам'яті процесу:
+
+* тривалість HTTP-запитів - гістограма по endpoint'у та методу, лічильник
+  запитів по статусу;
+* час у базі та кількість SQL-запитів на HTTP-запит - з лічильника
+  query_inspector (події before/after_cursor_execute, див. query_stats.py);
+* влучання кешів (app_cache, token_cache, qr_store) - читаються зі stats()
+  сервісів під час збирання метрик;
+* тривалість задач планувальника - обгортка instrument_scheduler().
+
+Запити, довші за METRICS_SLOW_REQUEST_MS, пишуться в лог разом із SQL,
+який вони виконали (0 - журнал вимкнено). Якщо задано METRICS_TOKEN,
+/metrics вимагає заголовок Authorization: Bearer <token>; з
+METRICS_REQUIRE_TOKEN (продакшен) без токена /metrics відповідає 404.
+
+Кожен процес (воркер gunicorn) має власні значення - Prometheus має
+опитувати воркери окремо або агрегувати за instance.
+"""
+
+import hmac
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+
+from flask import Response, abort, g, request
+
+# Межі гістограм
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+JOB_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+
+# Endpoint'и без метрик запитів
+SKIP_ENDPOINTS = frozenset({'static'})
+
+# Кеші: ім'я розширення -> ключ промахів у stats()
+CACHE_SOURCES = {
+    'app_cache': 'misses',
+    'token_cache': 'misses',
+    'qr_store': 'renders',
+}
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Гістограма з фіксованими межами (кумулятивні значення - при виводі)"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricFamily:
+    """Метрика з мітками: counter, gauge або histogram"""
+
+    def __init__(self, name, kind, help_text, labels=(), buckets=None):
+        self.name = name
+        self.kind = kind
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = buckets
+        self.values = {}
+
+    def inc(self, label_values=(), amount=1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def set(self, label_values, value):
+        self.values[label_values] = value
+
+    def observe(self, label_values, value):
+        histogram = self.values.get(label_values)
+        if histogram is None:
+            histogram = self.values[label_values] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def render(self, lines):
+        lines.append(f'# HELP {self.name} {self.help}')
+        lines.append(f'# TYPE {self.name} {self.kind}')
+        for label_values, value in sorted(self.values.items()):
+            if self.kind != 'histogram':
+                lines.append(f'{self.name}{_labels(self.labels, label_values)} {_number(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), value.counts):
+                cumulative += count
+                le = _labels(self.labels, label_values, ('le', _number(bound)))
+                lines.append(f'{self.name}_bucket{le} {cumulative}')
+            labels = _labels(self.labels, label_values)
+            lines.append(f'{self.name}_sum{labels} {_number(value.sum)}')
+            lines.append(f'{self.name}_count{labels} {value.count}')
+
+
+class Metrics:
+    """Реєстр метрик процесу та збирання їх з запитів Flask"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.requests = MetricFamily(
+            'inventory_http_requests_total', 'counter',
+            'HTTP-запити за endpoint, методом і статусом', ('endpoint', 'method', 'status'))
+        self.latency = MetricFamily(
+            'inventory_http_request_duration_seconds', 'histogram',
+            'Тривалість HTTP-запитів', ('endpoint', 'method'), LATENCY_BUCKETS)
+        self.db_time = MetricFamily(
+            'inventory_http_request_db_seconds', 'histogram',
+            'Час виконання SQL за один HTTP-запит', ('endpoint',), LATENCY_BUCKETS)
+        self.queries = MetricFamily(
+            'inventory_http_request_queries', 'histogram',
+            'Кількість SQL-запитів за один HTTP-запит', ('endpoint',), QUERY_COUNT_BUCKETS)
+        self.slow_requests = MetricFamily(
+            'inventory_http_slow_requests_total', 'counter',
+            'Запити, довші за METRICS_SLOW_REQUEST_MS', ('endpoint',))
+        self.job_duration = MetricFamily(
+            'inventory_scheduler_job_duration_seconds', 'histogram',
+            'Тривалість задач планувальника', ('job',), JOB_BUCKETS)
+        self.job_failures = MetricFamily(
+            'inventory_scheduler_job_failures_total', 'counter',
+            'Задачі планувальника, що завершились помилкою', ('job',))
+        self._families = (
+            self.requests, self.latency, self.db_time, self.queries, self.slow_requests,
+            self.job_duration, self.job_failures,
+        )
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Реєструє збирання метрик і /metrics у додатку (app.extensions['metrics'])"""
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('METRICS_TOKEN', None)
+        app.config.setdefault('METRICS_REQUIRE_TOKEN', False)
+        app.config.setdefault('METRICS_SLOW_REQUEST_MS', 0)
+
+        self.app = app
+        app.extensions['metrics'] = self
+        if not app.config['METRICS_ENABLED']:
+            return
+
+        # Журналу повільних запитів потрібен текст SQL з лічильника query_inspector
+        if app.config['METRICS_SLOW_REQUEST_MS']:
+            app.config['QUERY_RECORD_STATEMENTS'] = True
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.add_url_rule('/metrics', 'metrics', self._metrics_view)
+        if app.config['METRICS_REQUIRE_TOKEN'] and not app.config['METRICS_TOKEN']:
+            app.logger.warning("METRICS_TOKEN не задано - /metrics недоступний (METRICS_REQUIRE_TOKEN)")
+
+    # ------------------------------------------------------------------
+    # Запити Flask
+
+    def _start_request(self):
+        g.metrics_started = time.perf_counter()
+
+    def _finish_request(self, response):
+        started = g.pop('metrics_started', None)
+        endpoint = request.endpoint or 'unknown'
+        if started is None or endpoint in SKIP_ENDPOINTS:
+            return response
+
+        elapsed = time.perf_counter() - started
+        counter = g.get('query_counter')
+        with self._lock:
+            self.requests.inc((endpoint, request.method, str(response.status_code)))
+            self.latency.observe((endpoint, request.method), elapsed)
+            if counter is not None:
+                self.db_time.observe((endpoint,), counter.seconds)
+                self.queries.observe((endpoint,), counter.queries)
+
+        slow_ms = self.app.config['METRICS_SLOW_REQUEST_MS']
+        if slow_ms and elapsed * 1000 >= slow_ms:
+            with self._lock:
+                self.slow_requests.inc((endpoint,))
+            self._log_slow_request(endpoint, response, elapsed, counter)
+        return response
+
+    def _log_slow_request(self, endpoint, response, elapsed, counter):
+        message = (
+            f"Повільний запит {request.method} {request.path} ({endpoint}) -> {response.status_code}: "
+            f"{elapsed * 1000:.0f} мс"
+        )
+        if counter is not None:
+            message += f", SQL: {counter.queries} запитів, {counter.seconds * 1000:.0f} мс"
+            for statement, seconds in counter.statements or ():
+                message += f"\n  [{seconds * 1000:.1f} мс] {' '.join(statement.split())[:500]}"
+            if counter.statements is not None and counter.queries > len(counter.statements):
+                message += f"\n  ... ще {counter.queries - len(counter.statements)} запитів"
+        self.app.logger.warning(message)
+
+    # ------------------------------------------------------------------
+    # Задачі планувальника
+
+    def timed_job(self, job_id, func):
+        """Обгортка задачі, що записує її тривалість і помилки"""
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                with self._lock:
+                    self.job_failures.inc((job_id,))
+                raise
+            finally:
+                with self._lock:
+                    self.job_duration.observe((job_id,), time.perf_counter() - started)
+        return wrapper
+
+    def instrument_scheduler(self, scheduler):
+        """Додає облік тривалості до всіх задач планувальника (до scheduler.start())"""
+        for job in scheduler.get_jobs():
+            job.modify(func=self.timed_job(job.id, job.func))
+
+    # ------------------------------------------------------------------
+    # Вивід
+
+    def _cache_lines(self, lines):
+        sources = []
+        for name, miss_key in CACHE_SOURCES.items():
+            service = self.app.extensions.get(name)
+            if service is None:
+                continue
+            stats = service.stats()
+            sources.append((name, stats.get('hits', 0), stats.get(miss_key, 0)))
+
+        for metric, kind, help_text, value in (
+            ('inventory_cache_hits_total', 'counter', 'Влучання кешу', lambda hits, misses: hits),
+            ('inventory_cache_misses_total', 'counter', 'Промахи кешу', lambda hits, misses: misses),
+            ('inventory_cache_hit_ratio', 'gauge', 'Частка влучань кешу',
+             lambda hits, misses: round(hits / (hits + misses), 4) if hits + misses else 0.0),
+        ):
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} {kind}')
+            for name, hits, misses in sources:
+                lines.append(f'{metric}{{cache="{name}"}} {_number(value(hits, misses))}')
+
+    def render(self):
+        """
+        Усі метрики у текстовому форматі Prometheus
+
+        Returns:
+            str
+        """
+        lines = [
+            '# HELP inventory_uptime_seconds Час роботи процесу',
+            '# TYPE inventory_uptime_seconds gauge',
+            f'inventory_uptime_seconds {_number(round(time.time() - self.started, 3))}',
+        ]
+        with self._lock:
+            for family in self._families:
+                family.render(lines)
+        self._cache_lines(lines)
+        return '\n'.join(lines) + '\n'
+
+    def _metrics_view(self):
+        token = self.app.config['METRICS_TOKEN']
+        if not token and self.app.config['METRICS_REQUIRE_TOKEN']:
+            # Endpoint для Prometheus - текстова відповідь без HTML-сторінки помилки
+            return Response('Not Found\n', status=404, content_type='text/plain')
+        if token:
+            supplied = request.headers.get('Authorization', '')
+            if not hmac.compare_digest(supplied.encode(), f'Bearer {token}'.encode()):
+                abort(401)
+        return Response(self.render(), content_type=CONTENT_TYPE)
+
+    def reset(self):
+        with self._lock:
+            for family in self._families:
+                family.values.clear()
+
+
+metrics = Metrics()
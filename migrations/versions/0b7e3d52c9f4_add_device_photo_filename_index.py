@@ -0,0 +1,27 @@
+"""Add index on DevicePhoto.filename
+
+Revision ID: 0b7e3d52c9f4
+Revises: f1c83a9d5e27
+Create Date: 2026-10-17 17:05:41.208317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0b7e3d52c9f4'
+down_revision = 'f1c83a9d5e27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # uploaded_file() шукає фото за іменем файлу на кожен запит зображення
+    with op.batch_alter_table('device_photo', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_device_photo_filename'), ['filename'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('device_photo', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_device_photo_filename'))
@@ -0,0 +1,60 @@
+"""Add photo_file manifest for photo garbage collection
+
+Revision ID: 1c4a8e6f0d92
+Revises: 0b7e3d52c9f4
+Create Date: 2026-10-17 18:12:09.631540
+
+"""
+import os
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1c4a8e6f0d92'
+down_revision = '0b7e3d52c9f4'
+branch_labels = None
+depends_on = None
+
+VARIANTS = ('thumb', 'medium', 'large', 'webp')
+
+
+def upgrade():
+    photo_file = op.create_table('photo_file',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('filename', sa.String(length=255), nullable=False),
+    sa.Column('photo_id', sa.Integer(), nullable=True),
+    sa.Column('variant', sa.String(length=20), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('released_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['photo_id'], ['device_photo.id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('filename')
+    )
+    with op.batch_alter_table('photo_file', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_photo_file_photo_id'), ['photo_id'], unique=False)
+
+    # Маніфест для наявних фото: оригінал і всі записані варіанти
+    connection = op.get_bind()
+    photos = connection.execute(sa.text(
+        "SELECT id, filename, variants, uploaded_at FROM device_photo"
+    ))
+    rows = []
+    for photo_id, filename, variants, uploaded_at in photos:
+        base_name, ext = os.path.splitext(filename)
+        created_at = uploaded_at or datetime.utcnow()
+        rows.append({'filename': filename, 'photo_id': photo_id, 'variant': 'original', 'created_at': created_at})
+        for variant in (variants.split(',') if variants else VARIANTS):
+            name = f'{base_name}.webp' if variant == 'webp' else f'{base_name}_{variant}{ext}'
+            rows.append({'filename': name, 'photo_id': photo_id, 'variant': variant, 'created_at': created_at})
+    if rows:
+        op.bulk_insert(photo_file, rows)
+
+
+def downgrade():
+    with op.batch_alter_table('photo_file', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_photo_file_photo_id'))
+
+    op.drop_table('photo_file')
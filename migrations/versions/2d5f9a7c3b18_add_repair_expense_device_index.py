@@ -0,0 +1,27 @@
+"""Add index on RepairExpense.device_id
+
+Revision ID: 2d5f9a7c3b18
+Revises: 1c4a8e6f0d92
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2d5f9a7c3b18'
+down_revision = '1c4a8e6f0d92'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Суми ремонтів (SUM ... GROUP BY device_id) та підзапит total_repair_expenses
+    with op.batch_alter_table('repair_expense', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_repair_expense_device_id'), ['device_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('repair_expense', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_repair_expense_device_id'))
@@ -0,0 +1,38 @@
+"""Add full-text search index for Device
+
+Revision ID: 3f9c2d7a1b04
+Revises: 907305a4ed6b
+Create Date: 2026-10-17 09:12:41.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9c2d7a1b04'
+down_revision = '907305a4ed6b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # FTS5 (SQLite) або pg_trgm (PostgreSQL) - DDL спільний з search_service
+    from search_service import create_search_index, FTS_TABLE
+
+    connection = op.get_bind()
+    if create_search_index(connection) and connection.dialect.name == 'sqlite':
+        op.execute(sa.text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+
+
+def downgrade():
+    from search_service import DEVICE_SEARCH_FIELDS, FTS_TABLE
+
+    connection = op.get_bind()
+    if connection.dialect.name == 'sqlite':
+        for suffix in ('ai', 'ad', 'au'):
+            op.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}')
+        op.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    elif connection.dialect.name == 'postgresql':
+        for field in DEVICE_SEARCH_FIELDS:
+            op.execute(f'DROP INDEX IF EXISTS ix_device_{field}_trgm')
@@ -0,0 +1,29 @@
+"""Add per-year inventory number counter
+
+Revision ID: 5b8e21c4d9a7
+Revises: 3f9c2d7a1b04
+Create Date: 2026-10-17 11:05:18.402771
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b8e21c4d9a7'
+down_revision = '3f9c2d7a1b04'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Лічильник року заповнюється найбільшим існуючим номером при першому виділенні
+    op.create_table('inventory_counter',
+    sa.Column('year', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('last_value', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('year')
+    )
+
+
+def downgrade():
+    op.drop_table('inventory_counter')
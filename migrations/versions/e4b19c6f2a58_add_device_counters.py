@@ -0,0 +1,44 @@
+"""Add materialized device counters
+
+Revision ID: e4b19c6f2a58
+Revises: d2a7f5c81e36
+Create Date: 2026-10-17 15:02:41.318904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b19c6f2a58'
+down_revision = 'd2a7f5c81e36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('device_counters',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('city_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=50), nullable=False),
+    sa.Column('type', sa.String(length=50), nullable=False),
+    sa.Column('month', sa.String(length=7), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('city_id', 'status', 'type', 'month', name='uq_device_counters_group')
+    )
+
+    # Початкове заповнення з існуючих пристроїв
+    if op.get_bind().dialect.name == 'postgresql':
+        month = "COALESCE(to_char(created_at, 'YYYY-MM'), '')"
+    else:
+        month = "COALESCE(strftime('%Y-%m', created_at), '')"
+    op.execute(
+        "INSERT INTO device_counters (city_id, status, type, month, count) "
+        f"SELECT city_id, COALESCE(status, ''), COALESCE(type, ''), {month}, COUNT(*) "
+        f"FROM device GROUP BY city_id, COALESCE(status, ''), COALESCE(type, ''), {month}"
+    )
+
+
+def downgrade():
+    op.drop_table('device_counters')
@@ -0,0 +1,35 @@
+"""Add processing status to DevicePhoto
+
+Revision ID: f1c83a9d5e27
+Revises: e4b19c6f2a58
+Create Date: 2026-10-17 16:20:07.514230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1c83a9d5e27'
+down_revision = 'e4b19c6f2a58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Існуючі фото оброблялись у запиті - вважаються готовими з усіма варіантами
+    with op.batch_alter_table('device_photo', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('status', sa.String(length=20), nullable=False, server_default='ready'))
+        batch_op.add_column(sa.Column('variants', sa.String(length=100), nullable=True))
+        batch_op.add_column(sa.Column('processed_at', sa.DateTime(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_device_photo_status'), ['status'], unique=False)
+
+    op.execute("UPDATE device_photo SET variants = 'thumb,medium,large,webp'")
+
+
+def downgrade():
+    with op.batch_alter_table('device_photo', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_device_photo_status'))
+        batch_op.drop_column('processed_at')
+        batch_op.drop_column('variants')
+        batch_op.drop_column('status')
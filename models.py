@@ -1,9 +1,55 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from datetime import datetime
+from datetime import datetime, date
+from sqlalchemy import case, event, func, inspect, literal, or_, select, type_coerce
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.sql.functions import FunctionElement
+import hashlib
+import os
 
 db = SQLAlchemy()
 
+# Середня тривалість року в днях (лінійна амортизація)
+DAYS_PER_YEAR = 365.25
+
+class days_between(FunctionElement):
+    """SQL: кількість днів від start до end (days_between(start, end))"""
+    type = db.Float()
+    name = 'days_between'
+    inherit_cache = True
+
+@compiles(days_between)
+def _compile_days_between(element, compiler, **kw):
+    # PostgreSQL: date - date повертає кількість днів
+    start, end = element.clauses
+    return f'({compiler.process(end, **kw)} - {compiler.process(start, **kw)})'
+
+@compiles(days_between, 'sqlite')
+def _compile_days_between_sqlite(element, compiler, **kw):
+    start, end = element.clauses
+    return f'(julianday({compiler.process(end, **kw)}) - julianday({compiler.process(start, **kw)}))'
+
+# Атрибути з active_history: {(модель, атрибут)}
+_active_history_attrs = set()
+
+def _load_old_value(target, value, oldvalue, initiator):
+    """Обробник set: з active_history ORM завантажує старе значення перед зміною"""
+
+def track_old_values(model, attrs):
+    """
+    Вмикає active_history для атрибутів моделі (один обробник на атрибут)
+
+    Після коміту атрибути прострочені (expire_on_commit), і без active_history
+    історія атрибута в after_flush не містить старого значення. Потрібно
+    подіям, що порівнюють значення до і після змін (device_history,
+    device_counters).
+    """
+    for attr in attrs:
+        if (model, attr) not in _active_history_attrs:
+            event.listen(getattr(model, attr), 'set', _load_old_value, active_history=True)
+            _active_history_attrs.add((model, attr))
+
 class City(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False, unique=True)
@@ -58,42 +104,79 @@ class Device(db.Model):
         """Обслуговування вимкнено: не обчислюємо наступне обслуговування"""
         self.next_maintenance = None
     
-    @property
+    @hybrid_property
     def current_value(self):
         """Поточна вартість пристрою з урахуванням амортизації"""
         if not self.purchase_price or not self.purchase_date:
             return None
         
-        from datetime import date
         today = date.today()
-        years_old = (today - self.purchase_date).days / 365.25
+        years_old = (today - self.purchase_date).days / DAYS_PER_YEAR
         
         if years_old <= 0:
             return float(self.purchase_price)
         
         # Лінійна амортизація
-        depreciation_amount = float(self.purchase_price) * (float(self.depreciation_rate) / 100) * years_old
+        depreciation_amount = float(self.purchase_price) * (float(self.depreciation_rate or 0) / 100) * years_old
         current = float(self.purchase_price) - depreciation_amount
         
         return max(current, 0)  # Не може бути від'ємним
     
-    @property
+    @current_value.inplace.expression
+    @classmethod
+    def _current_value_expression(cls):
+        """Те саме обчислення в SQL (для звітів, фільтрів і сортування)"""
+        price = cls.purchase_price
+        days = days_between(cls.purchase_date, literal(date.today(), db.Date))
+        current = price - price * (func.coalesce(cls.depreciation_rate, 0) / 100) * (days / DAYS_PER_YEAR)
+        return type_coerce(case(
+            (or_(price.is_(None), price == 0, cls.purchase_date.is_(None)), None),
+            (days <= 0, price),
+            (current < 0, 0),
+            else_=current,
+        ), db.Float).label('current_value')
+    
+    @hybrid_property
     def total_repair_expenses(self):
         """Загальні витрати на ремонт"""
+        state = inspect(self)
+        # Незавантажений список витрат не читаємо: сума рахується в базі
+        if 'repair_expenses' in state.unloaded and state.persistent:
+            return float(state.session.scalar(
+                select(type(self).total_repair_expenses).where(type(self).id == self.id)
+            ))
         if not self.repair_expenses:
             return 0
         return sum(float(exp.amount) for exp in self.repair_expenses)
     
-    @property
+    @total_repair_expenses.inplace.expression
+    @classmethod
+    def _total_repair_expenses_expression(cls):
+        return type_coerce(
+            select(func.coalesce(func.sum(RepairExpense.amount), 0))
+            .where(RepairExpense.device_id == cls.id)
+            .correlate_except(RepairExpense)
+            .scalar_subquery(),
+            db.Float
+        ).label('total_repair_expenses')
+    
+    @hybrid_property
     def total_cost(self):
         """Загальна вартість (покупка + ремонт)"""
         purchase = float(self.purchase_price) if self.purchase_price else 0
         return purchase + self.total_repair_expenses
+    
+    @total_cost.inplace.expression
+    @classmethod
+    def _total_cost_expression(cls):
+        return type_coerce(
+            func.coalesce(cls.purchase_price, 0) + cls.total_repair_expenses, db.Float
+        ).label('total_cost')
 
 class RepairExpense(db.Model):
     """Модель витрат на ремонт пристрою"""
     id = db.Column(db.Integer, primary_key=True)
-    device_id = db.Column(db.Integer, db.ForeignKey('device.id'), nullable=False)
+    device_id = db.Column(db.Integer, db.ForeignKey('device.id'), nullable=False, index=True)
     amount = db.Column(db.Numeric(10, 2), nullable=False)  # Сума витрат
     description = db.Column(db.String(500))  # Опис робіт
     repair_date = db.Column(db.Date, nullable=False)  # Дата ремонту
@@ -103,12 +186,57 @@ class RepairExpense(db.Model):
     def __repr__(self):
         return f'<RepairExpense {self.amount} for device {self.device_id}>'
 
+def photo_variant_filename(filename, variant):
+    """Ім'я файлу варіанта фото ('original' - сам файл)"""
+    if variant == 'original':
+        return filename
+    base_name, ext = os.path.splitext(filename)
+    if variant == 'webp':
+        return f'{base_name}.webp'
+    return f'{base_name}_{variant}{ext}'
+
 class DevicePhoto(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    filename = db.Column(db.String(255), nullable=False)
+    filename = db.Column(db.String(255), nullable=False, index=True)
     original_filename = db.Column(db.String(255), nullable=False)
     device_id = db.Column(db.Integer, db.ForeignKey('device.id'), nullable=False)
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Обробка (image_pipeline): pending - віддається оригінал, ready - є варіанти, failed - лише оригінал
+    status = db.Column(db.String(20), nullable=False, default='pending', server_default='ready', index=True)
+    variants = db.Column(db.String(100))  # Створені варіанти через кому: thumb,medium,large,webp
+    processed_at = db.Column(db.DateTime)
+    
+    @property
+    def is_ready(self):
+        return self.status == 'ready'
+    
+    def has_variant(self, variant):
+        """Чи створено варіант фото (thumb, medium, large, webp)"""
+        return self.is_ready and variant in (self.variants or '').split(',')
+    
+    def variant_filename(self, variant):
+        """Ім'я файлу варіанта: <base>_thumb.jpg, <base>.webp"""
+        return photo_variant_filename(self.filename, variant)
+    
+    @property
+    def version(self):
+        """Хеш стану фото (ETag та параметр v для URL) - змінюється після обробки"""
+        state = f'{self.filename}:{self.status}:{self.variants}:{self.processed_at}'
+        return hashlib.sha1(state.encode('utf-8')).hexdigest()[:16]
+
+class PhotoFile(db.Model):
+    """Файл у UPLOAD_FOLDER (оригінал або варіант фото) - маніфест для збирача сміття"""
+    __tablename__ = 'photo_file'
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(255), nullable=False, unique=True)
+    # NULL - файл більше не використовується (фото видалено) і підлягає видаленню
+    photo_id = db.Column(db.Integer, db.ForeignKey('device_photo.id', ondelete='SET NULL'), nullable=True, index=True)
+    variant = db.Column(db.String(20), nullable=False, default='original')  # original, thumb, medium, large, webp
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    released_at = db.Column(db.DateTime)
+    
+    # Без backref: видалення DevicePhoto не завантажує список файлів
+    photo = db.relationship('DevicePhoto')
 
 class DeviceHistory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -126,6 +254,24 @@ class DeviceHistory(db.Model):
     device_type = db.Column(db.String(50))
     device_serial_number = db.Column(db.String(100))
 
+class InventoryCounter(db.Model):
+    """Лічильник інвентарних номерів за роками (останній виданий номер)"""
+    year = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    last_value = db.Column(db.Integer, nullable=False, default=0)
+
+class DeviceCounter(db.Model):
+    """Кількість пристроїв у групі (місто, статус, тип, місяць додавання) - для статистики"""
+    __tablename__ = 'device_counters'
+    __table_args__ = (
+        db.UniqueConstraint('city_id', 'status', 'type', 'month', name='uq_device_counters_group'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    city_id = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(50), nullable=False, default='')  # '' - статус не вказано
+    type = db.Column(db.String(50), nullable=False, default='')
+    month = db.Column(db.String(7), nullable=False, default='')  # YYYY-MM за created_at
+    count = db.Column(db.Integer, nullable=False, default=0)
+
 class UserActivity(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -217,4 +363,48 @@ class ApiToken(db.Model):
     def is_expired(self):
         """Перевіряє, чи токен прострочений"""
         from datetime import datetime
-        return datetime.utcnow() > self.expires_at
\ No newline at end of file
+        return datetime.utcnow() > self.expires_at
+
+class TokenBlacklist(db.Model):
+    """Відкликані JWT токени (до закінчення їх терміну дії)"""
+    id = db.Column(db.Integer, primary_key=True)
+    token_id = db.Column(db.String(100), unique=True, nullable=False, index=True)  # JWT jti
+    token_type = db.Column(db.String(20), nullable=False, default='access')  # access або refresh
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<TokenBlacklist {self.token_id}>'
+    
+    def is_expired(self):
+        """Перевіряє, чи минув термін дії відкликаного токена"""
+        return datetime.utcnow() > self.expires_at
+
+class UserSession(db.Model):
+    """Активні сесії користувачів веб-інтерфейсу"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    session_id = db.Column(db.String(255), unique=True, nullable=False, index=True)  # Flask-Login session identifier
+    ip_address = db.Column(db.String(45))
+    user_agent = db.Column(db.Text)
+    is_active = db.Column(db.Boolean, default=True, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_activity = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    # Зв'язки
+    user = db.relationship('User', backref='sessions', lazy=True)
+    
+    def __repr__(self):
+        return f'<UserSession {self.session_id[:8]} for user {self.user_id}>'
+    
+    def update_activity(self):
+        """Оновлює час останньої активності"""
+        self.last_activity = datetime.utcnow()
+    
+    def is_expired(self, inactivity_timeout_minutes=30):
+        """Перевіряє, чи сесія неактивна довше за таймаут"""
+        from datetime import timedelta
+        if not self.last_activity:
+            return True
+        return datetime.utcnow() - self.last_activity > timedelta(minutes=inactivity_timeout_minutes)
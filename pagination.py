@@ -0,0 +1,223 @@
+"""
+Keyset (cursor) пагінація
+
+Замість OFFSET n + COUNT(*) запит "шукає" наступну сторінку за ключем
+(колонка сортування, id) останнього рядка попередньої сторінки, тому будь-яка
+сторінка коштує стільки ж, скільки перша. Курсори непрозорі для клієнта
+(base64url від JSON) і прив'язані до колонки та напрямку сортування.
+"""
+
+import base64
+import json
+from datetime import date, datetime
+
+from sqlalchemy import and_, or_
+
+
+class InvalidCursorError(ValueError):
+    """Курсор пошкоджений або не відповідає поточному сортуванню"""
+
+
+class KeysetPagination:
+    """Результат keyset пагінації (сумісний за атрибутами з частиною flask_sqlalchemy Pagination)"""
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def _encode_value(value):
+    """Серіалізує значення ключа сортування для JSON"""
+    if isinstance(value, datetime):
+        return {'t': 'datetime', 'v': value.isoformat()}
+    if isinstance(value, date):
+        return {'t': 'date', 'v': value.isoformat()}
+    return {'t': 'raw', 'v': value}
+
+
+def _decode_value(data):
+    """Відновлює значення ключа сортування з JSON"""
+    value_type = data.get('t')
+    value = data.get('v')
+    if value is None:
+        return None
+    if value_type == 'datetime':
+        return datetime.fromisoformat(value)
+    if value_type == 'date':
+        return date.fromisoformat(value)
+    if value_type == 'raw':
+        return value
+    raise InvalidCursorError('Невідомий тип значення курсора')
+
+
+def encode_cursor(sort_key, descending, value, row_id, direction):
+    """
+    Кодує курсор у непрозорий рядок
+
+    Args:
+        sort_key: Назва колонки сортування
+        descending: Чи сортування за спаданням
+        value: Значення колонки сортування граничного рядка
+        row_id: id граничного рядка
+        direction: 'next' або 'prev'
+
+    Returns:
+        str: base64url рядок без padding
+    """
+    payload = {
+        's': sort_key,
+        'o': 'desc' if descending else 'asc',
+        'k': _encode_value(value),
+        'id': row_id,
+        'd': direction,
+    }
+    raw = json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, sort_key, descending):
+    """
+    Декодує курсор та перевіряє, що він відповідає поточному сортуванню
+
+    Returns:
+        tuple: (value, row_id, direction)
+
+    Raises:
+        InvalidCursorError: Якщо курсор невалідний
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw.decode('utf-8'))
+        value = _decode_value(payload['k'])
+        row_id = int(payload['id'])
+        direction = payload['d']
+    except InvalidCursorError:
+        raise
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise InvalidCursorError('Невірний формат курсора')
+
+    if payload.get('s') != sort_key or payload.get('o') != ('desc' if descending else 'asc'):
+        raise InvalidCursorError('Курсор не відповідає поточному сортуванню')
+    if direction not in ('next', 'prev'):
+        raise InvalidCursorError('Невірний напрямок курсора')
+
+    return value, row_id, direction
+
+
+def _nulls_sort_low(query):
+    """SQLite вважає NULL найменшим значенням, PostgreSQL - найбільшим"""
+    return query.session.get_bind().dialect.name != 'postgresql'
+
+
+def _seek_condition(column, id_column, value, row_id, descending, nullable, nulls_low):
+    """
+    Умова "рядки після (value, row_id)" у порядку обходу
+
+    Порядок обходу - (column, id) за зростанням або спаданням з природним
+    для СУБД розташуванням NULL, щоб запит міг використати індекс.
+    """
+    if descending:
+        after_value = column < value if value is not None else None
+        after_id = id_column < row_id
+    else:
+        after_value = column > value if value is not None else None
+        after_id = id_column > row_id
+
+    if not nullable:
+        return or_(after_value, and_(column == value, after_id))
+
+    # Чи стоять NULL після не-NULL значень у порядку обходу
+    nulls_after = nulls_low == descending
+
+    if value is None:
+        condition = and_(column.is_(None), after_id)
+        if not nulls_after:
+            condition = or_(condition, column.isnot(None))
+        return condition
+
+    condition = or_(after_value, and_(column == value, after_id))
+    if nulls_after:
+        condition = or_(condition, column.is_(None))
+    return condition
+
+
+def keyset_paginate(query, model, sort_key, descending=False, per_page=20, cursor=None, with_total=False):
+    """
+    Повертає сторінку запиту з keyset пагінацією по (sort_key, id)
+
+    Args:
+        query: Запит без order_by
+        model: Модель (має колонку id)
+        sort_key: Назва колонки сортування
+        descending: Сортування за спаданням
+        per_page: Кількість записів на сторінці
+        cursor: Непрозорий курсор з попередньої відповіді або None (перша сторінка)
+        with_total: Чи рахувати загальну кількість (COUNT(*))
+
+    Returns:
+        KeysetPagination
+
+    Raises:
+        InvalidCursorError: Якщо курсор невалідний
+    """
+    column = getattr(model, sort_key)
+    id_column = model.id
+    nullable = sort_key != 'id' and column.property.columns[0].nullable
+
+    total = query.order_by(None).count() if with_total else None
+
+    direction = 'next'
+    if cursor:
+        value, row_id, direction = decode_cursor(cursor, sort_key, descending)
+
+    # Попередня сторінка - обхід у зворотному порядку з подальшим розворотом
+    traverse_desc = descending if direction == 'next' else not descending
+
+    page_query = query
+    if cursor and sort_key == 'id':
+        page_query = page_query.filter(id_column < row_id if traverse_desc else id_column > row_id)
+    elif cursor:
+        page_query = page_query.filter(_seek_condition(
+            column, id_column, value, row_id, traverse_desc, nullable, _nulls_sort_low(query)
+        ))
+
+    if sort_key == 'id':
+        order = [id_column.desc() if traverse_desc else id_column.asc()]
+    elif traverse_desc:
+        order = [column.desc(), id_column.desc()]
+    else:
+        order = [column.asc(), id_column.asc()]
+
+    rows = page_query.order_by(*order).limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if direction == 'prev':
+        rows.reverse()
+        has_next = cursor is not None
+        has_prev = has_more
+    else:
+        has_next = has_more
+        has_prev = cursor is not None
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if has_next:
+            last = rows[-1]
+            next_cursor = encode_cursor(sort_key, descending, getattr(last, sort_key), last.id, 'next')
+        if has_prev:
+            first = rows[0]
+            prev_cursor = encode_cursor(sort_key, descending, getattr(first, sort_key), first.id, 'prev')
+
+    return KeysetPagination(rows, per_page, next_cursor=next_cursor, prev_cursor=prev_cursor, total=total)
@@ -0,0 +1,251 @@
+"""
+Збирач сміття для файлів фото (маніфест photo_file)
+
+Кожен файл у UPLOAD_FOLDER - оригінал і варіанти thumb/medium/large/webp -
+записаний у таблиці photo_file з посиланням на DevicePhoto:
+
+* завантаження додає рядок оригіналу в тій самій транзакції, що й DevicePhoto;
+* image_pipeline після обробки записує створені варіанти;
+* видалення DevicePhoto (і каскадне видалення пристрою) відв'язує всі файли
+  фото (photo_id = NULL), а після коміту видаляє їх з диска.
+
+collect_orphan_photos() обробляє лише відв'язані рядки маніфесту пакетами
+(PHOTO_GC_BATCH_SIZE) без сканування каталогу. Файли, новіші за
+PHOTO_GC_GRACE_MINUTES, не видаляються - вони можуть ще оброблятись.
+
+Файли, яких немає в маніфесті (збій до коміту завантаження, ручне
+копіювання), знаходить окремий прохід по каталогу:
+
+    flask photo-gc --scan
+"""
+
+import os
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, event, select, update
+
+from models import db, DevicePhoto, PhotoFile, photo_variant_filename
+
+_RELEASED_KEY = 'photo_gc_released'
+
+
+def photo_files(filename, variants):
+    """
+    Файли фото: оригінал та створені варіанти
+
+    Args:
+        filename: Ім'я оригіналу
+        variants: Список варіантів (thumb, medium, large, webp)
+
+    Returns:
+        list: Пари (варіант, ім'я файлу)
+    """
+    return [('original', filename)] + [
+        (variant, photo_variant_filename(filename, variant)) for variant in variants
+    ]
+
+
+def track_photo_files(session, photo_id, files, released=()):
+    """
+    Записує файли фото в маніфест (замінює наявні рядки з тими ж іменами)
+
+    Args:
+        session: Сесія SQLAlchemy (коміт - на викликачі)
+        photo_id: ID DevicePhoto (None - фото вже видалено, файли стають сміттям)
+        files: Пари (варіант, ім'я файлу)
+        released: Файли, що більше не використовуються (оригінал до конвертації) -
+            відв'язуються і видаляються з диска після коміту
+    """
+    filenames = [filename for _, filename in files]
+    if filenames:
+        session.execute(delete(PhotoFile).where(PhotoFile.filename.in_(filenames)))
+    now = datetime.utcnow()
+    if released:
+        # Як і для видалених фото: рядок лишається до collect_orphan_photos,
+        # якщо файл не вдасться видалити одразу після коміту
+        session.execute(
+            update(PhotoFile).where(PhotoFile.filename.in_(released))
+            .values(photo_id=None, released_at=now)
+        )
+        session.info.setdefault(_RELEASED_KEY, []).extend(released)
+    session.add_all(
+        PhotoFile(filename=filename, photo_id=photo_id, variant=variant, created_at=now,
+                  released_at=None if photo_id else now)
+        for variant, filename in files
+    )
+
+
+def _remove_file(upload_folder, filename):
+    """Видаляє файл; відсутній файл вважається видаленим"""
+    try:
+        os.remove(os.path.join(upload_folder, filename))
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        current_app.logger.error(f"Помилка видалення файлу {filename}: {e}")
+        return False
+    return True
+
+
+def collect_orphan_photos(batch_size=None, max_batches=None, grace_minutes=None):
+    """
+    Видаляє відв'язані файли з маніфесту пакетами
+
+    Кожен пакет - одна індексована вибірка та окремий коміт, тож пам'ять
+    обмежена розміром пакета. Файли, які не вдалося видалити, лишаються в
+    маніфесті до наступного запуску.
+
+    Args:
+        batch_size: Розмір пакета (PHOTO_GC_BATCH_SIZE)
+        max_batches: Максимум пакетів за запуск (PHOTO_GC_MAX_BATCHES, None - без обмеження)
+        grace_minutes: Файли, новіші за цей час, не видаляються (PHOTO_GC_GRACE_MINUTES)
+
+    Returns:
+        int: Кількість видалених файлів
+    """
+    config = current_app.config
+    if batch_size is None:
+        batch_size = config.get('PHOTO_GC_BATCH_SIZE', 500)
+    if max_batches is None:
+        max_batches = config.get('PHOTO_GC_MAX_BATCHES')
+    if grace_minutes is None:
+        grace_minutes = config.get('PHOTO_GC_GRACE_MINUTES', 60)
+
+    upload_folder = config['UPLOAD_FOLDER']
+    cutoff = datetime.utcnow() - timedelta(minutes=grace_minutes)
+    started = time.perf_counter()
+    last_id = 0
+    batches = 0
+    total = 0
+
+    while max_batches is None or batches < max_batches:
+        rows = db.session.execute(
+            select(PhotoFile.id, PhotoFile.filename)
+            .where(PhotoFile.photo_id.is_(None), PhotoFile.created_at < cutoff, PhotoFile.id > last_id)
+            .order_by(PhotoFile.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        batches += 1
+        last_id = rows[-1].id
+
+        removed_ids = [row.id for row in rows if _remove_file(upload_folder, row.filename)]
+        try:
+            if removed_ids:
+                db.session.execute(delete(PhotoFile).where(PhotoFile.id.in_(removed_ids)))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Очищення фото: помилка після {total} файлів: {e}")
+            break
+        total += len(removed_ids)
+
+        if len(rows) < batch_size:
+            break
+
+    current_app.logger.info(f"Очищення невикористаних фото: {total} файлів за {time.perf_counter() - started:.3f} с")
+    return total
+
+
+def scan_untracked_files(batch_size=None, grace_minutes=None):
+    """
+    Видаляє файли з UPLOAD_FOLDER, яких немає в маніфесті
+
+    Каталог читається потоково (os.scandir), імена звіряються з маніфестом
+    пакетами. Файли, змінені пізніше за grace_minutes тому, пропускаються -
+    це можуть бути завантаження, які ще не закомічені.
+
+    Returns:
+        int: Кількість видалених файлів
+    """
+    config = current_app.config
+    if batch_size is None:
+        batch_size = config.get('PHOTO_GC_BATCH_SIZE', 500)
+    if grace_minutes is None:
+        grace_minutes = config.get('PHOTO_GC_GRACE_MINUTES', 60)
+
+    upload_folder = config['UPLOAD_FOLDER']
+    cutoff = time.time() - grace_minutes * 60
+    total = 0
+
+    def sweep(entries):
+        names = [entry.name for entry in entries]
+        tracked = set(db.session.scalars(select(PhotoFile.filename).where(PhotoFile.filename.in_(names))))
+        tracked.update(db.session.scalars(select(DevicePhoto.filename).where(DevicePhoto.filename.in_(names))))
+        return sum(
+            1 for entry in entries
+            if entry.name not in tracked and _remove_file(upload_folder, entry.name)
+        )
+
+    if not os.path.isdir(upload_folder):
+        return 0
+
+    batch = []
+    with os.scandir(upload_folder) as entries:
+        for entry in entries:
+            if not entry.is_file() or entry.stat().st_mtime >= cutoff:
+                continue
+            batch.append(entry)
+            if len(batch) >= batch_size:
+                total += sweep(batch)
+                batch = []
+    if batch:
+        total += sweep(batch)
+
+    db.session.rollback()
+    current_app.logger.info(f"Видалено файлів поза маніфестом: {total}")
+    return total
+
+
+@event.listens_for(db.session, 'before_flush')
+def _release_deleted_photos(session, flush_context, instances):
+    """Відв'язує файли видалених фото до DELETE (і запам'ятовує їх для видалення з диска)"""
+    photo_ids = [
+        photo.id for photo in session.deleted
+        if isinstance(photo, DevicePhoto) and photo.id is not None
+    ]
+    if not photo_ids:
+        return
+
+    connection = session.connection()
+    filenames = list(connection.scalars(
+        select(PhotoFile.filename).where(PhotoFile.photo_id.in_(photo_ids))
+    ))
+    connection.execute(
+        update(PhotoFile).where(PhotoFile.photo_id.in_(photo_ids))
+        .values(photo_id=None, released_at=datetime.utcnow())
+    )
+    session.info.setdefault(_RELEASED_KEY, []).extend(filenames)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _remove_released_files(session):
+    """Видаляє з диска файли фото, видалених у закоміченій транзакції"""
+    filenames = session.info.pop(_RELEASED_KEY, None)
+    if not filenames:
+        return
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    for filename in filenames:
+        _remove_file(upload_folder, filename)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_released_files(session):
+    session.info.pop(_RELEASED_KEY, None)
+
+
+def register_commands(app):
+    """Реєструє команду flask photo-gc"""
+    import click
+
+    @app.cli.command('photo-gc')
+    @click.option('--scan', is_flag=True, help='Також видалити файли, яких немає в маніфесті')
+    def photo_gc_command(scan):
+        """Видаляє файли видалених фото (та, з --scan, файли поза маніфестом)"""
+        removed = collect_orphan_photos()
+        print(f"Видалено файлів видалених фото: {removed}")
+        if scan:
+            print(f"Видалено файлів поза маніфестом: {scan_untracked_files()}")
@@ -0,0 +1,239 @@
+"""
+Сховище згенерованих QR-кодів пристроїв
+
+Є два види QR-кодів:
+
+* QR_DEVICE - текст пристрою (ID, назва, інвентарний номер, тип, серійний
+  номер, розташування, статус, місто): сторінка та друк QR-коду, PDF-картка,
+  сканер у застосунку шукає в ньому "ID: ...";
+* QR_LABEL - лише інвентарний номер: масовий друк міток і аркуш QR-кодів
+  (на це розраховані сканери інвентаризації).
+
+QR-код зберігається на диску як PNG з іменем <device_id>_<kind>_<hash>.png,
+де hash - SHA-1 тексту. Тож:
+
+* повторні запити віддають готовий файл без qrcode.make();
+* зміна будь-якого з полів дає новий hash - попередні файли пристрою
+  видаляються при генерації нового (інвалідація без окремих подій), але
+  не раніше ніж через QR_STALE_GRACE_MINUTES після заміни: запит, що вже
+  отримав старий шлях, ще може його читати;
+* hash є ETag відповіді, а URL з ?v=<hash> можна кешувати в браузері
+  назавжди (Cache-Control: immutable).
+
+    path, version = qr_store.get(device)
+    path, version = qr_store.get(device, QR_LABEL)
+
+У шаблонах версіонований URL повертає qr_code_url(device[, 'label']).
+
+render_qr_sheet() збирає багато QR-кодів в один PDF (сітка міток з
+інвентарними номерами) для масового друку.
+"""
+
+import glob
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+
+import qrcode
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from reportlab.pdfgen import canvas
+
+
+QR_DEVICE = 'device'
+QR_LABEL = 'label'
+QR_KINDS = (QR_DEVICE, QR_LABEL)
+
+
+def qr_payload(device, kind=QR_DEVICE):
+    """Текст QR-коду пристрою (для міток - лише інвентарний номер)"""
+    if kind == QR_LABEL:
+        return device.inventory_number or ''
+    return '\n'.join([
+        f'ID: {device.id}',
+        f'Назва: {device.name}',
+        f'Інв. номер: {device.inventory_number}',
+        f'Тип: {device.type}',
+        f'S/N: {device.serial_number}',
+        f'Розташування: {device.location}',
+        f'Статус: {device.status}',
+        f'Місто: {device.city.name if device.city else ""}',
+    ])
+
+
+def render_qr_png(payload, box_size=10, border=4):
+    """
+    Генерує PNG з QR-кодом
+
+    Returns:
+        bytes: Вміст PNG
+    """
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=box_size,
+        border=border,
+    )
+    qr.add_data(payload)
+    qr.make(fit=True)
+
+    buffer = io.BytesIO()
+    qr.make_image(fill_color='black', back_color='white').save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class QRAssetStore:
+    """Дисковий кеш PNG з QR-кодами пристроїв, адресований хешем вмісту"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.renders = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Реєструє сховище в додатку (app.extensions['qr_store'])"""
+        if not app.config.get('QR_CACHE_FOLDER'):
+            app.config['QR_CACHE_FOLDER'] = os.path.join(app.instance_path, 'qr_cache')
+        app.config.setdefault('QR_CODE_BOX_SIZE', 10)
+        app.config.setdefault('QR_CODE_BORDER', 4)
+        app.config.setdefault('QR_STALE_GRACE_MINUTES', 60)
+
+        self.app = app
+        app.extensions['qr_store'] = self
+        app.add_template_global(self.url_for_device, 'qr_code_url')
+
+    def url_for_device(self, device, kind=QR_DEVICE):
+        """Версіонований URL QR-коду пристрою (кешується браузером назавжди)"""
+        from flask import url_for
+        if kind == QR_DEVICE:
+            return url_for('devices.device_qrcode', device_id=device.id, v=self.version(device))
+        return url_for('devices.device_qrcode', device_id=device.id, kind=kind, v=self.version(device, kind))
+
+    @property
+    def folder(self):
+        return self.app.config['QR_CACHE_FOLDER']
+
+    def version(self, device, kind=QR_DEVICE):
+        """Хеш тексту QR-коду пристрою (ETag та параметр v для URL)"""
+        settings = f"{self.app.config['QR_CODE_BOX_SIZE']}:{self.app.config['QR_CODE_BORDER']}"
+        return hashlib.sha1(f'{settings}\n{qr_payload(device, kind)}'.encode('utf-8')).hexdigest()[:20]
+
+    def _path(self, device_id, kind, version):
+        return os.path.join(self.folder, f'{device_id}_{kind}_{version}.png')
+
+    def get(self, device, kind=QR_DEVICE):
+        """
+        Повертає шлях до PNG з QR-кодом пристрою (генерує за потреби)
+
+        Args:
+            device: Пристрій
+            kind: QR_DEVICE або QR_LABEL
+
+        Returns:
+            tuple: (шлях до файлу, версія)
+        """
+        version = self.version(device, kind)
+        path = self._path(device.id, kind, version)
+        if os.path.exists(path):
+            self.hits += 1
+            return path, version
+
+        png = render_qr_png(
+            qr_payload(device, kind),
+            box_size=self.app.config['QR_CODE_BOX_SIZE'],
+            border=self.app.config['QR_CODE_BORDER']
+        )
+        os.makedirs(self.folder, exist_ok=True)
+        # Запис через тимчасовий файл - паралельні запити не бачать недописаний PNG
+        fd, tmp_path = tempfile.mkstemp(dir=self.folder, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as tmp_file:
+            tmp_file.write(png)
+        os.replace(tmp_path, path)
+        self.renders += 1
+
+        self._remove_stale(device.id, kind)
+        return path, version
+
+    def _device_files(self, device_id, kind=None):
+        """Файли QR-кодів пристрою (усіх видів, якщо kind не вказано) від найстарішого до найновішого"""
+        pattern = f'{device_id}_{kind}_*.png' if kind else f'{device_id}_*.png'
+        files = []
+        for path in glob.glob(os.path.join(self.folder, pattern)):
+            try:
+                files.append((os.stat(path).st_mtime, path))
+            except OSError:
+                pass
+        return sorted(files)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _remove_stale(self, device_id, kind):
+        """
+        Видаляє попередні версії QR-коду пристрою цього виду, замінені понад
+        QR_STALE_GRACE_MINUTES тому
+
+        Час заміни версії - mtime наступної за нею (новішої) версії.
+        """
+        cutoff = time.time() - self.app.config['QR_STALE_GRACE_MINUTES'] * 60
+        with self._lock:
+            files = self._device_files(device_id, kind)
+            for (_, stale), (superseded_at, _) in zip(files, files[1:]):
+                if superseded_at < cutoff:
+                    self._remove(stale)
+
+    def discard(self, device_id):
+        """Видаляє QR-коди пристрою (пристрій видалено)"""
+        with self._lock:
+            for _, path in self._device_files(device_id):
+                self._remove(path)
+
+    def stats(self):
+        return {'hits': self.hits, 'renders': self.renders}
+
+
+qr_store = QRAssetStore()
+
+
+def render_qr_sheet(labels, columns=4, qr_size=4 * cm, margin=1 * cm):
+    """
+    Формує PDF аркуш(і) A4 з сіткою QR-кодів
+
+    Args:
+        labels: Список (шлях до PNG, підпис)
+        columns: Кількість колонок
+        qr_size: Розмір QR-коду
+        margin: Поля сторінки
+
+    Returns:
+        bytes: Вміст PDF
+    """
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    page_width, page_height = A4
+    cell_width = (page_width - 2 * margin) / columns
+    cell_height = qr_size + 0.8 * cm
+    rows = max(1, int((page_height - 2 * margin) // cell_height))
+
+    for index, (path, caption) in enumerate(labels):
+        position = index % (columns * rows)
+        if index and position == 0:
+            pdf.showPage()
+        row, column = divmod(position, columns)
+        x = margin + column * cell_width + (cell_width - qr_size) / 2
+        y = page_height - margin - (row + 1) * cell_height + 0.8 * cm
+        pdf.drawImage(path, x, y, width=qr_size, height=qr_size)
+        pdf.setFont('Helvetica-Bold', 10)
+        pdf.drawCentredString(x + qr_size / 2, y - 0.4 * cm, caption or '')
+
+    pdf.save()
+    return buffer.getvalue()
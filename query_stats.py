@@ -0,0 +1,255 @@
+"""
+Облік SQL-запитів на запит і виявлення N+1
+
+Кожен запит до бази (подія before/after_cursor_execute рушія) рахується в
+лічильнику поточного HTTP-запиту разом із часом виконання. Ледачі
+завантаження зв'язків (do_orm_execute з lazy_loaded_from) рахуються
+окремо по зв'язку (Device.city, DeviceHistory.user...), а повторні
+читання об'єктів після коміту - як Device.<refresh>: якщо те саме
+довантажується QUERY_N_PLUS_ONE_THRESHOLD і більше разів за один запит -
+це N+1, який треба прибрати через joinedload/selectinload (або не
+комітити до рендерингу шаблону).
+
+* у режимі налагодження та в тестах N+1 пишеться в лог як попередження,
+  а відповідь отримує заголовки X-Query-Count / X-Query-Time;
+* з QUERY_N_PLUS_ONE_RAISE = True запит завершується NPlusOneError
+  (для тестів);
+* сумарна кількість запитів по endpoint'ах і останні випадки N+1 -
+  query_inspector.stats() та /admin/api/query-stats.
+
+Поза HTTP-запитом лічильник можна отримати через query_inspector.capture().
+З QUERY_RECORD_STATEMENTS лічильник запиту зберігає також текст SQL
+(перші QUERY_RECORD_STATEMENTS_MAX) - його використовує журнал повільних
+запитів (metrics.py).
+"""
+
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from models import db
+
+
+class NPlusOneError(AssertionError):
+    """Зв'язок довантажувався по одному об'єкту (N+1)"""
+
+
+class QueryCounter:
+    """Запити, час і ледачі завантаження в межах одного запиту або блоку"""
+
+    __slots__ = ('queries', 'seconds', 'lazy_loads', 'statements')
+
+    def __init__(self, record_statements=False):
+        self.queries = 0
+        self.seconds = 0.0
+        self.lazy_loads = Counter()
+        # Текст і тривалість кожного запиту (для журналу повільних запитів)
+        self.statements = [] if record_statements else None
+
+    def n_plus_one(self, threshold):
+        """Зв'язки, довантажені threshold і більше разів"""
+        return sorted(
+            ((relationship, count) for relationship, count in self.lazy_loads.items() if count >= threshold),
+            key=lambda item: -item[1]
+        )
+
+
+class QueryInspector:
+    """Лічильники SQL-запитів по запитах і endpoint'ах"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._listening = False
+        self.endpoints = {}
+        self.recent_n_plus_one = deque(maxlen=50)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Реєструє облік запитів у додатку (app.extensions['query_inspector'])"""
+        app.config.setdefault('QUERY_STATS_ENABLED', True)
+        app.config.setdefault('QUERY_STATS_HEADERS', None)  # None - у налагодженні та тестах
+        app.config.setdefault('QUERY_N_PLUS_ONE_THRESHOLD', 5)
+        app.config.setdefault('QUERY_N_PLUS_ONE_RAISE', False)
+        app.config.setdefault('QUERY_RECORD_STATEMENTS', False)
+        app.config.setdefault('QUERY_RECORD_STATEMENTS_MAX', 100)
+
+        self.app = app
+        app.extensions['query_inspector'] = self
+
+        if not self._listening:
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            event.listen(db.session, 'do_orm_execute', self._on_orm_execute)
+            self._listening = True
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.teardown_request(self._teardown_request)
+
+    # ------------------------------------------------------------------
+    # Активні лічильники потоку (вкладені: запит, capture())
+
+    @property
+    def _max_statements(self):
+        return self.app.config['QUERY_RECORD_STATEMENTS_MAX'] if self.app is not None else 100
+
+    def _active(self):
+        return getattr(self._local, 'counters', None)
+
+    def _push(self, counter):
+        counters = self._active()
+        if counters is None:
+            counters = self._local.counters = []
+        counters.append(counter)
+
+    def _pop(self, counter):
+        counters = self._active()
+        if counters and counter in counters:
+            counters.remove(counter)
+
+    @contextmanager
+    def capture(self):
+        """
+        Рахує запити всередині блоку (тести, команди CLI)
+
+        Yields:
+            QueryCounter
+        """
+        counter = QueryCounter()
+        self._push(counter)
+        try:
+            yield counter
+        finally:
+            self._pop(counter)
+
+    # ------------------------------------------------------------------
+    # Події SQLAlchemy
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self._active():
+            conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        counters = self._active()
+        started = conn.info.get('query_started')
+        if not counters or not started:
+            return
+        elapsed = time.perf_counter() - started.pop()
+        for counter in counters:
+            counter.queries += 1
+            counter.seconds += elapsed
+            if counter.statements is not None and len(counter.statements) < self._max_statements:
+                counter.statements.append((statement, elapsed))
+
+    def _on_orm_execute(self, orm_execute_state):
+        counters = self._active()
+        if not counters or not orm_execute_state.is_select:
+            return
+        if orm_execute_state.lazy_loaded_from is not None:
+            key = str(orm_execute_state.loader_strategy_path.prop)
+        elif orm_execute_state.is_column_load and orm_execute_state.bind_mapper is not None:
+            # Повторне читання об'єкта після коміту (expire_on_commit) - теж запит на кожен рядок
+            key = f'{orm_execute_state.bind_mapper.class_.__name__}.<refresh>'
+        else:
+            return
+        for counter in counters:
+            counter.lazy_loads[key] += 1
+
+    # ------------------------------------------------------------------
+    # Запит Flask
+
+    def _start_request(self):
+        config = self.app.config
+        if not config['QUERY_STATS_ENABLED']:
+            return
+        g.query_counter = QueryCounter(record_statements=config['QUERY_RECORD_STATEMENTS'])
+        self._push(g.query_counter)
+
+    def _finish_request(self, response):
+        counter = g.get('query_counter')
+        if counter is None:
+            return response
+
+        endpoint = request.endpoint or 'unknown'
+        config = self.app.config
+        detected = counter.n_plus_one(config['QUERY_N_PLUS_ONE_THRESHOLD'])
+        self._record(endpoint, counter, detected)
+
+        headers = config['QUERY_STATS_HEADERS']
+        if headers is None:
+            headers = self.app.debug or self.app.testing
+        if headers:
+            response.headers['X-Query-Count'] = str(counter.queries)
+            response.headers['X-Query-Time'] = f'{counter.seconds * 1000:.1f}ms'
+
+        if detected:
+            message = f"N+1 у {endpoint}: " + ', '.join(f'{rel} x{count}' for rel, count in detected)
+            if self.app.debug or self.app.testing:
+                self.app.logger.warning(message)
+            if config['QUERY_N_PLUS_ONE_RAISE']:
+                raise NPlusOneError(message)
+        return response
+
+    def _teardown_request(self, exc):
+        counter = g.pop('query_counter', None)
+        if counter is not None:
+            self._pop(counter)
+
+    def _record(self, endpoint, counter, detected):
+        with self._lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = {
+                    'requests': 0, 'queries': 0, 'max_queries': 0, 'seconds': 0.0, 'n_plus_one': 0,
+                }
+            stats['requests'] += 1
+            stats['queries'] += counter.queries
+            stats['max_queries'] = max(stats['max_queries'], counter.queries)
+            stats['seconds'] += counter.seconds
+            if detected:
+                stats['n_plus_one'] += 1
+                self.recent_n_plus_one.append({
+                    'endpoint': endpoint,
+                    'relationships': dict(detected),
+                    'queries': counter.queries,
+                    'at': time.time(),
+                })
+
+    def stats(self):
+        """
+        Кількість запитів по endpoint'ах (за спаданням середньої) та останні N+1
+
+        Returns:
+            dict: endpoints, n_plus_one
+        """
+        with self._lock:
+            endpoints = [
+                {
+                    'endpoint': endpoint,
+                    'requests': stats['requests'],
+                    'avg_queries': round(stats['queries'] / stats['requests'], 1),
+                    'max_queries': stats['max_queries'],
+                    'avg_ms': round(stats['seconds'] * 1000 / stats['requests'], 2),
+                    'n_plus_one': stats['n_plus_one'],
+                }
+                for endpoint, stats in self.endpoints.items()
+            ]
+            recent = list(self.recent_n_plus_one)
+        endpoints.sort(key=lambda item: -item['avg_queries'])
+        return {'endpoints': endpoints, 'n_plus_one': recent}
+
+    def reset(self):
+        with self._lock:
+            self.endpoints.clear()
+            self.recent_n_plus_one.clear()
+
+
+query_inspector = QueryInspector()
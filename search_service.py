@@ -0,0 +1,187 @@
+"""
+Сервіс повнотекстового пошуку пристроїв
+
+- SQLite: віртуальна таблиця FTS5 з токенізатором trigram (пошук підрядка без
+  урахування регістру, включно з кирилицею). Таблиця синхронізується тригерами
+  на INSERT/UPDATE/DELETE таблиці device.
+- PostgreSQL: GIN-індекси pg_trgm на текстових полях, які використовуються
+  звичайними ILIKE '%q%' фільтрами.
+
+Усі endpoint'и пошуку пристроїв мають використовувати apply_device_search().
+"""
+
+from sqlalchemy import event, or_, text
+from sqlalchemy.exc import DBAPIError
+
+from models import db, Device
+
+# Поля пристрою, що індексуються для пошуку
+DEVICE_SEARCH_FIELDS = ('name', 'type', 'serial_number', 'inventory_number', 'location', 'notes')
+
+FTS_TABLE = 'device_fts'
+
+# Токенізатор trigram не знаходить підрядки коротші за 3 символи
+FTS_MIN_QUERY_LENGTH = 3
+
+# Кеш наявності FTS індексу для кожного engine: {id(engine): bool}
+_fts_available = {}
+
+
+def _sqlite_ddl():
+    """Повертає DDL для FTS5 таблиці та тригерів синхронізації"""
+    columns = ', '.join(DEVICE_SEARCH_FIELDS)
+    new_values = ', '.join(f'new.{field}' for field in DEVICE_SEARCH_FIELDS)
+    old_values = ', '.join(f'old.{field}' for field in DEVICE_SEARCH_FIELDS)
+
+    return [
+        f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+            {columns}, content='device', content_rowid='id', tokenize='trigram'
+        )""",
+        f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON device BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {new_values});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON device BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF {columns} ON device BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+            INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {new_values});
+        END""",
+    ]
+
+
+def _postgresql_ddl():
+    """Повертає DDL для pg_trgm індексів"""
+    statements = ['CREATE EXTENSION IF NOT EXISTS pg_trgm']
+    for field in DEVICE_SEARCH_FIELDS:
+        statements.append(
+            f'CREATE INDEX IF NOT EXISTS ix_device_{field}_trgm ON device USING gin ({field} gin_trgm_ops)'
+        )
+    return statements
+
+
+def create_search_index(connection):
+    """
+    Створює пошуковий індекс для поточної СУБД
+
+    Args:
+        connection: SQLAlchemy Connection
+
+    Returns:
+        bool: True якщо індекс створено або вже існує
+    """
+    dialect = connection.dialect.name
+
+    if dialect == 'sqlite':
+        statements = _sqlite_ddl()
+    elif dialect == 'postgresql':
+        statements = _postgresql_ddl()
+    else:
+        return False
+
+    try:
+        # Savepoint, щоб помилка (немає FTS5 або прав на EXTENSION) не зламала create_all
+        with connection.begin_nested():
+            for statement in statements:
+                connection.execute(text(statement))
+    except DBAPIError as e:
+        print(f"Пошуковий індекс недоступний ({dialect}): {e}")
+        _fts_available[id(connection.engine)] = False
+        return False
+
+    _fts_available[id(connection.engine)] = dialect == 'sqlite'
+    return True
+
+
+def drop_search_index(connection):
+    """Видаляє FTS таблицю (тригери SQLite видаляються разом з таблицею device)"""
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text(f'DROP TABLE IF EXISTS {FTS_TABLE}'))
+    _fts_available.pop(id(connection.engine), None)
+
+
+def rebuild_search_index():
+    """
+    Створює (за потреби) та повністю перебудовує пошуковий індекс
+
+    Використовується для існуючих баз даних, створених до появи індексу.
+
+    Returns:
+        bool: True якщо індекс перебудовано
+    """
+    with db.engine.begin() as connection:
+        if not create_search_index(connection):
+            return False
+        if connection.dialect.name == 'sqlite':
+            connection.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+        elif connection.dialect.name == 'postgresql':
+            connection.execute(text('ANALYZE device'))
+    return True
+
+
+def ensure_search_index():
+    """Створює та заповнює пошуковий індекс, якщо його ще немає (перший запит процесу)"""
+    if db.engine.dialect.name == 'sqlite' and is_fts_available():
+        return True
+    return rebuild_search_index()
+
+
+def is_fts_available():
+    """Перевіряє, чи є FTS5 таблиця в поточній базі SQLite"""
+    engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return False
+
+    key = id(engine)
+    if key not in _fts_available:
+        with engine.connect() as connection:
+            exists = connection.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {'name': FTS_TABLE}
+            ).first()
+        _fts_available[key] = exists is not None
+    return _fts_available[key]
+
+
+def _fts_match_expression(search, fields):
+    """Формує вираз FTS5 MATCH: фраза з екранованими лапками, обмежена колонками"""
+    phrase = '"' + search.replace('"', '""') + '"'
+    return '{' + ' '.join(fields) + '} : ' + phrase
+
+
+def apply_device_search(query, search, fields=DEVICE_SEARCH_FIELDS):
+    """
+    Додає до запиту фільтр пошуку підрядка по полях пристрою
+
+    Args:
+        query: Запит Device.query
+        search: Рядок пошуку
+        fields: Поля пристрою для пошуку (підмножина DEVICE_SEARCH_FIELDS)
+
+    Returns:
+        Query: Відфільтрований запит
+    """
+    search = (search or '').strip()
+    if not search:
+        return query
+
+    if len(search) >= FTS_MIN_QUERY_LENGTH and is_fts_available():
+        fts_ids = text(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :fts_query'
+        ).bindparams(fts_query=_fts_match_expression(search, fields))
+        return query.filter(Device.id.in_(fts_ids.columns(rowid=db.Integer)))
+
+    # PostgreSQL (через pg_trgm індекси), короткі запити та бази без FTS5
+    return query.filter(or_(*[getattr(Device, field).ilike(f'%{search}%') for field in fields]))
+
+
+@event.listens_for(Device.__table__, 'after_create')
+def _create_search_index_after_device_table(target, connection, **kw):
+    """Створює пошуковий індекс разом з таблицею device (db.create_all)"""
+    create_search_index(connection)
+
+
+@event.listens_for(Device.__table__, 'before_drop')
+def _drop_search_index_before_device_table(target, connection, **kw):
+    """Видаляє FTS таблицю разом з таблицею device (db.drop_all)"""
+    drop_search_index(connection)
@@ -0,0 +1,108 @@
+"""
+Відстеження активності сесій користувачів
+
+Час останньої активності сесії запам'ятовується в пам'яті процесу, а фоновий
+потік раз на SESSION_ACTIVITY_WRITE_INTERVAL секунд записує всі накопичені
+значення одним executemany. Тож кожна сесія оновлюється в базі не частіше
+ніж раз на інтервал, а запит не робить ні SELECT, ні коміту.
+
+Статичні файли, мініатюри фото та health-check'и не вважаються активністю
+і пропускаються ще до завантаження користувача (current_user).
+
+cleanup_expired_sessions() спочатку викликає flush(), щоб працювати з
+актуальними значеннями last_activity.
+"""
+
+import threading
+from datetime import datetime
+
+from sqlalchemy import bindparam, update
+
+from batch_flusher import BatchFlusher
+from models import db, UserSession
+
+# Endpoint'и, які не оновлюють активність сесії
+SKIP_ENDPOINTS = frozenset({
+    'static',
+    'devices.uploaded_file',
+    'health_check',
+    'readiness_check',
+    'metrics',
+})
+
+
+class SessionActivityTracker(BatchFlusher):
+    """Накопичує last_activity сесій і пише їх у базу пакетами"""
+
+    thread_name = 'session-activity-flusher'
+
+    def __init__(self, app=None):
+        super().__init__()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.written = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Реєструє трекер у додатку (app.extensions['session_activity'])"""
+        app.config.setdefault('SESSION_ACTIVITY_WRITE_INTERVAL', 60)
+
+        self.app = app
+        app.extensions['session_activity'] = self
+
+    def flush_interval(self):
+        return self.app.config['SESSION_ACTIVITY_WRITE_INTERVAL']
+
+    @staticmethod
+    def should_track(endpoint):
+        """Чи вважати запит до endpoint активністю користувача"""
+        return endpoint is not None and endpoint not in SKIP_ENDPOINTS
+
+    def touch(self, session_id):
+        """Фіксує активність сесії (запис у базу - у фоні)"""
+        with self._lock:
+            self._pending[session_id] = datetime.utcnow()
+        # У тестах потік не запускається - значення записуються через flush()
+        if not self.app.testing:
+            self._ensure_started()
+
+    def discard(self, session_id):
+        """Забуває ненаписану активність (сесію завершено)"""
+        with self._lock:
+            self._pending.pop(session_id, None)
+
+    def _take(self):
+        """Забирає накопичену активність: {session_id: last_activity}"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def _write(self, pending):
+        """Записує активність сесій одним executemany у власному контексті додатку"""
+        table = UserSession.__table__
+        statement = (
+            update(table)
+            .where(table.c.session_id == bindparam('b_session_id'), table.c.is_active == True)
+            .values(last_activity=bindparam('b_last_activity'))
+        )
+        with self.app.app_context():
+            try:
+                db.session.execute(statement, [
+                    {'b_session_id': session_id, 'b_last_activity': last_activity}
+                    for session_id, last_activity in pending.items()
+                ])
+                db.session.commit()
+                self.written += len(pending)
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.error(f"Помилка запису активності сесій: {e}")
+            finally:
+                db.session.remove()
+
+    def stats(self):
+        with self._lock:
+            return {'pending': len(self._pending), 'written': self.written}
+
+
+session_activity = SessionActivityTracker()
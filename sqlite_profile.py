@@ -0,0 +1,408 @@
+"""
+Профіль рушія SQLite для одночасної роботи кількох користувачів
+
+За замовчуванням SQLite працює з журналом відкату (journal_mode=DELETE):
+кожен коміт (log_user_activity, update_session_activity...) бере
+ексклюзивне блокування файлу, і читачі чекають на нього. Профіль на
+кожному новому з'єднанні виставляє:
+
+* journal_mode=WAL - читачі не блокуються записом і навпаки;
+* synchronous=NORMAL - у WAL надійно при збої процесу, fsync лише на
+  контрольних точках, а не на кожен коміт;
+* busy_timeout - скільки чекати на блокування іншого записувача замість
+  негайного "database is locked";
+* cache_size, mmap_size, temp_store - кеш сторінок, читання через mmap і
+  тимчасові таблиці (сортування, GROUP BY) у пам'яті;
+* journal_size_limit - до якого розміру обрізати файл -wal після
+  контрольної точки.
+
+Контрольна точка WAL (checkpoint) виконується планувальником кожні
+SQLITE_CHECKPOINT_MINUTES, а вночі - PRAGMA optimize (оновлення
+статистики планувальника запитів) з TRUNCATE-контрольною точкою.
+
+Порівняння пропускної здатності з журналом відкату:
+
+    flask sqlite-benchmark --seconds 10 --readers 4 --writers 2
+
+Для PostgreSQL (DATABASE_URL) профіль нічого не робить.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
+
+from models import db
+
+JOURNAL_MODES = frozenset({'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'})
+SYNCHRONOUS_MODES = frozenset({'OFF', 'NORMAL', 'FULL', 'EXTRA'})
+TEMP_STORE_MODES = frozenset({'DEFAULT', 'FILE', 'MEMORY'})
+CHECKPOINT_MODES = frozenset({'PASSIVE', 'FULL', 'RESTART', 'TRUNCATE'})
+
+
+def _choice(value, allowed, name):
+    value = str(value).upper()
+    if value not in allowed:
+        raise ValueError(f"{name}: недопустиме значення {value!r} (можливі: {', '.join(sorted(allowed))})")
+    return value
+
+
+def is_memory_database(url):
+    """Чи є URL рушія базою в пам'яті (там WAL і mmap не застосовуються)"""
+    database = url.database or ''
+    return database in ('', ':memory:') or url.query.get('mode') == 'memory'
+
+
+def pragma_statements(config, memory=False):
+    """
+    PRAGMA для нового з'єднання за налаштуваннями SQLITE_*
+
+    Args:
+        config: Конфігурація додатку (dict-подібна)
+        memory: База в пам'яті (без journal_mode, mmap_size, journal_size_limit)
+
+    Returns:
+        list: Рядки PRAGMA у порядку виконання
+    """
+    statements = [f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT_MS'])}"]
+    if not memory:
+        journal_mode = _choice(config['SQLITE_JOURNAL_MODE'], JOURNAL_MODES, 'SQLITE_JOURNAL_MODE')
+        statements.append(f'PRAGMA journal_mode={journal_mode}')
+        statements.append(f"PRAGMA journal_size_limit={int(config['SQLITE_JOURNAL_SIZE_LIMIT'])}")
+        statements.append(f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}")
+    synchronous = _choice(config['SQLITE_SYNCHRONOUS'], SYNCHRONOUS_MODES, 'SQLITE_SYNCHRONOUS')
+    statements.append(f'PRAGMA synchronous={synchronous}')
+    # Від'ємне значення - розмір у КіБ, а не в сторінках
+    statements.append(f"PRAGMA cache_size=-{int(config['SQLITE_CACHE_SIZE_KB'])}")
+    temp_store = _choice(config['SQLITE_TEMP_STORE'], TEMP_STORE_MODES, 'SQLITE_TEMP_STORE')
+    statements.append(f'PRAGMA temp_store={temp_store}')
+    return statements
+
+
+def apply_pragmas(dbapi_connection, statements):
+    """Виконує PRAGMA на сирому з'єднанні sqlite3 (поза подіями рушія)"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for statement in statements:
+            cursor.execute(statement)
+    finally:
+        cursor.close()
+
+
+def listen_pragmas(engine, statements):
+    """Виконує statements на кожному новому з'єднанні рушія"""
+    def on_connect(dbapi_connection, connection_record):
+        apply_pragmas(dbapi_connection, statements)
+
+    event.listen(engine, 'connect', on_connect)
+    return on_connect
+
+
+class SQLiteProfile:
+    """PRAGMA для рушіїв SQLite та їх обслуговування з планувальника"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.engines = []
+        self.last_checkpoint = None
+        self.last_optimize = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Вмикає профіль для рушіїв SQLite додатку (app.extensions['sqlite_profile'])"""
+        app.config.setdefault('SQLITE_PRAGMAS_ENABLED', True)
+        app.config.setdefault('SQLITE_JOURNAL_MODE', 'WAL')
+        app.config.setdefault('SQLITE_SYNCHRONOUS', 'NORMAL')
+        app.config.setdefault('SQLITE_BUSY_TIMEOUT_MS', 5000)
+        app.config.setdefault('SQLITE_CACHE_SIZE_KB', 64 * 1024)
+        app.config.setdefault('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)
+        app.config.setdefault('SQLITE_TEMP_STORE', 'MEMORY')
+        app.config.setdefault('SQLITE_JOURNAL_SIZE_LIMIT', 64 * 1024 * 1024)
+        app.config.setdefault('SQLITE_CHECKPOINT_MINUTES', 30)
+        app.config.setdefault('SQLITE_CHECKPOINT_MODE', 'PASSIVE')
+
+        self.app = app
+        app.extensions['sqlite_profile'] = self
+        if not app.config['SQLITE_PRAGMAS_ENABLED']:
+            return
+
+        with app.app_context():
+            engines = list(db.engines.values())
+        for engine in engines:
+            if engine.dialect.name != 'sqlite' or engine in self.engines:
+                continue
+            memory = is_memory_database(engine.url)
+            listen_pragmas(engine, pragma_statements(app.config, memory=memory))
+            # З'єднання, відкриті до реєстрації події, профілю не мають
+            engine.dispose()
+            self.engines.append(engine)
+
+    @property
+    def enabled(self):
+        return bool(self.engines)
+
+    def _file_engines(self):
+        return [engine for engine in self.engines if not is_memory_database(engine.url)]
+
+    def checkpoint(self, mode=None):
+        """
+        Контрольна точка WAL: переносить сторінки з -wal у файл бази
+
+        Args:
+            mode: PASSIVE, FULL, RESTART або TRUNCATE (за замовчуванням SQLITE_CHECKPOINT_MODE)
+
+        Returns:
+            list: По рушію - database, busy, log_pages, checkpointed_pages, seconds
+        """
+        mode = _choice(mode or self.app.config['SQLITE_CHECKPOINT_MODE'], CHECKPOINT_MODES, 'mode')
+        results = []
+        for engine in self._file_engines():
+            started = time.perf_counter()
+            with engine.connect() as connection:
+                busy, log_pages, checkpointed = connection.exec_driver_sql(
+                    f'PRAGMA wal_checkpoint({mode})'
+                ).one()
+            result = {
+                'database': engine.url.database,
+                'mode': mode,
+                'busy': bool(busy),
+                'log_pages': log_pages,
+                'checkpointed_pages': checkpointed,
+                'seconds': round(time.perf_counter() - started, 3),
+            }
+            if busy:
+                self.app.logger.warning(
+                    f"Контрольна точка WAL ({mode}) не завершена: база зайнята, "
+                    f"перенесено {checkpointed} з {log_pages} сторінок"
+                )
+            results.append(result)
+        with self._lock:
+            self.last_checkpoint = {'at': time.time(), 'results': results}
+        return results
+
+    def optimize(self):
+        """
+        PRAGMA optimize (статистика для планувальника запитів) і TRUNCATE-контрольна точка
+
+        Returns:
+            dict: optimize (секунди по базах), checkpoint
+        """
+        timings = {}
+        for engine in self._file_engines():
+            started = time.perf_counter()
+            with engine.connect() as connection:
+                connection.exec_driver_sql('PRAGMA optimize')
+            timings[engine.url.database] = round(time.perf_counter() - started, 3)
+        checkpoint = self.checkpoint('TRUNCATE')
+        with self._lock:
+            self.last_optimize = {'at': time.time(), 'seconds': timings}
+        self.app.logger.info(f"PRAGMA optimize виконано: {timings}")
+        return {'optimize': timings, 'checkpoint': checkpoint}
+
+    def stats(self):
+        """
+        Фактичні PRAGMA з'єднань і результати останнього обслуговування
+
+        Returns:
+            dict: enabled, databases, last_checkpoint, last_optimize
+        """
+        databases = []
+        for engine in self.engines:
+            with engine.connect() as connection:
+                values = {
+                    name: connection.exec_driver_sql(f'PRAGMA {name}').scalar()
+                    for name in ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size',
+                                 'mmap_size', 'temp_store')
+                }
+            databases.append({'database': engine.url.database or ':memory:', **values})
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'databases': databases,
+                'last_checkpoint': self.last_checkpoint,
+                'last_optimize': self.last_optimize,
+            }
+
+    def register_commands(self, app):
+        """Реєструє команди flask sqlite-benchmark та flask sqlite-optimize"""
+        import click
+
+        @app.cli.command('sqlite-benchmark')
+        @click.option('--seconds', type=float, default=5.0, help='Тривалість кожного прогону')
+        @click.option('--readers', type=int, default=4, help='Потоків читання')
+        @click.option('--writers', type=int, default=1, help='Потоків запису')
+        @click.option('--devices', type=int, default=5000, help='Рядків у тестовій таблиці пристроїв')
+        def sqlite_benchmark_command(seconds, readers, writers, devices):
+            """Пропускна здатність читання/запису: журнал відкату проти профілю SQLITE_*"""
+            print(f"Читачів: {readers}, записувачів: {writers}, {seconds:g} с на прогін")
+            report = compare_profiles(app.config, seconds, readers, writers, devices)
+            for label, key in (('Журнал відкату', 'rollback'), ('Профіль', 'profile')):
+                result = report[key]
+                print(
+                    f"  {label:<16} journal_mode={result['journal_mode']:<8} "
+                    f"читань/с: {result['reads_per_second']:>10.1f}  "
+                    f"записів/с: {result['writes_per_second']:>9.1f}  "
+                    f"помилок блокування: {result['errors']}"
+                )
+            print(f"Прискорення: читання x{report['read_speedup']}, запис x{report['write_speedup']}")
+
+        @app.cli.command('sqlite-optimize')
+        def sqlite_optimize_command():
+            """PRAGMA optimize і TRUNCATE-контрольна точка WAL"""
+            if not self.enabled:
+                print("Профіль SQLite не активний (інша база або SQLITE_PRAGMAS_ENABLED=false)")
+                return
+            report = self.optimize()
+            for result in report['checkpoint']:
+                print(f"{result['database']}: контрольна точка {result['checkpointed_pages']}/"
+                      f"{result['log_pages']} сторінок, зайнято: {'так' if result['busy'] else 'ні'}")
+
+
+sqlite_profile = SQLiteProfile()
+
+
+# ----------------------------------------------------------------------
+# Порівняльний тест: журнал відкату проти профілю WAL
+
+BENCHMARK_SCHEMA = (
+    'CREATE TABLE device (id INTEGER PRIMARY KEY, name TEXT NOT NULL, city_id INTEGER NOT NULL, '
+    'status TEXT NOT NULL)',
+    'CREATE INDEX ix_device_city_id ON device (city_id)',
+    'CREATE TABLE user_activity (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, '
+    'action TEXT NOT NULL, created_at REAL NOT NULL)',
+)
+
+# Читання - як у списку пристроїв: сторінка пристроїв міста і кількість
+BENCHMARK_READS = (
+    'SELECT id, name, status FROM device WHERE city_id = ? ORDER BY id LIMIT 20',
+    'SELECT count(*) FROM device WHERE city_id = ?',
+)
+
+# Запис - як log_user_activity: один рядок і коміт
+BENCHMARK_WRITE = 'INSERT INTO user_activity (user_id, action, created_at) VALUES (?, ?, ?)'
+
+
+def _benchmark_worker(engine, kind, index, deadline, cities, counts, errors):
+    done = 0
+    failed = 0
+    with engine.connect() as connection:
+        while time.perf_counter() < deadline:
+            try:
+                if kind == 'read':
+                    city_id = done % cities + 1
+                    for statement in BENCHMARK_READS:
+                        connection.exec_driver_sql(statement, (city_id,)).all()
+                    connection.rollback()
+                else:
+                    connection.exec_driver_sql(BENCHMARK_WRITE, (index, 'benchmark', time.time()))
+                    connection.commit()
+                done += 1
+            except OperationalError:
+                # "database is locked" після busy_timeout
+                connection.rollback()
+                failed += 1
+    counts.append((kind, done))
+    errors.append(failed)
+
+
+def run_benchmark(path, statements, seconds=5.0, readers=4, writers=1, devices=5000, cities=20,
+                  engine_options=None):
+    """
+    Одночасні читання та записи в окремому файлі бази з заданими PRAGMA
+
+    Args:
+        path: Шлях до нового файлу бази
+        statements: PRAGMA для кожного з'єднання ([] - налаштування SQLite за замовчуванням)
+        seconds: Тривалість вимірювання
+        readers: Потоків читання
+        writers: Потоків запису
+        devices: Рядків у таблиці пристроїв
+        cities: Кількість міст
+        engine_options: Додаткові параметри create_engine
+
+    Returns:
+        dict: journal_mode, reads, writes, reads_per_second, writes_per_second, errors
+    """
+    engine = create_engine(
+        f'sqlite:///{path}',
+        pool_size=readers + writers,
+        max_overflow=0,
+        **(engine_options or {}),
+    )
+    listen_pragmas(engine, statements)
+    try:
+        with engine.begin() as connection:
+            for statement in BENCHMARK_SCHEMA:
+                connection.exec_driver_sql(statement)
+            connection.exec_driver_sql(
+                'INSERT INTO device (name, city_id, status) VALUES (?, ?, ?)',
+                [(f'Пристрій {i}', i % cities + 1, 'В роботі') for i in range(devices)],
+            )
+        with engine.connect() as connection:
+            journal_mode = connection.exec_driver_sql('PRAGMA journal_mode').scalar()
+
+        counts, errors = [], []
+        deadline = time.perf_counter() + seconds
+        threads = [
+            threading.Thread(target=_benchmark_worker,
+                             args=(engine, kind, index, deadline, cities, counts, errors))
+            for kind, total in (('read', readers), ('write', writers))
+            for index in range(total)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        engine.dispose()
+
+    reads = sum(done for kind, done in counts if kind == 'read')
+    writes = sum(done for kind, done in counts if kind == 'write')
+    return {
+        'journal_mode': journal_mode,
+        'reads': reads,
+        'writes': writes,
+        'reads_per_second': round(reads / elapsed, 1),
+        'writes_per_second': round(writes / elapsed, 1),
+        'errors': sum(errors),
+    }
+
+
+def compare_profiles(config, seconds=5.0, readers=4, writers=1, devices=5000):
+    """
+    Запускає run_benchmark для журналу відкату і для профілю з config
+
+    Args:
+        config: Конфігурація з налаштуваннями SQLITE_*
+        seconds, readers, writers, devices: Параметри run_benchmark
+
+    Returns:
+        dict: rollback, profile (результати run_benchmark), read_speedup, write_speedup
+    """
+    folder = tempfile.mkdtemp(prefix='sqlite-benchmark-')
+    try:
+        # Базовий варіант - як раніше: лише timeout драйвера sqlite3 (5 с)
+        rollback = run_benchmark(os.path.join(folder, 'rollback.db'), [], seconds, readers, writers,
+                                 devices, engine_options={'connect_args': {'timeout': 5}})
+        profile = run_benchmark(os.path.join(folder, 'profile.db'), pragma_statements(config),
+                                seconds, readers, writers, devices)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    def speedup(key):
+        return round(profile[key] / rollback[key], 2) if rollback[key] else None
+
+    return {
+        'rollback': rollback,
+        'profile': profile,
+        'read_speedup': speedup('reads_per_second'),
+        'write_speedup': speedup('writes_per_second'),
+    }
@@ -0,0 +1,143 @@
+"""
+Агрегована статистика пристроїв
+
+Усі лічильники для головної сторінки, API (/api/v1/stats), панелі
+адміністратора та графіків будуються з таблиці device_counters
+(див. device_counters.py) - одним запитом, що читає по рядку на групу
+(місто, статус, тип, місяць), а не по рядку на пристрій. Результат
+зберігається у спільному кеші (cache_service.app_cache) окремо для кожного
+міста (та для всіх міст разом) на STATS_CACHE_TTL секунд з тегами
+'devices' та 'cities', тож після додавання чи списання пристрою статистика
+актуальна в усіх процесах.
+"""
+
+from datetime import date, datetime
+
+from sqlalchemy import select
+
+from cache_service import app_cache
+from models import db, DeviceCounter, City
+
+# Статуси пристроїв, для яких рахуються окремі лічильники
+STATUS_COUNTERS = {
+    'active_devices': 'В роботі',
+    'repair_devices': 'На ремонті',
+    'decommissioned_devices': 'Списано',
+}
+
+MONTHS = 12
+
+CACHE_TAGS = ('devices', 'cities')
+
+
+def last_months(today, count=MONTHS):
+    """
+    Перші дні останніх count календарних місяців (від найстарішого)
+
+    Args:
+        today: Поточна дата
+        count: Кількість місяців
+
+    Returns:
+        list: Об'єкти date
+    """
+    months = []
+    year, month = today.year, today.month
+    for _ in range(count):
+        months.append(date(year, month, 1))
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    months.reverse()
+    return months
+
+
+class DeviceStatsService:
+    """Статистика пристроїв з кешем на рівні міста"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.queries = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Реєструє сервіс у додатку (app.extensions['device_stats'])"""
+        app.config.setdefault('STATS_CACHE_TTL', 60)
+
+        self.app = app
+        app.extensions['device_stats'] = self
+
+    def get(self, city_id=None):
+        """
+        Повертає статистику пристроїв
+
+        Args:
+            city_id: ID міста (None - усі міста)
+
+        Returns:
+            dict: total, by_status, by_type, by_city, by_month
+        """
+        ttl = self.app.config['STATS_CACHE_TTL'] if self.app is not None else 0
+        if ttl <= 0:
+            return self._compute(city_id)
+        return app_cache.get_or_set(
+            f"device_stats:{city_id if city_id is not None else 'all'}",
+            lambda: self._compute(city_id),
+            timeout=ttl,
+            tags=CACHE_TAGS
+        )
+
+    def status_counters(self, city_id=None):
+        """
+        Лічильники для головної сторінки та API
+
+        Returns:
+            dict: total_devices, active_devices, repair_devices, decommissioned_devices
+        """
+        stats = self.get(city_id)
+        counters = {'total_devices': stats['total']}
+        for key, status in STATUS_COUNTERS.items():
+            counters[key] = stats['by_status'].get(status, 0)
+        return counters
+
+    def invalidate(self):
+        """Скидає кеш статистики для всіх міст"""
+        app_cache.invalidate(*CACHE_TAGS)
+
+    def _compute(self, city_id):
+        """Збирає статистику з рядків device_counters (один запит)"""
+        # created_at зберігається в UTC
+        months = last_months(datetime.utcnow().date())
+
+        statement = (
+            select(City.name, DeviceCounter.type, DeviceCounter.status, DeviceCounter.month, DeviceCounter.count)
+            .select_from(DeviceCounter)
+            .outerjoin(City, DeviceCounter.city_id == City.id)
+            .where(DeviceCounter.count > 0)
+        )
+        if city_id is not None:
+            statement = statement.where(DeviceCounter.city_id == city_id)
+
+        total = 0
+        by_status, by_type, by_city = {}, {}, {}
+        by_month = {month_start.strftime('%Y-%m'): 0 for month_start in months}
+        for city_name, device_type, status, month_key, count in db.session.execute(statement):
+            # Порожній рядок у лічильниках означає невказане значення
+            status, device_type = status or None, device_type or None
+            total += count
+            by_status[status] = by_status.get(status, 0) + count
+            by_type[device_type] = by_type.get(device_type, 0) + count
+            by_city[city_name] = by_city.get(city_name, 0) + count
+            if month_key in by_month:
+                by_month[month_key] += count
+        self.queries += 1
+
+        return {
+            'total': total,
+            'by_status': by_status,
+            'by_type': sorted(by_type.items(), key=lambda item: (-item[1], item[0] or '')),
+            'by_city': sorted(by_city.items(), key=lambda item: item[0] or ''),
+            'by_month': [(month_start, by_month[month_start.strftime('%Y-%m')]) for month_start in months],
+        }
+
+
+device_stats = DeviceStatsService()
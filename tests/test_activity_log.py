@@ -0,0 +1,109 @@
+"""
+Тести для асинхронного журналу активності користувачів
+"""
+import unittest
+from unittest import mock
+import sys
+import os
+import time
+
+# Додаємо кореневий каталог проєкту до PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+from models import db, City, User, UserActivity
+from activity_log import ActivityLogSink, activity_log
+from utils import log_user_activity
+
+class ActivityLogTestCase(unittest.TestCase):
+    """Тести для пакетного запису UserActivity"""
+
+    def setUp(self):
+        """Налаштування тестового середовища"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['WTF_CSRF_ENABLED'] = False
+
+        self.app = app
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+
+        self.city = City(name='Тестове місто')
+        db.session.add(self.city)
+        db.session.commit()
+
+        self.user = User(username='activity_user', password_hash='x', city_id=self.city.id)
+        db.session.add(self.user)
+        db.session.commit()
+
+        self.saved_config = {key: app.config[key] for key in (
+            'ACTIVITY_LOG_ASYNC', 'ACTIVITY_LOG_FLUSH_INTERVAL_MS', 'ACTIVITY_LOG_BATCH_SIZE', 'ACTIVITY_LOG_QUEUE_SIZE'
+        )}
+
+    def tearDown(self):
+        """Очищення після тестів"""
+        app.config.update(self.saved_config)
+        app.config['TESTING'] = True
+        app.extensions['activity_log'] = activity_log
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def make_async_sink(self, **config):
+        """Створює окремий sink в асинхронному режимі"""
+        app.config['TESTING'] = False
+        app.config['ACTIVITY_LOG_ASYNC'] = True
+        app.config.update(config)
+        return ActivityLogSink(app)
+
+    def test_sync_mode_in_testing(self):
+        """У режимі тестування запис виконується одразу"""
+        log_user_activity(self.user.id, 'Вхід в систему', '127.0.0.1', '/login')
+        activity = UserActivity.query.one()
+        self.assertEqual(activity.action, 'Вхід в систему')
+        self.assertIsNotNone(activity.timestamp)
+
+    def test_background_batch_flush_on_shutdown(self):
+        """Фоновий потік пише записи пакетами, залишок дописується при зупинці"""
+        sink = self.make_async_sink(ACTIVITY_LOG_FLUSH_INTERVAL_MS=50, ACTIVITY_LOG_BATCH_SIZE=3)
+        for i in range(7):
+            self.assertTrue(sink.submit(self.user.id, f'Дія {i}', '127.0.0.1'))
+        sink.shutdown()
+
+        db.session.expire_all()
+        actions = sorted(a.action for a in UserActivity.query.all())
+        self.assertEqual(actions, [f'Дія {i}' for i in range(7)])
+        stats = sink.stats()
+        self.assertEqual(stats['written'], 7)
+        self.assertEqual(stats['queued'], 0)
+        self.assertGreaterEqual(stats['batches'], 3)
+
+    def test_full_batch_wakes_flusher(self):
+        """Повний пакет пишеться одразу, не чекаючи інтервалу"""
+        sink = self.make_async_sink(ACTIVITY_LOG_FLUSH_INTERVAL_MS=60000, ACTIVITY_LOG_BATCH_SIZE=3)
+        for i in range(3):
+            sink.submit(self.user.id, f'Дія {i}')
+        for _ in range(100):
+            if sink.stats()['written'] == 3:
+                break
+            time.sleep(0.02)
+        self.assertEqual(sink.stats()['written'], 3)
+        sink.shutdown()
+        self.assertEqual(sink.stats()['batches'], 1)
+
+    def test_bounded_queue_drops(self):
+        """Переповнена черга відкидає записи і рахує їх у метриках"""
+        sink = self.make_async_sink(ACTIVITY_LOG_QUEUE_SIZE=2)
+        with mock.patch.object(sink, '_ensure_started'):
+            results = [sink.submit(self.user.id, f'Дія {i}') for i in range(3)]
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(sink.stats()['dropped'], 1)
+
+        self.assertEqual(sink.flush(), 2)
+        db.session.expire_all()
+        self.assertEqual(UserActivity.query.count(), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -43,6 +43,7 @@ class APITestCase(unittest.TestCase):
         # Генеруємо JWT токен для тестів
         from utils import generate_jwt_token
         access_token, refresh_token, token_id = generate_jwt_token(self.user.id, expires_in_days=1)
+        self.token_id = token_id
         
         self.headers = {
             'Authorization': f'Bearer {access_token}',
@@ -240,6 +241,64 @@ class APITestCase(unittest.TestCase):
         self.assertEqual(data['total_devices'], 5)
         self.assertEqual(data['active_devices'], 3)
         self.assertEqual(data['repair_devices'], 2)
+    
+    def test_financial_summary(self):
+        """Фінансовий підсумок парку по містах і типах"""
+        for i in range(3):
+            db.session.add(Device(
+                name=f'Пристрій {i}',
+                type='Комп\'ютер',
+                serial_number=f'FIN_API_SN_{i}',
+                inventory_number=f'2025-{i+1:04d}',
+                purchase_price=1000,
+                city_id=self.city.id
+            ))
+        db.session.commit()
+        
+        response = self.client.get('/api/v1/reports/financial-summary', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        
+        data = json.loads(response.data)
+        self.assertEqual(len(data['groups']), 1)
+        self.assertEqual(data['groups'][0]['city_name'], 'Тестове місто')
+        self.assertEqual(data['totals']['devices'], 3)
+        self.assertEqual(data['totals']['purchase_total'], 3000.0)
+    
+    def test_verified_token_cache(self):
+        """Тест кешу перевірених токенів: повторний запит без звернень до api_token/blacklist"""
+        from sqlalchemy import event
+        from models import ApiToken
+        
+        response = self.client.get('/api/v1/cities', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        
+        statements = []
+        
+        def collect(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        
+        event.listen(db.engine, 'before_cursor_execute', collect)
+        try:
+            response = self.client.get('/api/v1/cities', headers=self.headers)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', collect)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([s for s in statements if 'FROM token_blacklist' in s or 'FROM api_token' in s])
+        
+        db.session.expire_all()
+        self.assertIsNotNone(ApiToken.query.filter_by(token_id=self.token_id).first().last_used_at)
+    
+    def test_revoke_invalidates_cache(self):
+        """Тест: відкликаний токен відхиляється одразу, навіть якщо він є в кеші"""
+        response = self.client.get('/api/v1/cities', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        
+        response = self.client.post('/api/v1/auth/revoke', headers=self.headers,
+                                    data=json.dumps({'token_id': self.token_id}))
+        self.assertEqual(response.status_code, 200)
+        
+        response = self.client.get('/api/v1/cities', headers=self.headers)
+        self.assertEqual(response.status_code, 401)
 
 if __name__ == '__main__':
     unittest.main()
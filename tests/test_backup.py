@@ -0,0 +1,372 @@
+"""
+Тести для резервного копіювання (backup_service)
+"""
+import unittest
+import sys
+import os
+import gzip
+import shutil
+import sqlite3
+import tempfile
+import multiprocessing
+
+# Додаємо кореневий каталог проєкту до PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+from models import db, Device, City, User
+from datetime import datetime, timedelta
+
+from backup_service import (backup_manager, read_manifest, restore_snapshot, BackupCatalog, BackupManager,
+                            select_retained, verify_backup, restore_dry_run, fcntl, JOB_DONE,
+                            JOB_FAILED, JOB_RUNNING, JOB_BACKUP, JOB_VERIFY, JOB_DRY_RUN)
+from utils import backup_database, get_backup_list, cleanup_old_backups
+from werkzeug.security import generate_password_hash
+
+
+def add_catalog_entries(folder, prefix, count):
+    """Додає записи в каталог з окремого процесу"""
+    catalog = BackupCatalog(folder)
+    for index in range(count):
+        catalog.add({'filename': f'{prefix}_{index}', 'created_at': datetime.now().isoformat()})
+
+
+class BackupTestCase(unittest.TestCase):
+    """Тести для онлайн-знімків SQLite"""
+
+    def setUp(self):
+        """Налаштування тестового середовища"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['WTF_CSRF_ENABLED'] = False
+        app.config['SECRET_KEY'] = 'test-secret-key'
+
+        self.backup_folder = tempfile.mkdtemp()
+        self.original_backup_folder = app.config['BACKUP_FOLDER']
+        app.config['BACKUP_FOLDER'] = self.backup_folder
+
+        self.app = app
+        self.client = app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+
+        self.city = City(name='Тестове місто')
+        db.session.add(self.city)
+        db.session.commit()
+        self.add_devices(20)
+
+    def tearDown(self):
+        """Очищення після тестів"""
+        app.config['BACKUP_FOLDER'] = self.original_backup_folder
+        app.config['BACKUP_COMPRESSION'] = 'gzip'
+        shutil.rmtree(self.backup_folder, ignore_errors=True)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_devices(self, count, prefix='BK'):
+        start = Device.query.count()
+        for index in range(start, start + count):
+            db.session.add(Device(
+                name=f'Пристрій {index}',
+                type='Ноутбук',
+                serial_number=f'{prefix}_SN_{index}',
+                inventory_number=f'{prefix}-{index:05d}',
+                city_id=self.city.id
+            ))
+        db.session.commit()
+
+    def restored_device_count(self, filename):
+        target = os.path.join(self.backup_folder, 'restored.db')
+        restore_snapshot(self.backup_folder, filename, target)
+        connection = sqlite3.connect(target)
+        try:
+            self.assertEqual(connection.execute('PRAGMA integrity_check').fetchone()[0], 'ok')
+            return connection.execute('SELECT COUNT(*) FROM device').fetchone()[0]
+        finally:
+            connection.close()
+            os.remove(target)
+
+    def test_full_snapshot_is_compressed_and_restorable(self):
+        """Повний знімок стискається gzip і відновлюється в робочу базу"""
+        result = backup_database(self.backup_folder)
+        self.assertEqual(result['kind'], 'full')
+        self.assertTrue(result['filename'].endswith('.db.gz'))
+        with gzip.open(result['backup_path'], 'rb') as f:
+            self.assertEqual(f.read(16), b'SQLite format 3\x00')
+
+        manifest = read_manifest(result['backup_path'])
+        self.assertEqual(manifest['engine'], 'sqlite')
+        self.assertEqual(len(manifest['hashes']), manifest['page_count'])
+        self.assertEqual(self.restored_device_count(result['filename']), 20)
+
+    def test_incremental_snapshot_contains_changed_pages(self):
+        """Інкремент містить лише змінені сторінки, ланцюжок відновлюється повністю"""
+        full = backup_manager.run_backup(incremental=True)
+        self.assertEqual(full['kind'], 'full')
+
+        self.add_devices(5, prefix='INC')
+        incremental = backup_manager.run_backup(incremental=True)
+        self.assertEqual(incremental['kind'], 'incremental')
+        manifest = read_manifest(incremental['path'])
+        self.assertEqual(manifest['base'], full['filename'])
+        self.assertLess(manifest['changed_pages'], manifest['page_count'])
+
+        self.add_devices(3, prefix='INC2')
+        second = backup_manager.run_backup(incremental=True)
+        self.assertEqual(read_manifest(second['path'])['base'], incremental['filename'])
+
+        self.assertEqual(self.restored_device_count(full['filename']), 20)
+        self.assertEqual(self.restored_device_count(incremental['filename']), 25)
+        self.assertEqual(self.restored_device_count(second['filename']), 28)
+
+    def test_full_every_starts_new_chain(self):
+        """Після BACKUP_FULL_EVERY інкрементів створюється повний знімок"""
+        app.config['BACKUP_COMPRESSION'] = 'none'
+        original_full_every = app.config['BACKUP_FULL_EVERY']
+        app.config['BACKUP_FULL_EVERY'] = 1
+        try:
+            kinds = [backup_manager.run_backup(incremental=True)['kind'] for _ in range(3)]
+        finally:
+            app.config['BACKUP_FULL_EVERY'] = original_full_every
+        self.assertEqual(kinds, ['full', 'incremental', 'full'])
+
+    def test_background_job_status(self):
+        """Завдання резервного копіювання звітує про стан через адмін API"""
+        admin = User(username='backup_admin', password_hash=generate_password_hash('password'), is_admin=True,
+                     city_id=self.city.id)
+        db.session.add(admin)
+        db.session.commit()
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(admin.id)
+            sess['_fresh'] = True
+
+        response = self.client.post('/admin/backup/create')
+        self.assertEqual(response.status_code, 302)
+
+        status = self.client.get('/admin/backup/status').get_json()
+        self.assertEqual(status['status'], JOB_DONE)
+        self.assertEqual(status['progress'], 100)
+        self.assertTrue(os.path.exists(os.path.join(self.backup_folder, status['filename'])))
+
+    def test_scheduled_backup_goes_through_manager(self):
+        """Планове копіювання (wait=True) виконується в потоці планувальника і не перетинається з іншим"""
+        app.config['TESTING'] = False
+        try:
+            job = backup_manager.start(wait=True)
+            self.assertEqual(job['status'], JOB_DONE)
+            self.assertEqual(backup_manager.status()['id'], job['id'])
+
+            # Поки виконується інше копіювання, нове не запускається
+            running = backup_manager.start(wait=True)
+            backup_manager._update(running['id'], status='running')
+            with backup_manager._lock:
+                backup_manager._active = running['id']
+            try:
+                self.assertEqual(backup_manager.start(wait=True)['id'], running['id'])
+            finally:
+                with backup_manager._lock:
+                    backup_manager._active = None
+        finally:
+            app.config['TESTING'] = True
+        self.assertEqual(len(BackupCatalog(self.backup_folder).entries()), 2)
+
+    @unittest.skipIf(fcntl is None, "fcntl недоступний")
+    def test_job_runs_once_across_processes(self):
+        """Завдання іншого процесу (job.lock) не дає запустити нове і видно в status()"""
+        other = BackupManager()
+        other.app = app
+        with other._lock:
+            job_lock = other._acquire_job_lock()
+            running = other._new_job(JOB_BACKUP, status=JOB_RUNNING, phase='copying', progress=40)
+            other._jobs[running['id']] = running
+            other._active = running['id']
+            other._job_lock = job_lock
+            other._write_job_state(running)
+
+        job = backup_manager.start()
+        self.assertEqual((job['id'], job['status'], job['progress']), (running['id'], JOB_RUNNING, 40))
+        self.assertEqual(backup_manager.start_verify('missing.db.gz')['id'], running['id'])
+        self.assertEqual(backup_manager.status()['id'], running['id'])
+        self.assertEqual(BackupCatalog(self.backup_folder).entries(), [])
+
+        other._update(running['id'], status=JOB_DONE, phase='done', progress=100, finished_at=datetime.utcnow())
+        with other._lock:
+            other._active = None
+            other._release_job_lock()
+        self.assertEqual(backup_manager.status(running['id'])['status'], JOB_DONE)
+
+        job = backup_manager.start()
+        self.assertNotEqual(job['id'], running['id'])
+        self.assertEqual(job['status'], JOB_DONE)
+        self.assertEqual(backup_manager.status()['id'], job['id'])
+
+    @unittest.skipIf(fcntl is None, "fcntl недоступний")
+    def test_interrupted_job_of_stopped_process(self):
+        """Незавершене завдання, блокування якого ніхто не тримає, показується перерваним"""
+        other = BackupManager()
+        other.app = app
+        with other._lock:
+            other._job_lock = other._acquire_job_lock()
+            running = other._new_job(JOB_BACKUP, status=JOB_RUNNING)
+            other._write_job_state(running)
+            other._release_job_lock()
+
+        job = backup_manager.status(running['id'])
+        self.assertEqual(job['status'], JOB_FAILED)
+        self.assertEqual(backup_manager.start()['status'], JOB_DONE)
+
+    @unittest.skipIf(fcntl is None, "fcntl недоступний")
+    def test_catalog_concurrent_processes(self):
+        """Одночасні зміни каталогу з різних процесів не гублять записів"""
+        BackupCatalog(self.backup_folder).entries()
+        context = multiprocessing.get_context('fork')
+        processes = [
+            context.Process(target=add_catalog_entries, args=(self.backup_folder, f'proc{index}', 40))
+            for index in range(3)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(len(BackupCatalog(self.backup_folder).entries()), 120)
+
+    def test_catalog_records_metadata(self):
+        """Каталог містить розмір, контрольну суму, тривалість і кількість рядків"""
+        result = backup_manager.run_backup()
+        backups = get_backup_list(self.backup_folder)
+        self.assertEqual([b['filename'] for b in backups], [result['filename']])
+        entry = backups[0]
+        self.assertEqual(entry['kind'], 'full')
+        self.assertEqual(entry['size'], os.path.getsize(result['path']))
+        self.assertEqual(len(entry['checksum']), 64)
+        self.assertIsNotNone(entry['duration'])
+        self.assertEqual(entry['row_counts']['device'], 20)
+        self.assertEqual(entry['row_counts']['city'], 1)
+
+    def test_catalog_imports_legacy_files(self):
+        """Без каталогу наявні копії (включно з .sql дампами) імпортуються один раз"""
+        connection = sqlite3.connect(os.path.join(self.backup_folder, 'inventory_backup_20240101_020000.db'))
+        connection.execute('CREATE TABLE item (id INTEGER PRIMARY KEY)')
+        connection.execute('INSERT INTO item VALUES (1)')
+        connection.commit()
+        with open(os.path.join(self.backup_folder, 'inventory_dump_20240101_020000.sql'), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(connection.iterdump()))
+        connection.close()
+
+        kinds = {b['filename']: b['kind'] for b in get_backup_list(self.backup_folder)}
+        self.assertEqual(kinds, {
+            'inventory_backup_20240101_020000.db': 'full',
+            'inventory_dump_20240101_020000.sql': 'sql',
+        })
+        self.assertTrue(os.path.exists(os.path.join(self.backup_folder, 'catalog.json')))
+        result = restore_dry_run(self.backup_folder, 'inventory_dump_20240101_020000.sql')
+        self.assertTrue(result['ok'], result['message'])
+        self.assertEqual(result['row_counts'], {'item': 1})
+
+    def test_gfs_selection(self):
+        """GFS: останні дні, тижні та місяці плюс основи збережених інкрементів"""
+        now = datetime(2025, 6, 30, 2, 0)
+        entries = []
+        for days in range(120):
+            moment = now - timedelta(days=days)
+            entries.append({'filename': f'd{days}', 'kind': 'full', 'base': None, 'created_at': moment.isoformat()})
+        # Інкремент найновіший - його основа має залишитись
+        entries.append({'filename': 'inc', 'kind': 'incremental', 'base': 'd100',
+                        'created_at': (now + timedelta(hours=1)).isoformat()})
+
+        keep = select_retained(entries, daily=3, weekly=2, monthly=3)
+        # Денні: inc (30.06), d1, d2; тижневі: тиждень 30.06 (inc) та d1 (неділя 29.06);
+        # місячні: червень (inc), травень (d30), квітень (d61); основа інкремента d100
+        self.assertEqual(keep, {'inc', 'd1', 'd2', 'd30', 'd61', 'd100'})
+
+    def test_retention_removes_files_and_catalog_entries(self):
+        """Очищення видаляє копії поза політикою разом з маніфестами"""
+        first = backup_manager.run_backup()
+        second = backup_manager.run_backup()
+        catalog = BackupCatalog(self.backup_folder)
+        catalog.update(first['filename'], created_at=(datetime.now() - timedelta(days=400)).isoformat())
+
+        removed = cleanup_old_backups(self.backup_folder, keep_daily=1, keep_weekly=0, keep_monthly=0)
+        self.assertEqual(removed, [first['filename']])
+        self.assertFalse(os.path.exists(first['path']))
+        self.assertFalse(os.path.exists(first['path'] + '.json'))
+        self.assertEqual([b['filename'] for b in get_backup_list(self.backup_folder)], [second['filename']])
+
+    def test_verify_and_dry_run(self):
+        """Перевірка знаходить пошкоджену копію, пробне відновлення звіряє рядки"""
+        result = backup_manager.run_backup()
+        self.assertTrue(verify_backup(self.backup_folder, result['filename'])['ok'])
+
+        dry_run = restore_dry_run(self.backup_folder, result['filename'])
+        self.assertTrue(dry_run['ok'], dry_run['message'])
+        self.assertEqual(dry_run['row_counts']['device'], 20)
+        entry = BackupCatalog(self.backup_folder).get(result['filename'])
+        self.assertTrue(entry['verify_ok'])
+        self.assertTrue(entry['dry_run_ok'])
+
+        with open(result['path'], 'r+b') as f:
+            f.seek(40)
+            f.write(b'corrupted')
+        verification = verify_backup(self.backup_folder, result['filename'])
+        self.assertFalse(verification['ok'])
+        self.assertFalse(BackupCatalog(self.backup_folder).get(result['filename'])['verify_ok'])
+
+    def test_verify_and_dry_run_background_jobs(self):
+        """Перевірка і пробне відновлення - фонові завдання зі станом у /admin/backup/status"""
+        admin = User(username='backup_admin', password_hash=generate_password_hash('password'), is_admin=True,
+                     city_id=self.city.id)
+        db.session.add(admin)
+        db.session.commit()
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(admin.id)
+            sess['_fresh'] = True
+        filename = backup_manager.run_backup()['filename']
+
+        response = self.client.post(f'/admin/backup/{filename}/verify')
+        self.assertEqual(response.status_code, 302)
+        status = self.client.get('/admin/backup/status').get_json()
+        self.assertEqual((status['kind'], status['target'], status['status']), (JOB_VERIFY, filename, JOB_DONE))
+        self.assertTrue(status['ok'])
+
+        self.assertEqual(self.client.post('/admin/backup/missing.db.gz/dry-run').status_code, 302)
+        self.assertEqual(self.client.get('/admin/backup/status').get_json()['id'], status['id'])
+
+        # Поза тестовим режимом запит лише запускає потік
+        app.config['TESTING'] = False
+        try:
+            job = backup_manager.start_dry_run(filename)
+            backup_manager.shutdown()
+        finally:
+            app.config['TESTING'] = True
+        job = backup_manager.status(job['id'])
+        self.assertEqual((job['kind'], job['status']), (JOB_DRY_RUN, JOB_DONE))
+        self.assertTrue(job['ok'], job['message'])
+        self.assertTrue(BackupCatalog(self.backup_folder).get(filename)['dry_run_ok'])
+
+    def test_delete_keeps_incremental_chain(self):
+        """Знімок, на який спирається інкремент, не видаляється"""
+        admin = User(username='backup_admin', password_hash=generate_password_hash('password'), is_admin=True,
+                     city_id=self.city.id)
+        db.session.add(admin)
+        db.session.commit()
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(admin.id)
+            sess['_fresh'] = True
+
+        full = backup_manager.run_backup(incremental=True)
+        self.add_devices(2, prefix='DEL')
+        incremental = backup_manager.run_backup(incremental=True)
+
+        self.client.post(f"/admin/backup/{full['filename']}/delete")
+        self.assertTrue(os.path.exists(full['path']))
+
+        self.client.post(f"/admin/backup/{incremental['filename']}/delete")
+        self.client.post(f"/admin/backup/{full['filename']}/delete")
+        self.assertEqual(get_backup_list(self.backup_folder), [])
+        self.assertEqual(sorted(os.listdir(self.backup_folder)), ['catalog.json', 'catalog.lock'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+"""
+Тести для спільного кешу з інвалідацією за тегами
+"""
+import unittest
+import sys
+import os
+import json
+import shutil
+import tempfile
+
+# Додаємо кореневий каталог проєкту до PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+from app import app
+from models import db, City, User
+from cache_service import TieredCache, app_cache
+from utils import get_cached_cities, generate_jwt_token
+
+class TieredCacheTestCase(unittest.TestCase):
+    """Тести для TieredCache з SQLite сховищем (два 'процеси' з одним файлом)"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.caches = [self.make_cache() for _ in range(2)]
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def make_cache(self):
+        worker_app = Flask(__name__)
+        worker_app.config['CACHE_SQLITE_PATH'] = os.path.join(self.temp_dir, 'cache.sqlite')
+        worker_app.config['CACHE_LOCAL_TTL'] = 0
+        return TieredCache(worker_app)
+
+    def test_shared_between_processes(self):
+        """Значення, збережене одним процесом, доступне іншому"""
+        first, second = self.caches
+        first.set('key', {'value': 1}, tags=('cities',))
+        self.assertEqual(second.get('key', tags=('cities',)), {'value': 1})
+        self.assertEqual(second.stats()['backend'], 'SQLiteBackend')
+
+    def test_tag_invalidation(self):
+        """Інвалідація тегу в одному процесі робить записи недійсними в іншому"""
+        first, second = self.caches
+        first.set('cities', ['Київ'], tags=('cities',))
+        first.set('devices', [1, 2], tags=('devices',))
+
+        second.invalidate('cities')
+        self.assertIsNone(first.get('cities', tags=('cities',)))
+        self.assertEqual(first.get('devices', tags=('devices',)), [1, 2])
+
+        calls = []
+        value = first.get_or_set('cities', lambda: calls.append(1) or ['Львів'], tags=('cities',))
+        self.assertEqual(value, ['Львів'])
+        self.assertEqual(second.get_or_set('cities', lambda: calls.append(1) or [], tags=('cities',)), ['Львів'])
+        self.assertEqual(len(calls), 1)
+
+    def test_invalidation_during_factory(self):
+        """Значення, обчислене до інвалідації тегу, не видається як свіже"""
+        first, second = self.caches
+
+        def stale_factory():
+            # Дані змінились і тег інвалідовано, поки factory ще рахує
+            second.invalidate('stats')
+            return {'total': 1}
+
+        self.assertEqual(first.get_or_set('stats', stale_factory, tags=('stats',)), {'total': 1})
+        self.assertIsNone(first.get('stats', tags=('stats',)))
+        self.assertEqual(second.get_or_set('stats', lambda: {'total': 2}, tags=('stats',)), {'total': 2})
+
+class CacheInvalidationTestCase(unittest.TestCase):
+    """Тести для автоматичної інвалідації після коміту"""
+
+    def setUp(self):
+        """Налаштування тестового середовища"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['WTF_CSRF_ENABLED'] = False
+
+        self.app = app
+        self.client = app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+        app_cache.clear()
+
+        self.city = City(name='Київ')
+        db.session.add(self.city)
+        db.session.commit()
+
+        self.user = User(username='cache_user', password_hash='x', city_id=self.city.id, is_admin=True)
+        db.session.add(self.user)
+        db.session.commit()
+
+    def tearDown(self):
+        """Очищення після тестів"""
+        app_cache.clear()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_cities_invalidated_on_commit(self):
+        """Додавання та перейменування міста одразу видно в кешованому списку"""
+        self.assertEqual([c['name'] for c in get_cached_cities()], ['Київ'])
+
+        db.session.add(City(name='Львів'))
+        db.session.commit()
+        self.assertEqual([c['name'] for c in get_cached_cities()], ['Київ', 'Львів'])
+
+        self.city.name = 'Одеса'
+        db.session.commit()
+        self.assertEqual([c['name'] for c in get_cached_cities()], ['Львів', 'Одеса'])
+
+    def test_rollback_keeps_cache(self):
+        """Відкочені зміни не інвалідують кеш"""
+        get_cached_cities()
+        hits = app_cache.hits
+        db.session.add(City(name='Тимчасове'))
+        db.session.flush()
+        db.session.rollback()
+        get_cached_cities()
+        self.assertEqual(app_cache.hits, hits + 1)
+
+    def test_api_cities(self):
+        """API /cities повертає актуальний список після змін"""
+        token, _, _ = generate_jwt_token(self.user.id, expires_in_days=1)
+        headers = {'Authorization': f'Bearer {token}'}
+
+        data = json.loads(self.client.get('/api/v1/cities', headers=headers).data)
+        self.assertEqual([c['name'] for c in data['cities']], ['Київ'])
+
+        db.session.add(City(name='Харків'))
+        db.session.commit()
+        data = json.loads(self.client.get('/api/v1/cities', headers=headers).data)
+        self.assertEqual([c['name'] for c in data['cities']], ['Київ', 'Харків'])
+
+if __name__ == '__main__':
+    unittest.main()
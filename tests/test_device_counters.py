@@ -0,0 +1,189 @@
+"""
+Тести для матеріалізованих лічильників пристроїв
+"""
+import unittest
+import sys
+import os
+import io
+from datetime import datetime
+
+# Додаємо кореневий каталог проєкту до PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import openpyxl
+from sqlalchemy import event, update
+
+import app as app_module
+from app import app
+from models import db, Device, DeviceCounter, City, User
+from device_counters import rebuild_device_counters
+from excel_import import DeviceExcelImport
+from stats_service import device_stats
+
+class DeviceCountersTestCase(unittest.TestCase):
+    """Тести для таблиці device_counters"""
+
+    def setUp(self):
+        """Налаштування тестового середовища"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['WTF_CSRF_ENABLED'] = False
+
+        self.app = app
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+        device_stats.invalidate()
+
+        self.city = City(name='Київ')
+        self.other_city = City(name='Львів')
+        db.session.add_all([self.city, self.other_city])
+        db.session.commit()
+
+        self.user = User(username='counters_user', password_hash='x', city_id=self.city.id)
+        db.session.add(self.user)
+
+        self.month = datetime.utcnow().strftime('%Y-%m')
+        for i in range(6):
+            db.session.add(Device(
+                name=f'Пристрій {i}',
+                type='Монітор' if i < 4 else 'Принтер',
+                serial_number=f'CNT_SN_{i}',
+                inventory_number=f'2025-{i+1:04d}',
+                status='В роботі',
+                city_id=self.city.id
+            ))
+        db.session.commit()
+
+    def tearDown(self):
+        """Очищення після тестів"""
+        device_stats.invalidate()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def counters(self):
+        """Ненульові лічильники як словник {(city_id, status, type, month): count}"""
+        return {
+            (c.city_id, c.status, c.type, c.month): c.count
+            for c in DeviceCounter.query.filter(DeviceCounter.count > 0)
+        }
+
+    def test_insert_update_delete(self):
+        """Лічильники оновлюються разом зі змінами пристроїв"""
+        self.assertEqual(self.counters(), {
+            (self.city.id, 'В роботі', 'Монітор', self.month): 4,
+            (self.city.id, 'В роботі', 'Принтер', self.month): 2,
+        })
+
+        devices = Device.query.filter_by(type='Монітор').order_by(Device.id).all()
+        devices[0].status = 'На ремонті'
+        devices[1].city_id = self.other_city.id
+        devices[2].name = 'Без зміни групи'
+        db.session.commit()
+
+        db.session.delete(Device.query.filter_by(type='Принтер').first())
+        db.session.commit()
+
+        self.assertEqual(self.counters(), {
+            (self.city.id, 'В роботі', 'Монітор', self.month): 2,
+            (self.city.id, 'На ремонті', 'Монітор', self.month): 1,
+            (self.other_city.id, 'В роботі', 'Монітор', self.month): 1,
+            (self.city.id, 'В роботі', 'Принтер', self.month): 1,
+        })
+
+        counters = device_stats.status_counters(self.city.id)
+        self.assertEqual(counters['total_devices'], 4)
+        self.assertEqual(counters['repair_devices'], 1)
+
+    def test_update_after_commit_expired_attributes(self):
+        """Зміна пристрою з простроченими після коміту атрибутами переносить його в нову групу"""
+        device = Device(name='Сервер', type='Сервер', serial_number='CNT_SN_EXP',
+                        inventory_number='2025-0100', status='В роботі', city_id=self.city.id)
+        db.session.add(device)
+        db.session.commit()
+
+        # Атрибути прострочені - старі значення не завантажені
+        device.status = 'На ремонті'
+        device.city_id = self.other_city.id
+        db.session.commit()
+
+        counters = self.counters()
+        self.assertNotIn((self.city.id, 'В роботі', 'Сервер', self.month), counters)
+        self.assertEqual(counters[(self.other_city.id, 'На ремонті', 'Сервер', self.month)], 1)
+
+    def test_rollback_discards_counters(self):
+        """Відкат транзакції відкочує і зміни лічильників"""
+        device = Device.query.first()
+        device.status = 'Списано'
+        db.session.flush()
+        db.session.rollback()
+        self.assertNotIn((self.city.id, 'Списано', 'Монітор', self.month), self.counters())
+
+    def test_stats_do_not_scan_devices(self):
+        """Статистика читає лише device_counters, а не таблицю device"""
+        statements = []
+
+        def on_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', on_execute)
+        try:
+            device_stats.get()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', on_execute)
+
+        self.assertEqual(len(statements), 1)
+        self.assertIn('FROM device_counters', statements[0])
+        self.assertNotRegex(statements[0], r'FROM device\b(?!_)')
+
+    def test_rebuild_repairs_drift(self):
+        """Перебудова виправляє лічильники після змін в обхід ORM"""
+        db.session.execute(update(Device).where(Device.type == 'Принтер').values(status='Списано'))
+        db.session.commit()
+        self.assertNotIn((self.city.id, 'Списано', 'Принтер', self.month), self.counters())
+
+        self.assertEqual(rebuild_device_counters(), 2)
+        self.assertEqual(self.counters(), {
+            (self.city.id, 'В роботі', 'Монітор', self.month): 4,
+            (self.city.id, 'Списано', 'Принтер', self.month): 2,
+        })
+        self.assertEqual(device_stats.status_counters()['decommissioned_devices'], 2)
+
+    def test_first_request_fills_empty_counters(self):
+        """Під WSGI порожні лічильники старої бази заповнюються після першого запиту процесу"""
+        db.session.execute(DeviceCounter.__table__.delete())
+        db.session.commit()
+
+        app.config['TESTING'] = False
+        app_module._startup_thread = None
+        try:
+            app.test_client().get('/login')
+            app_module._startup_thread.join(10)
+        finally:
+            app.config['TESTING'] = True
+
+        db.session.expire_all()
+        self.assertEqual(self.counters(), {
+            (self.city.id, 'В роботі', 'Монітор', self.month): 4,
+            (self.city.id, 'В роботі', 'Принтер', self.month): 2,
+        })
+
+    def test_excel_import_updates_counters(self):
+        """Масовий імпорт з Excel оновлює лічильники"""
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.append(['Назва', 'Тип', 'Серійний номер', 'Розташування', 'Статус', 'Примітки'])
+        for i in range(3):
+            sheet.append([f'Імпорт {i}', 'Сканер', f'CNT_IMPORT_{i}', 'Склад', 'В роботі', ''])
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+        buffer.seek(0)
+
+        importer = DeviceExcelImport(self.city.id, self.user.id)
+        self.assertEqual(importer.run(buffer), 3)
+        self.assertEqual(self.counters()[(self.city.id, 'В роботі', 'Сканер', self.month)], 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+"""
+Тести для транзакційного запису історії змін пристроїв
+"""
+import unittest
+import sys
+import os
+
+# Додаємо кореневий каталог проєкту до PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from app import app
+from models import db, Device, DeviceHistory, City, User
+from device_history import track_device_history
+
+class DeviceHistoryTestCase(unittest.TestCase):
+    """Тести для запису DeviceHistory через before_flush"""
+
+    def setUp(self):
+        """Налаштування тестового середовища"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['WTF_CSRF_ENABLED'] = False
+
+        self.app = app
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+
+        self.city = City(name='Київ')
+        self.other_city = City(name='Львів')
+        db.session.add_all([self.city, self.other_city])
+        db.session.commit()
+
+        self.user = User(username='history_user', password_hash='x', city_id=self.city.id)
+        db.session.add(self.user)
+        db.session.commit()
+
+        for i in range(50):
+            db.session.add(Device(
+                name=f'Пристрій {i}',
+                type='Монітор',
+                serial_number=f'HIST_SN_{i:03d}',
+                inventory_number=f'2025-{i+1:04d}',
+                status='В роботі',
+                city_id=self.city.id
+            ))
+        db.session.commit()
+
+    def tearDown(self):
+        """Очищення після тестів"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_no_history_without_author(self):
+        """Без автора змін історія не пишеться (скрипти, фікстури)"""
+        self.assertEqual(DeviceHistory.query.count(), 0)
+
+    def test_bulk_update_single_insert(self):
+        """Масова зміна статусу - один INSERT історії з одним комітом"""
+        statements = []
+
+        def count_history_inserts(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('INSERT INTO device_history'):
+                statements.append(statement)
+
+        engine = db.engine
+        event.listen(engine, 'before_cursor_execute', count_history_inserts)
+        try:
+            track_device_history(self.user.id)
+            for device in Device.query.all():
+                device.status = 'На ремонті'
+            db.session.commit()
+        finally:
+            event.remove(engine, 'before_cursor_execute', count_history_inserts)
+
+        self.assertEqual(len(statements), 1)
+        history = DeviceHistory.query.all()
+        self.assertEqual(len(history), 50)
+        self.assertEqual({(h.field, h.old_value, h.new_value) for h in history}, {('Статус', 'В роботі', 'На ремонті')})
+        self.assertTrue(all(h.user_id == self.user.id for h in history))
+
+    def test_rollback_discards_history(self):
+        """Відкат транзакції відкидає і зміни, і історію"""
+        track_device_history(self.user.id)
+        device = Device.query.first()
+        device.name = 'Нова назва'
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(DeviceHistory.query.count(), 0)
+
+    def test_update_after_commit_records_old_value(self):
+        """Зміна пристрою з простроченими після коміту атрибутами зберігає старе значення"""
+        track_device_history(self.user.id)
+        device = Device(name='Сервер', type='Сервер', serial_number='HIST_EXP',
+                        inventory_number='2025-0101', city_id=self.city.id, notes='Стійка 1')
+        db.session.add(device)
+        db.session.commit()
+
+        # Атрибути прострочені - старі значення не завантажені
+        device.name = 'Сервер БД'
+        device.notes = 'Стійка 2'
+        db.session.commit()
+
+        changes = {
+            (h.field, h.old_value, h.new_value)
+            for h in DeviceHistory.query.filter_by(action='update')
+        }
+        self.assertEqual(changes, {('Назва', 'Сервер', 'Сервер БД'), ('Примітки', 'Стійка 1', 'Стійка 2')})
+
+    def test_create_update_delete(self):
+        """Створення, зміна міста без змін-дублікатів та видалення"""
+        track_device_history(self.user.id)
+        device = Device(name='Сервер', type='Сервер', serial_number='HIST_NEW',
+                        inventory_number='2025-0100', city_id=self.city.id)
+        db.session.add(device)
+        db.session.commit()
+
+        created = DeviceHistory.query.filter_by(action='create').one()
+        self.assertEqual(created.device_id, device.id)
+        self.assertEqual(created.device_name, 'Сервер')
+
+        device.city_id = self.other_city.id
+        device.location = ''  # None -> '' не вважається зміною
+        db.session.commit()
+        update = DeviceHistory.query.filter_by(action='update').one()
+        self.assertEqual((update.field, update.old_value, update.new_value), ('Місто', 'Київ', 'Львів'))
+
+        db.session.delete(device)
+        db.session.commit()
+        deleted = DeviceHistory.query.filter_by(action='delete').one()
+        self.assertIsNone(deleted.device_id)
+        self.assertEqual(deleted.device_serial_number, 'HIST_NEW')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -131,6 +131,71 @@ class DevicesTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.mimetype, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
     
+    def test_bulk_export_excel_content(self):
+        """Тест вмісту потокового експорту в Excel"""
+        import io
+        import openpyxl
+        self.login()
+        
+        from werkzeug.datastructures import MultiDict
+        data = MultiDict()
+        for device in self.devices[:3]:
+            data.add('device_ids', device.id)
+        
+        response = self.client.post('/devices/bulk-export-excel', data=data)
+        self.assertEqual(response.status_code, 200)
+        
+        workbook = openpyxl.load_workbook(io.BytesIO(response.data))
+        sheet = workbook.active
+        self.assertEqual(sheet.title, 'Обрані пристрої')
+        rows = list(sheet.iter_rows(values_only=True))
+        self.assertEqual(rows[0][0], 'ID')
+        self.assertEqual(len(rows), 4)
+        self.assertEqual([row[3] for row in rows[1:]], ['BULK_SN_001', 'BULK_SN_002', 'BULK_SN_003'])
+        self.assertEqual(rows[1][7], 'Тестове місто')
+        self.assertTrue(sheet['A1'].font.b)
+        self.assertGreater(sheet.column_dimensions['D'].width, len('BULK_SN_001'))
+    
+    def test_import_excel(self):
+        """Тест пакетного імпорту з Excel: дублікати відкидаються, історія записується"""
+        import io
+        import openpyxl
+        from models import DeviceHistory
+        self.login()
+
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.append(['Назва', 'Тип', 'Серійний номер', 'Розташування', 'Статус', 'Примітки'])
+        sheet.append(['Монітор', 'Монітор', 'IMP_SN_001', 'Кабінет 1', None, None])
+        sheet.append(['Існуючий', 'Монітор', 'BULK_SN_001', None, None, None])
+        sheet.append(['Дубль', 'Монітор', 'IMP_SN_001', None, None, None])
+        sheet.append([None, None, None, None, None, None])
+        sheet.append(['Без серійного', None, None, None, None, None])
+        sheet.append(['Ще без серійного', 'Принтер', 12345.0, None, None, None])
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+        buffer.seek(0)
+
+        response = self.client.post('/devices/import_excel', data={
+            'file': (buffer, 'devices.xlsx')
+        }, content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 302)
+
+        imported = Device.query.filter(Device.id > self.devices[-1].id).order_by(Device.id).all()
+        self.assertEqual([d.name for d in imported], ['Монітор', 'Без серійного', 'Ще без серійного'])
+        self.assertEqual([d.serial_number for d in imported], ['IMP_SN_001', None, '12345'])
+        self.assertEqual(imported[0].status, 'Активний')
+        self.assertEqual(imported[1].type, 'Не вказано')
+
+        # Інвентарні номери - послідовний блок
+        numbers = [int(d.inventory_number.split('-')[1]) for d in imported]
+        self.assertEqual(numbers, list(range(numbers[0], numbers[0] + 3)))
+
+        history = DeviceHistory.query.filter_by(action='create').order_by(DeviceHistory.device_id).all()
+        self.assertEqual([h.device_id for h in history], [d.id for d in imported])
+        self.assertEqual(history[0].device_inventory_number, imported[0].inventory_number)
+        self.assertEqual(history[0].user_id, self.user.id)
+
     def test_bulk_export_pdf(self):
         """Тест масового експорту в PDF"""
         self.login()
@@ -152,6 +217,170 @@ class DevicesTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.mimetype, 'application/pdf')
 
+    @staticmethod
+    def _pdf_pages(data):
+        """Кількість сторінок PDF"""
+        import re
+        return len(re.findall(rb'/Type /Page(?![s\w])', data))
+
+    def test_bulk_export_pdf_cards(self):
+        """Масовий режим карток: одна сторінка на пристрій за один документ"""
+        from werkzeug.datastructures import MultiDict
+        
+        self.login()
+        data = MultiDict([('mode', 'cards')] + [('device_ids', d.id) for d in self.devices])
+        response = self.client.post('/devices/export_pdf', data=data)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/pdf')
+        self.assertEqual(self._pdf_pages(response.data), len(self.devices))
+
+    def test_register_pdf_streaming(self):
+        """Великий реєстр будується порціями: таблиця по сторінці, метрики швидкості"""
+        from utils_pdf import pdf_engine, REGISTER_ROW_HEIGHT
+        
+        devices = (
+            Device(name=f'Пристрій {i}', type='Принтер', serial_number=f'REG_{i:05d}',
+                   inventory_number=f'2025-{i:05d}', location='Кабінет 1', status='В роботі')
+            for i in range(2000)
+        )
+        documents = pdf_engine.stats()['documents']
+        pdf_file = pdf_engine.render_register(devices)
+        data = pdf_file.read()
+        
+        self.assertTrue(data.startswith(b'%PDF'))
+        rows_per_page = int(pdf_engine._register_page_height(False) // REGISTER_ROW_HEIGHT)
+        self.assertLessEqual(self._pdf_pages(data), 2000 // rows_per_page + 2)
+        stats = pdf_engine.stats()
+        self.assertEqual(stats['documents'], documents + 1)
+        self.assertGreater(stats['pages_per_second'], 0)
+        
+        self.login()
+        response = self.client.get('/devices/export_pdf/register')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/pdf')
+
+    def test_register_pdf_row_heights(self):
+        """Довгий текст переноситься в межах колонки, розрив сторінки - лише перед наступними рядками"""
+        from unittest import mock
+        from reportlab.platypus import PageBreak, Table
+        from utils_pdf import pdf_engine, REGISTER_COLUMNS, REGISTER_ROW_HEIGHT
+        
+        rows_per_page = int(pdf_engine._register_page_height(True) // REGISTER_ROW_HEIGHT)
+        devices = [
+            Device(name='Ноутбук Dell Latitude 5520 з док-станцією і двома моніторами' if i == 0 else f'Пристрій {i}',
+                   type='Ноутбук', serial_number=f'REG_{i:05d}', inventory_number=f'2025-{i:05d}',
+                   location='Кабінет 1', status='В роботі')
+            for i in range(rows_per_page)
+        ]
+        with mock.patch.object(pdf_engine, '_build', lambda kind, source, footer: [f for chunk in source for f in chunk]):
+            flowables = pdf_engine.render_register(devices)
+        
+        tables = [f for f in flowables if isinstance(f, Table)]
+        self.assertEqual(len(tables), 2)
+        # Висока перша сторінка не вмістила останній рядок - він на другій
+        self.assertGreater(tables[0]._rowHeights[1], REGISTER_ROW_HEIGHT)
+        self.assertEqual(len(tables[0]._cellvalues) + len(tables[1]._cellvalues) - 2, rows_per_page)
+        name_lines = tables[0]._cellvalues[1][2].split('\n')
+        self.assertGreater(len(name_lines), 1)
+        self.assertEqual(' '.join(name_lines), devices[0].name)
+        # Після останньої таблиці розриву сторінки немає - підсумок лишається поруч
+        self.assertEqual(sum(isinstance(f, PageBreak) for f in flowables), 1)
+        self.assertNotIsInstance(flowables[flowables.index(tables[1]) + 1], PageBreak)
+        self.assertEqual(len(REGISTER_COLUMNS), len(tables[1]._cellvalues[0]))
+        
+        with mock.patch.object(pdf_engine, '_build', lambda kind, source, footer: [f for chunk in source for f in chunk]):
+            flowables = pdf_engine.render_register(devices[1:])
+        self.assertFalse(any(isinstance(f, PageBreak) for f in flowables))
+    
+    def test_device_qrcode_cached(self):
+        """QR-код генерується один раз, повертає ETag та оновлюється при зміні даних"""
+        import shutil
+        import tempfile
+        from qr_service import qr_store
+        
+        self.login()
+        qr_folder = tempfile.mkdtemp()
+        original_folder = app.config['QR_CACHE_FOLDER']
+        app.config['QR_CACHE_FOLDER'] = qr_folder
+        try:
+            device = self.devices[0]
+            renders = qr_store.renders
+            
+            response = self.client.get(f'/device/{device.id}/qrcode')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.mimetype, 'image/png')
+            etag = response.headers['ETag']
+            self.assertIn('no-cache', response.headers['Cache-Control'])
+            response.close()
+            
+            response = self.client.get(f'/device/{device.id}/qrcode', headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(qr_store.renders, renders + 1)
+            
+            version = qr_store.version(device)
+            response = self.client.get(f'/device/{device.id}/qrcode?v={version}')
+            self.assertIn('immutable', response.headers['Cache-Control'])
+            response.close()
+            
+            # Зміна назви - нова версія; старий файл лишається для запитів, що вже отримали його шлях
+            old_path, _ = qr_store.get(device)
+            device.name = 'Перейменований пристрій'
+            db.session.commit()
+            response = self.client.get(f'/device/{device.id}/qrcode', headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response.headers['ETag'], etag)
+            response.close()
+            self.assertTrue(os.path.exists(old_path))
+            
+            # Після QR_STALE_GRACE_MINUTES наступна генерація видаляє старі версії
+            app.config['QR_STALE_GRACE_MINUTES'] = 0
+            device.name = 'Ще раз перейменований пристрій'
+            db.session.commit()
+            new_path, _ = qr_store.get(device)
+            self.assertFalse(os.path.exists(old_path))
+            self.assertEqual(os.listdir(qr_folder), [os.path.basename(new_path)])
+        finally:
+            app.config['QR_STALE_GRACE_MINUTES'] = 60
+            app.config['QR_CACHE_FOLDER'] = original_folder
+            shutil.rmtree(qr_folder, ignore_errors=True)
+    
+    def test_device_qrcode_sheet(self):
+        """Аркуш QR-кодів для кількох пристроїв однією відповіддю"""
+        import shutil
+        import tempfile
+        from werkzeug.datastructures import MultiDict
+        from qr_service import QR_LABEL, qr_payload, qr_store
+        
+        self.login()
+        qr_folder = tempfile.mkdtemp()
+        original_folder = app.config['QR_CACHE_FOLDER']
+        app.config['QR_CACHE_FOLDER'] = qr_folder
+        try:
+            data = MultiDict([('device_ids', d.id) for d in self.devices])
+            response = self.client.post('/devices/qrcode-sheet', data=data)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.mimetype, 'application/pdf')
+            self.assertTrue(response.data.startswith(b'%PDF'))
+            # Мітки кодують лише інвентарний номер, як і до дискового сховища
+            self.assertEqual(
+                sorted(os.listdir(qr_folder)),
+                sorted(f'{d.id}_{QR_LABEL}_{qr_store.version(d, QR_LABEL)}.png' for d in self.devices)
+            )
+            self.assertEqual(qr_payload(self.devices[0], QR_LABEL), self.devices[0].inventory_number)
+            
+            page = self.client.post('/devices/bulk_print_inventory', data=data).get_data(as_text=True)
+            self.assertIn(f'kind={QR_LABEL}', page)
+            response = self.client.get(f'/device/{self.devices[0].id}/qrcode?kind={QR_LABEL}')
+            self.assertEqual(response.headers['ETag'], f'"{qr_store.version(self.devices[0], QR_LABEL)}"')
+            response.close()
+            self.assertEqual(self.client.get(f'/device/{self.devices[0].id}/qrcode?kind=x').status_code, 400)
+            
+            self.assertEqual(self.client.post('/devices/qrcode-sheet').status_code, 400)
+        finally:
+            app.config['QR_CACHE_FOLDER'] = original_folder
+            shutil.rmtree(qr_folder, ignore_errors=True)
+
 if __name__ == '__main__':
     unittest.main()
 
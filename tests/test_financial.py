@@ -10,7 +10,8 @@ from datetime import date, timedelta
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app import app
-from models import db, Device, City, RepairExpense
+from models import db, Device, City, RepairExpense, User
+import valuation
 from werkzeug.security import generate_password_hash
 
 class FinancialTestCase(unittest.TestCase):
@@ -175,6 +176,140 @@ class FinancialTestCase(unittest.TestCase):
         # І загальна вартість теж 0
         self.assertEqual(device.total_cost, 0)
 
+    def _fleet(self):
+        """Два пристрої різних типів з ремонтами та один без фінансових даних"""
+        laptop = Device(
+            name='Ноутбук', type='Ноутбук', serial_number='FIN_SN_101', inventory_number='2025-0101',
+            city_id=self.city.id, purchase_price=10000.00,
+            purchase_date=date.today() - timedelta(days=365), depreciation_rate=20.0
+        )
+        printer = Device(
+            name='Принтер', type='Принтер', serial_number='FIN_SN_102', inventory_number='2025-0102',
+            city_id=self.city.id, purchase_price=4000.00,
+            purchase_date=date.today() - timedelta(days=3650), depreciation_rate=20.0
+        )
+        spare = Device(
+            name='Монітор', type='Принтер', serial_number='FIN_SN_103', inventory_number='2025-0103',
+            city_id=self.city.id
+        )
+        db.session.add_all([laptop, printer, spare])
+        db.session.flush()
+        for device, amount in ((laptop, 500.00), (laptop, 250.50), (printer, 1200.00)):
+            db.session.add(RepairExpense(device_id=device.id, amount=amount, repair_date=date.today(),
+                                         description='Ремонт'))
+        db.session.commit()
+        return laptop, printer, spare
+
+    def test_sql_expressions_match_properties(self):
+        """SQL-вирази вартості збігаються з обчисленням у Python"""
+        devices = self._fleet()
+        rows = {
+            row.id: row for row in db.session.execute(db.select(
+                Device.id, Device.current_value, Device.total_repair_expenses, Device.total_cost
+            ))
+        }
+        for device in devices:
+            row = rows[device.id]
+            if device.current_value is None:
+                self.assertIsNone(row.current_value)
+            else:
+                self.assertAlmostEqual(row.current_value, device.current_value, places=2)
+            self.assertAlmostEqual(row.total_repair_expenses, device.total_repair_expenses, places=2)
+            self.assertAlmostEqual(row.total_cost, device.total_cost, places=2)
+        
+        # Вирази придатні для фільтрів: повністю амортизований принтер
+        written_off = db.session.scalars(db.select(Device.id).where(Device.current_value == 0)).all()
+        self.assertEqual(written_off, [devices[1].id])
+
+    def test_total_repair_expenses_without_loading(self):
+        """Сума ремонтів незавантаженого пристрою рахується в базі, а не по об'єктах"""
+        laptop, _, _ = self._fleet()
+        db.session.expire_all()
+        
+        self.assertAlmostEqual(laptop.total_repair_expenses, 750.50, places=2)
+        self.assertNotIn('repair_expenses', laptop.__dict__)
+
+    def test_fleet_summary(self):
+        """Підсумок по містах і типах одним запитом"""
+        from financial_report import fleet_summary, device_costs
+        
+        laptop, printer, spare = self._fleet()
+        summary = fleet_summary()
+        
+        groups = {group['type']: group for group in summary['groups']}
+        self.assertEqual(groups['Ноутбук']['devices'], 1)
+        self.assertAlmostEqual(groups['Ноутбук']['repair_total'], 750.50)
+        self.assertAlmostEqual(groups['Ноутбук']['book_value'], laptop.current_value, places=2)
+        self.assertEqual(groups['Принтер']['devices'], 2)
+        self.assertEqual(groups['Принтер']['repair_count'], 1)
+        self.assertAlmostEqual(groups['Принтер']['book_value'], 0)
+        self.assertAlmostEqual(groups['Принтер']['total_cost'], 5200.00)
+        self.assertEqual(summary['totals']['devices'], 3)
+        self.assertAlmostEqual(summary['totals']['repair_total'], 1950.50)
+        
+        costs = device_costs([laptop.id, spare.id])
+        self.assertAlmostEqual(costs[laptop.id]['total_cost'], 10750.50)
+        self.assertIsNone(costs[spare.id]['current_value'])
+        self.assertEqual(costs[spare.id]['total_cost'], 0)
+
+    @unittest.skipIf(valuation.np is None, 'numpy не встановлено')
+    def test_valuation_matches_current_value(self):
+        """Векторна оцінка на сьогодні збігається з Device.current_value"""
+        devices = self._fleet()
+        fleet = valuation.load_fleet()
+        self.assertEqual(len(fleet), 2)  # пристрій без ціни не оцінюється
+        
+        report = valuation.evaluate(fleet, [date.today()], [None, 25.0])
+        expected = sum(device.current_value or 0 for device in devices)
+        self.assertAlmostEqual(report['scenarios'][0]['totals'][0]['book_value'], expected, places=2)
+        
+        # Ставка 25%: ноутбук річного віку втрачає чверть вартості
+        laptop = next(group for group in report['scenarios'][1]['groups'] if group['type'] == 'Ноутбук')
+        self.assertAlmostEqual(laptop['book_value'][0], 10000 * (1 - 0.25 * 365 / 365.25), places=2)
+        
+        # До дати покупки пристрій не враховується
+        before = valuation.evaluate(fleet, [date.today() - timedelta(days=400)])
+        self.assertEqual(before['scenarios'][0]['totals'][0]['devices'], 1)
+
+    def test_valuation_month_ends(self):
+        """Кінці місяців: лише завершені місяці, від найстарішого"""
+        self.assertEqual(
+            valuation.month_ends(3, date(2025, 3, 15)),
+            [date(2024, 12, 31), date(2025, 1, 31), date(2025, 2, 28)]
+        )
+        self.assertEqual(valuation.month_ends(1, date(2024, 2, 29)), [date(2024, 2, 29)])
+
+    @unittest.skipIf(valuation.np is None, 'numpy не встановлено')
+    def test_valuation_api_validates_arguments(self):
+        """API оцінки відхиляє months поза межами і нескінченні ставки"""
+        self._fleet()
+        admin = User(username='valuation_admin', password_hash=generate_password_hash('password'),
+                     is_admin=True, city_id=self.city.id)
+        db.session.add(admin)
+        db.session.commit()
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(admin.id)
+            sess['_fresh'] = True
+
+        for query in ('months=0', 'months=-3', f'months={valuation.MAX_AS_OF_DATES + 1}', 'months=30000',
+                      'rate=nan', 'rate=inf', 'rate=-Infinity'):
+            response = self.client.get(f'/admin/api/valuation?{query}')
+            self.assertEqual(response.status_code, 400, query)
+
+        response = self.client.get('/admin/api/valuation?months=3&rate=25')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.get_json()['as_of']), 3)
+
+    @unittest.skipIf(valuation.np is None, 'numpy не встановлено')
+    def test_valuation_command(self):
+        """Команда flask valuation виводить сценарії по датах"""
+        self._fleet()
+        result = self.app.test_cli_runner().invoke(args=['valuation', '--months', '2', '--rate', '25'])
+        
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('Сценарій: 25% на рік', result.output)
+        self.assertIn('Пристроїв: 2', result.output)
+
 if __name__ == '__main__':
     unittest.main()
 
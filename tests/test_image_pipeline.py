@@ -0,0 +1,275 @@
+"""
+Тести для обробки фото поза запитом
+"""
+import unittest
+import sys
+import os
+import io
+import shutil
+import tempfile
+
+# Додаємо кореневий каталог проєкту до PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+import app as app_module
+from app import app
+from models import db, Device, DevicePhoto, PhotoFile, City, User
+from image_pipeline import photo_pipeline, process_image, STATUS_PENDING, STATUS_READY
+from werkzeug.security import generate_password_hash
+
+def make_png(size=(1200, 900)):
+    """PNG з прозорістю в пам'яті"""
+    buffer = io.BytesIO()
+    Image.new('RGBA', size, (200, 30, 30, 128)).save(buffer, format='PNG')
+    buffer.seek(0)
+    return buffer
+
+class ImagePipelineTestCase(unittest.TestCase):
+    """Тести для PhotoPipeline та process_image"""
+
+    def setUp(self):
+        """Налаштування тестового середовища"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['WTF_CSRF_ENABLED'] = False
+        app.config['SECRET_KEY'] = 'test-secret-key'
+
+        self.upload_folder = tempfile.mkdtemp()
+        self.original_upload_folder = app.config['UPLOAD_FOLDER']
+        app.config['UPLOAD_FOLDER'] = self.upload_folder
+
+        self.app = app
+        self.client = app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+
+        self.city = City(name='Тестове місто')
+        db.session.add(self.city)
+        db.session.commit()
+
+        self.user = User(
+            username='photo_user',
+            password_hash=generate_password_hash('password'),
+            is_admin=True,
+            city_id=self.city.id
+        )
+        db.session.add(self.user)
+        self.device = Device(
+            name='Ноутбук',
+            type='Ноутбук',
+            serial_number='PHOTO_SN_1',
+            inventory_number='2025-0001',
+            city_id=self.city.id
+        )
+        db.session.add(self.device)
+        db.session.commit()
+
+    def tearDown(self):
+        """Очищення після тестів"""
+        app.config['UPLOAD_FOLDER'] = self.original_upload_folder
+        shutil.rmtree(self.upload_folder, ignore_errors=True)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def login(self):
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(self.user.id)
+            sess['_fresh'] = True
+
+    def test_process_image_variants(self):
+        """Одне декодування - оптимізований JPEG, мініатюри та WebP"""
+        path = os.path.join(self.upload_folder, 'photo.png')
+        with open(path, 'wb') as f:
+            f.write(make_png().getvalue())
+
+        result = process_image(path, max_size=1000)
+        self.assertEqual(result['filename'], 'photo.jpg')
+        self.assertEqual(result['variants'], ['thumb', 'medium', 'large', 'webp'])
+        # Оригінал PNG лишається до коміту нового імені, тимчасових файлів немає
+        self.assertEqual(
+            sorted(os.listdir(self.upload_folder)),
+            ['photo.jpg', 'photo.png', 'photo.webp', 'photo_large.jpg', 'photo_medium.jpg', 'photo_thumb.jpg']
+        )
+        with Image.open(os.path.join(self.upload_folder, 'photo.jpg')) as img:
+            self.assertEqual(img.size, (1000, 750))
+        with Image.open(os.path.join(self.upload_folder, 'photo_thumb.jpg')) as img:
+            self.assertEqual(img.width, 150)
+
+    def test_process_jpeg_replaces_original_atomically(self):
+        """Оригінал JPEG підміняється цілим файлом - відкритий читач дочитує старий"""
+        path = os.path.join(self.upload_folder, 'photo.jpg')
+        original = io.BytesIO()
+        Image.new('RGB', (2400, 1800), (200, 30, 30)).save(original, format='JPEG', quality=95)
+        with open(path, 'wb') as f:
+            f.write(original.getvalue())
+
+        with open(path, 'rb') as reader:
+            head = reader.read(100)
+            process_image(path, max_size=1000)
+            self.assertEqual(head + reader.read(), original.getvalue())
+
+        with Image.open(path) as img:
+            self.assertEqual(img.size, (1000, 750))
+        self.assertFalse([name for name in os.listdir(self.upload_folder) if name.endswith('.tmp')])
+
+    def test_upload_marks_photo_ready(self):
+        """Завантажене фото обробляється і позначається готовим"""
+        self.login()
+        response = self.client.post(
+            f'/device/{self.device.id}/add_photo',
+            data={'photo': (make_png(), 'phone.png')},
+            content_type='multipart/form-data'
+        )
+        self.assertEqual(response.status_code, 302)
+
+        photo = DevicePhoto.query.one()
+        self.assertEqual(photo.status, STATUS_READY)
+        self.assertTrue(photo.filename.endswith('_phone.jpg'))
+        self.assertTrue(photo.has_variant('thumb'))
+        self.assertTrue(photo.has_variant('webp'))
+        # Оригінал PNG видалено після коміту, рядок маніфесту відв'язано
+        original = photo.filename[:-len('.jpg')] + '.png'
+        self.assertFalse(os.path.exists(os.path.join(self.upload_folder, original)))
+        self.assertIsNone(PhotoFile.query.filter_by(filename=original).one().photo_id)
+
+    def test_pending_photo_serves_original(self):
+        """Поки фото не оброблене, віддається оригінал навіть для мініатюри"""
+        self.login()
+        with open(os.path.join(self.upload_folder, 'pending.png'), 'wb') as f:
+            f.write(make_png((50, 50)).getvalue())
+        photo = DevicePhoto(filename='pending.png', original_filename='pending.png',
+                            device_id=self.device.id, status=STATUS_PENDING)
+        db.session.add(photo)
+        db.session.commit()
+
+        response = self.client.get('/uploads/pending.png?size=thumb', headers={'Accept': 'image/webp'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'image/png')
+        response.close()
+
+    def test_photo_conditional_response(self):
+        """Версіонований URL кешується назавжди, повторний запит з ETag - 304"""
+        self.login()
+        self.client.post(
+            f'/device/{self.device.id}/add_photo',
+            data={'photo': (make_png(), 'phone.png')},
+            content_type='multipart/form-data'
+        )
+        photo = DevicePhoto.query.one()
+        with app.test_request_context():
+            url = photo_pipeline.url_for_photo(photo, 'thumb')
+        self.assertIn(f'v={photo.version}', url)
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'image/jpeg')
+        self.assertTrue(response.cache_control.immutable)
+        self.assertEqual(response.cache_control.max_age, 31536000)
+        etag = response.headers['ETag']
+        with Image.open(io.BytesIO(response.data)) as img:
+            self.assertEqual(img.width, 150)
+        response.close()
+
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+
+        # Без версії - перевалідація; WebP узгоджується за Accept
+        response = self.client.get(f'/uploads/{photo.filename}', headers={'Accept': 'image/webp'})
+        self.assertTrue(response.cache_control.no_cache)
+        self.assertEqual(response.mimetype, 'image/webp')
+        self.assertIn('Accept', response.vary)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        response.close()
+
+    def test_photo_accel_redirect(self):
+        """З PHOTO_ACCEL_REDIRECT файл віддає проксі"""
+        self.login()
+        photo = DevicePhoto(filename='a.jpg', original_filename='a.jpg', device_id=self.device.id,
+                            status=STATUS_READY, variants='thumb,medium,large,webp')
+        db.session.add(photo)
+        db.session.commit()
+
+        app.config['PHOTO_ACCEL_REDIRECT'] = '/protected-uploads/'
+        try:
+            response = self.client.get('/uploads/a.jpg?size=medium')
+        finally:
+            app.config['PHOTO_ACCEL_REDIRECT'] = None
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['X-Accel-Redirect'], '/protected-uploads/a_medium.jpg')
+        self.assertEqual(response.mimetype, 'image/jpeg')
+        self.assertEqual(response.data, b'')
+
+    def test_process_pool(self):
+        """Обробка в пулі процесів оновлює статус після завершення"""
+        path = os.path.join(self.upload_folder, 'pool.png')
+        with open(path, 'wb') as f:
+            f.write(make_png((400, 300)).getvalue())
+        photo = DevicePhoto(filename='pool.png', original_filename='pool.png',
+                            device_id=self.device.id, status=STATUS_PENDING)
+        db.session.add(photo)
+        db.session.commit()
+        photo_id = photo.id
+
+        app.config['TESTING'] = False
+        app.config['PHOTO_PROCESSING_ASYNC'] = True
+        try:
+            photo_pipeline.submit(photo_id, path)
+            photo_pipeline.shutdown(wait=True)
+        finally:
+            app.config['TESTING'] = True
+            app.config['PHOTO_PROCESSING_ASYNC'] = False
+
+        db.session.expire_all()
+        photo = db.session.get(DevicePhoto, photo_id)
+        self.assertEqual(photo.status, STATUS_READY)
+        self.assertEqual(photo.filename, 'pool.jpg')
+        self.assertEqual(photo_pipeline.stats()['inflight'], 0)
+
+    def test_first_request_requeues_pending(self):
+        """Під WSGI (без __main__) фото 'pending' обробляються після першого запиту процесу"""
+        path = os.path.join(self.upload_folder, 'restart.png')
+        with open(path, 'wb') as f:
+            f.write(make_png((400, 300)).getvalue())
+        photo = DevicePhoto(filename='restart.png', original_filename='restart.png',
+                            device_id=self.device.id, status=STATUS_PENDING)
+        db.session.add(photo)
+        db.session.commit()
+        photo_id = photo.id
+
+        app.config['TESTING'] = False
+        app.config['PHOTO_PROCESSING_ASYNC'] = False
+        app_module._startup_thread = None
+        try:
+            self.client.get('/login')
+            app_module._startup_thread.join(10)
+            # Наступні запити задачі повторно не запускають
+            thread = app_module._startup_thread
+            self.client.get('/login')
+            self.assertIs(app_module._startup_thread, thread)
+        finally:
+            app.config['TESTING'] = True
+
+        db.session.expire_all()
+        photo = db.session.get(DevicePhoto, photo_id)
+        self.assertEqual(photo.status, STATUS_READY)
+        self.assertEqual(photo.filename, 'restart.jpg')
+
+    def test_failed_duplicate_keeps_ready(self):
+        """Помилка повторної обробки не скасовує статус уже обробленого фото"""
+        photo = DevicePhoto(filename='done.jpg', original_filename='done.png', device_id=self.device.id,
+                            status=STATUS_READY, variants='thumb,medium,large,webp')
+        db.session.add(photo)
+        db.session.commit()
+
+        photo_pipeline.submit(photo.id, os.path.join(self.upload_folder, 'done.png'))
+        db.session.expire_all()
+        self.assertEqual(db.session.get(DevicePhoto, photo.id).status, STATUS_READY)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+"""
+Тести метрик Prometheus і журналу повільних запитів
+"""
+import unittest
+import sys
+import os
+
+# Додаємо кореневий каталог проєкту до PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+from config import ProductionConfig
+from models import db
+from metrics import metrics
+
+
+class MetricsTestCase(unittest.TestCase):
+    """Тести /metrics, метрик запитів і задач планувальника"""
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.app = app
+        self.client = app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        metrics.reset()
+
+    def tearDown(self):
+        app.config['METRICS_TOKEN'] = None
+        app.config['METRICS_REQUIRE_TOKEN'] = False
+        app.config['METRICS_SLOW_REQUEST_MS'] = 0
+        app.config['QUERY_RECORD_STATEMENTS'] = False
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_request_metrics(self):
+        """Запити рахуються по endpoint'ах разом з часом у базі та кількістю SQL"""
+        for _ in range(2):
+            self.assertEqual(self.client.get('/health').status_code, 200)
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        body = response.get_data(as_text=True)
+
+        self.assertIn('inventory_http_requests_total{endpoint="health_check",method="GET",status="200"} 2', body)
+        self.assertIn('inventory_http_request_duration_seconds_bucket{endpoint="health_check",method="GET",le="+Inf"} 2', body)
+        self.assertIn('inventory_http_request_duration_seconds_count{endpoint="health_check",method="GET"} 2', body)
+        # /health виконує рівно один SELECT 1
+        self.assertIn('inventory_http_request_queries_bucket{endpoint="health_check",le="1"} 2', body)
+        self.assertIn('inventory_http_request_queries_bucket{endpoint="health_check",le="0"} 0', body)
+        self.assertIn('inventory_http_request_db_seconds_count{endpoint="health_check"} 2', body)
+        self.assertIn('inventory_cache_hit_ratio{cache="app_cache"}', body)
+        self.assertIn('# TYPE inventory_scheduler_job_duration_seconds histogram', body)
+
+    def test_metrics_token(self):
+        """З METRICS_TOKEN метрики віддаються лише з правильним токеном"""
+        app.config['METRICS_TOKEN'] = 'secret'
+
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code, 401)
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_metrics_require_token(self):
+        """У продакшені без METRICS_TOKEN /metrics недоступний"""
+        self.assertTrue(ProductionConfig.METRICS_REQUIRE_TOKEN)
+        app.config['METRICS_REQUIRE_TOKEN'] = True
+
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+        app.config['METRICS_TOKEN'] = 'secret'
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_slow_request_log_includes_sql(self):
+        """Повільний запит пишеться в лог разом із виконаним SQL"""
+        app.config['METRICS_SLOW_REQUEST_MS'] = 0.001
+        app.config['QUERY_RECORD_STATEMENTS'] = True
+
+        with self.assertLogs(app.logger, level='WARNING') as logs:
+            self.client.get('/health')
+
+        message = next(record for record in logs.output if 'Повільний запит' in record)
+        self.assertIn('GET /health (health_check) -> 200', message)
+        self.assertIn('SQL: 1 запитів', message)
+        self.assertIn('SELECT 1', message)
+        self.assertIn('inventory_http_slow_requests_total{endpoint="health_check"} 1', metrics.render())
+
+    def test_scheduler_job_metrics(self):
+        """Тривалість і помилки задач планувальника"""
+        def failing_job():
+            raise RuntimeError('boom')
+
+        metrics.timed_job('cleanup', lambda: None)()
+        with self.assertRaises(RuntimeError):
+            metrics.timed_job('backup', failing_job)()
+
+        body = metrics.render()
+        self.assertIn('inventory_scheduler_job_duration_seconds_count{job="cleanup"} 1', body)
+        self.assertIn('inventory_scheduler_job_duration_seconds_count{job="backup"} 1', body)
+        self.assertIn('inventory_scheduler_job_failures_total{job="backup"} 1', body)
+        self.assertNotIn('inventory_scheduler_job_failures_total{job="cleanup"}', body)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+"""
+Тести для keyset (cursor) пагінації
+"""
+import unittest
+import sys
+import os
+from datetime import datetime, timedelta
+
+# Додаємо кореневий каталог проєкту до PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+from models import db, Device, City
+from pagination import keyset_paginate, encode_cursor, InvalidCursorError
+
+class KeysetPaginationTestCase(unittest.TestCase):
+    """Тести для keyset пагінації"""
+
+    def setUp(self):
+        """Налаштування тестового середовища"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['WTF_CSRF_ENABLED'] = False
+
+        self.app = app
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+
+        self.city = City(name='Тестове місто')
+        db.session.add(self.city)
+        db.session.commit()
+
+        # Дублікати та NULL у location перевіряють стабільність ключа (location, id)
+        base_time = datetime(2025, 1, 1)
+        locations = ['Склад', None, 'Офіс', 'Склад', None, 'Архів', 'Офіс', 'Склад', None, 'Архів', 'Офіс']
+        for i, location in enumerate(locations):
+            db.session.add(Device(
+                name=f'Пристрій {i:02d}',
+                type='Комп\'ютер',
+                serial_number=f'PAGE_SN_{i:03d}',
+                inventory_number=f'2025-{i+1:04d}',
+                location=location,
+                created_at=base_time + timedelta(days=i // 2),
+                city_id=self.city.id
+            ))
+        db.session.commit()
+
+    def tearDown(self):
+        """Очищення після тестів"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def walk(self, sort_key, descending):
+        """Проходить усі сторінки вперед, потім назад, повертає id в обох напрямках"""
+        pages = []
+        cursor = None
+        while True:
+            page = keyset_paginate(Device.query, Device, sort_key, descending=descending, per_page=3, cursor=cursor)
+            pages.append(page)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+
+        forward = [d.id for page in pages for d in page.items]
+
+        backward_pages = [pages[-1]]
+        while backward_pages[-1].has_prev:
+            backward_pages.append(keyset_paginate(
+                Device.query, Device, sort_key, descending=descending, per_page=3,
+                cursor=backward_pages[-1].prev_cursor
+            ))
+        backward = [d.id for page in reversed(backward_pages) for d in page.items]
+        return forward, backward
+
+    def expected_order(self, sort_key, descending):
+        """Очікуваний порядок: NULL найменші (як у SQLite), id як другий ключ"""
+        devices = Device.query.all()
+
+        def key(device):
+            value = getattr(device, sort_key)
+            return (value is not None, value if value is not None else '', device.id)
+
+        return [d.id for d in sorted(devices, key=key, reverse=descending)]
+
+    def test_forward_and_backward_all_sort_orders(self):
+        """Обхід сторінок вперед і назад повертає всі записи без пропусків і дублів"""
+        for sort_key in ('id', 'name', 'location', 'created_at'):
+            for descending in (False, True):
+                with self.subTest(sort_key=sort_key, descending=descending):
+                    forward, backward = self.walk(sort_key, descending)
+                    expected = self.expected_order(sort_key, descending)
+                    self.assertEqual(forward, expected)
+                    self.assertEqual(backward, expected)
+
+    def test_first_page_has_no_prev(self):
+        """Перша сторінка не має попередньої, total не рахується за замовчуванням"""
+        page = keyset_paginate(Device.query, Device, 'created_at', descending=True, per_page=5)
+        self.assertFalse(page.has_prev)
+        self.assertTrue(page.has_next)
+        self.assertIsNone(page.total)
+
+    def test_optional_total(self):
+        """Точна кількість рахується лише на вимогу"""
+        page = keyset_paginate(Device.query, Device, 'id', per_page=5, with_total=True)
+        self.assertEqual(page.total, 11)
+
+    def test_cursor_bound_to_sort(self):
+        """Курсор іншого сортування або пошкоджений курсор відхиляються"""
+        cursor = encode_cursor('name', False, 'Пристрій 01', 2, 'next')
+        with self.assertRaises(InvalidCursorError):
+            keyset_paginate(Device.query, Device, 'location', cursor=cursor)
+        with self.assertRaises(InvalidCursorError):
+            keyset_paginate(Device.query, Device, 'name', cursor='not-a-cursor')
+
+if __name__ == '__main__':
+    unittest.main()
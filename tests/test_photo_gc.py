@@ -0,0 +1,154 @@
+"""
+Тести для збирача сміття фото (маніфест photo_file)
+"""
+import unittest
+import sys
+import os
+import io
+import time
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+
+# Додаємо кореневий каталог проєкту до PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from app import app
+from models import db, Device, DevicePhoto, PhotoFile, City, User
+from photo_gc import collect_orphan_photos, scan_untracked_files
+from werkzeug.security import generate_password_hash
+
+class PhotoGCTestCase(unittest.TestCase):
+    """Тести для photo_gc"""
+
+    def setUp(self):
+        """Налаштування тестового середовища"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['WTF_CSRF_ENABLED'] = False
+        app.config['SECRET_KEY'] = 'test-secret-key'
+
+        self.upload_folder = tempfile.mkdtemp()
+        self.original_upload_folder = app.config['UPLOAD_FOLDER']
+        app.config['UPLOAD_FOLDER'] = self.upload_folder
+
+        self.app = app
+        self.client = app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+
+        self.city = City(name='Тестове місто')
+        db.session.add(self.city)
+        db.session.commit()
+
+        self.user = User(
+            username='gc_user',
+            password_hash=generate_password_hash('password'),
+            is_admin=True,
+            city_id=self.city.id
+        )
+        db.session.add(self.user)
+        self.device = Device(
+            name='Принтер',
+            type='Принтер',
+            serial_number='GC_SN_1',
+            inventory_number='2025-0002',
+            city_id=self.city.id
+        )
+        db.session.add(self.device)
+        db.session.commit()
+
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(self.user.id)
+            sess['_fresh'] = True
+
+    def tearDown(self):
+        """Очищення після тестів"""
+        app.config['UPLOAD_FOLDER'] = self.original_upload_folder
+        shutil.rmtree(self.upload_folder, ignore_errors=True)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def upload_photo(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (640, 480), (10, 120, 200)).save(buffer, format='PNG')
+        buffer.seek(0)
+        self.client.post(
+            f'/device/{self.device.id}/add_photo',
+            data={'photo': (buffer, 'label.png')},
+            content_type='multipart/form-data'
+        )
+        return DevicePhoto.query.one()
+
+    def write_file(self, filename, age_minutes=0):
+        path = os.path.join(self.upload_folder, filename)
+        with open(path, 'wb') as f:
+            f.write(b'data')
+        if age_minutes:
+            mtime = time.time() - age_minutes * 60
+            os.utime(path, (mtime, mtime))
+        return path
+
+    def test_manifest_tracks_processed_variants(self):
+        """Оригінал (після конвертації в JPEG) та всі варіанти записані в маніфест"""
+        photo = self.upload_photo()
+        files = {row.filename: row.variant for row in PhotoFile.query.filter_by(photo_id=photo.id)}
+        self.assertEqual(set(files), set(os.listdir(self.upload_folder)))
+        self.assertEqual(sorted(files.values()), ['large', 'medium', 'original', 'thumb', 'webp'])
+        self.assertEqual(files[photo.filename], 'original')
+
+    def test_delete_device_removes_all_variants(self):
+        """Видалення пристрою прибирає оригінал і всі варіанти фото"""
+        photo = self.upload_photo()
+        photo_id = photo.id
+        self.assertEqual(len(os.listdir(self.upload_folder)), 5)
+
+        response = self.client.post(f'/device/{self.device.id}/delete')
+        self.assertEqual(response.status_code, 302)
+
+        self.assertEqual(os.listdir(self.upload_folder), [])
+        self.assertEqual(PhotoFile.query.filter_by(photo_id=photo_id).count(), 0)
+        # 5 файлів фото + оригінал PNG, звільнений після конвертації в JPEG
+        released = PhotoFile.query.filter(PhotoFile.photo_id.is_(None)).all()
+        self.assertEqual(len(released), 6)
+        self.assertTrue(all(row.released_at for row in released))
+
+    def test_collect_orphans_in_batches(self):
+        """Відв'язані файли видаляються пакетами, нові - лише після захисного інтервалу"""
+        old = datetime.utcnow() - timedelta(hours=2)
+        for index in range(5):
+            self.write_file(f'old_{index}.jpg')
+            db.session.add(PhotoFile(filename=f'old_{index}.jpg', variant='original', created_at=old))
+        self.write_file('fresh.jpg')
+        db.session.add(PhotoFile(filename='fresh.jpg', variant='original'))
+        self.write_file('used.jpg')
+        photo = DevicePhoto(filename='used.jpg', original_filename='used.jpg', device_id=self.device.id, status='ready')
+        db.session.add(PhotoFile(filename='used.jpg', variant='original', photo=photo, created_at=old))
+        db.session.commit()
+
+        self.assertEqual(collect_orphan_photos(batch_size=2, max_batches=1), 2)
+        self.assertEqual(collect_orphan_photos(batch_size=2), 3)
+        self.assertEqual(sorted(os.listdir(self.upload_folder)), ['fresh.jpg', 'used.jpg'])
+        self.assertEqual(sorted(row.filename for row in PhotoFile.query), ['fresh.jpg', 'used.jpg'])
+
+        self.assertEqual(collect_orphan_photos(grace_minutes=0), 1)
+        self.assertEqual(os.listdir(self.upload_folder), ['used.jpg'])
+
+    def test_scan_untracked_files(self):
+        """Файли поза маніфестом видаляються, якщо старші за захисний інтервал"""
+        self.write_file('stray.jpg', age_minutes=120)
+        self.write_file('uploading.jpg')
+        self.write_file('tracked.jpg', age_minutes=120)
+        db.session.add(PhotoFile(filename='tracked.jpg', variant='original'))
+        db.session.commit()
+
+        self.assertEqual(scan_untracked_files(batch_size=1), 1)
+        self.assertEqual(sorted(os.listdir(self.upload_folder)), ['tracked.jpg', 'uploading.jpg'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+"""
+Тести обліку SQL-запитів і виявлення N+1
+"""
+import unittest
+import sys
+import os
+
+# Додаємо кореневий каталог проєкту до PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+from models import db, Device, DeviceHistory, City, User
+from query_stats import query_inspector, NPlusOneError
+from werkzeug.datastructures import MultiDict
+from werkzeug.security import generate_password_hash
+
+
+class QueryStatsTestCase(unittest.TestCase):
+    """Тести лічильників запитів і eager loading у представленнях"""
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        app.config['QUERY_N_PLUS_ONE_RAISE'] = True
+
+        self.app = app
+        self.client = app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+
+        # Пристрої в різних містах: ледаче device.city - окремий запит на кожне місто
+        self.cities = [City(name=f'Місто {i}') for i in range(6)]
+        db.session.add_all(self.cities)
+        db.session.commit()
+
+        self.user = User(
+            username='querystats',
+            password_hash=generate_password_hash('password'),
+            is_admin=True,
+            city_id=self.cities[0].id
+        )
+        db.session.add(self.user)
+        self.devices = [
+            Device(name=f'Пристрій {i}', type='Принтер', serial_number=f'QS_SN_{i}',
+                   inventory_number=f'2025-{i + 1:04d}', status='В роботі', city_id=city.id)
+            for i, city in enumerate(self.cities)
+        ]
+        db.session.add_all(self.devices)
+        db.session.commit()
+        self.user_id = self.user.id
+        self.device_ids = [device.id for device in self.devices]
+        db.session.expunge_all()
+
+    def tearDown(self):
+        app.config['QUERY_N_PLUS_ONE_RAISE'] = False
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def login(self):
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(self.user_id)
+            sess['_fresh'] = True
+
+    def test_capture_detects_lazy_loads(self):
+        """Ледаче завантаження зв'язку в циклі розпізнається як N+1"""
+        with query_inspector.capture() as counter:
+            names = [device.city.name for device in Device.query.all()]
+
+        self.assertEqual(len(names), 6)
+        self.assertEqual(counter.queries, 7)
+        self.assertEqual(counter.lazy_loads['Device.city'], 6)
+        self.assertEqual(counter.n_plus_one(5), [('Device.city', 6)])
+
+    def test_history_entries_eager_load_user(self):
+        """Історія пристрою завантажує авторів змін тим самим запитом"""
+        from blueprints.devices import _device_history_entries
+
+        device_id = self.device_ids[0]
+        db.session.add_all(
+            DeviceHistory(device_id=device_id, user_id=self.user_id, action='update', field='status')
+            for _ in range(6)
+        )
+        db.session.commit()
+        db.session.expunge_all()
+
+        with query_inspector.capture() as counter:
+            usernames = {entry.user.username for entry in _device_history_entries(device_id)}
+
+        self.assertEqual(usernames, {'querystats'})
+        self.assertEqual(counter.queries, 1)
+        self.assertFalse(counter.lazy_loads)
+
+    def test_bulk_print_without_n_plus_one(self):
+        """Масовий друк читає міста разом з пристроями; лічильник у заголовку та статистиці"""
+        self.login()
+        query_inspector.reset()
+        data = MultiDict([('device_ids', device_id) for device_id in self.device_ids])
+
+        response = self.client.post('/devices/bulk_print_inventory', data=data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('X-Query-Count', response.headers)
+        endpoint = next(
+            item for item in query_inspector.stats()['endpoints']
+            if item['endpoint'] == 'devices.bulk_print_inventory'
+        )
+        self.assertEqual(endpoint['n_plus_one'], 0)
+        self.assertLess(endpoint['max_queries'], 6)
+
+    def test_n_plus_one_raises_in_tests(self):
+        """З QUERY_N_PLUS_ONE_RAISE запит з N+1 завершується помилкою"""
+        from flask import Response
+
+        with app.test_request_context('/devices'):
+            query_inspector._start_request()
+            try:
+                [device.city.name for device in Device.query.all()]
+                with self.assertRaises(NPlusOneError):
+                    query_inspector._finish_request(Response())
+            finally:
+                query_inspector._teardown_request(None)
+
+        self.assertEqual(query_inspector.stats()['n_plus_one'][-1]['relationships'], {'Device.city': 6})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+"""
+Тести для сервісу повнотекстового пошуку пристроїв
+"""
+import unittest
+import sys
+import os
+
+# Додаємо кореневий каталог проєкту до PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+from app import app
+from models import db, Device, City
+from search_service import apply_device_search, drop_search_index, is_fts_available, rebuild_search_index
+
+class SearchServiceTestCase(unittest.TestCase):
+    """Тести для пошукового індексу"""
+
+    def setUp(self):
+        """Налаштування тестового середовища"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['WTF_CSRF_ENABLED'] = False
+
+        self.app = app
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+
+        self.city = City(name='Тестове місто')
+        db.session.add(self.city)
+        db.session.commit()
+
+        self.laptop = Device(
+            name='Ноутбук Dell Latitude',
+            type='Ноутбук',
+            serial_number='DL-5520-XYZ',
+            inventory_number='2025-0001',
+            location='Кабінет 101',
+            notes='Видано бухгалтерії',
+            city_id=self.city.id
+        )
+        self.printer = Device(
+            name='Принтер HP LaserJet',
+            type='Принтер',
+            serial_number='HP-M404-ABC',
+            inventory_number='2025-0002',
+            location='Кабінет 202',
+            city_id=self.city.id
+        )
+        db.session.add_all([self.laptop, self.printer])
+        db.session.commit()
+
+    def tearDown(self):
+        """Очищення після тестів"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def search(self, text, **kwargs):
+        return apply_device_search(Device.query, text, **kwargs).order_by(Device.id).all()
+
+    def test_fts_index_created(self):
+        """FTS5 індекс створюється разом з таблицею device"""
+        self.assertTrue(is_fts_available())
+
+    def test_substring_case_insensitive(self):
+        """Пошук підрядка без урахування регістру (включно з кирилицею)"""
+        self.assertEqual(self.search('latitude'), [self.laptop])
+        self.assertEqual(self.search('НОУТБУК'), [self.laptop])
+        self.assertEqual(self.search('m404'), [self.printer])
+        self.assertEqual(self.search('Кабінет'), [self.laptop, self.printer])
+
+    def test_field_restriction(self):
+        """Пошук лише по вказаних полях"""
+        self.assertEqual(self.search('бухгалтерії'), [self.laptop])
+        self.assertEqual(self.search('бухгалтерії', fields=('name', 'serial_number')), [])
+
+    def test_short_query_fallback(self):
+        """Короткі запити (менше 3 символів) працюють через LIKE"""
+        self.assertEqual(self.search('HP'), [self.printer])
+
+    def test_quotes_escaped(self):
+        """Лапки в запиті не ламають синтаксис FTS5"""
+        self.assertEqual(self.search('"Dell'), [])
+
+    def test_index_synced_on_update_and_delete(self):
+        """Індекс синхронізується при оновленні та видаленні пристрою"""
+        self.printer.name = 'Сканер Canon'
+        db.session.commit()
+        self.assertEqual(self.search('LaserJet'), [])
+        self.assertEqual(self.search('canon'), [self.printer])
+
+        db.session.delete(self.laptop)
+        db.session.commit()
+        self.assertEqual(self.search('Dell'), [])
+
+    def test_rebuild_search_index(self):
+        """Перебудова індексу зберігає результати пошуку"""
+        self.assertTrue(rebuild_search_index())
+        self.assertEqual(self.search('LaserJet'), [self.printer])
+
+    def test_first_request_creates_missing_index(self):
+        """Під WSGI індекс старої бази створюється після першого запиту процесу"""
+        with db.engine.begin() as connection:
+            drop_search_index(connection)
+        self.assertFalse(is_fts_available())
+
+        app.config['TESTING'] = False
+        app_module._startup_thread = None
+        try:
+            app.test_client().get('/login')
+            app_module._startup_thread.join(10)
+        finally:
+            app.config['TESTING'] = True
+
+        self.assertTrue(is_fts_available())
+        self.assertEqual(self.search('latitude'), [self.laptop])
+
+if __name__ == '__main__':
+    unittest.main()
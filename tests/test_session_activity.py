@@ -0,0 +1,106 @@
+"""
+Тести для відстеження активності сесій
+"""
+import unittest
+import sys
+import os
+from datetime import datetime, timedelta
+
+# Додаємо кореневий каталог проєкту до PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+from models import db, City, User, UserSession
+from session_activity import session_activity
+from utils import cleanup_expired_sessions
+from werkzeug.security import generate_password_hash
+
+class SessionActivityTestCase(unittest.TestCase):
+    """Тести для пакетного запису last_activity"""
+
+    def setUp(self):
+        """Налаштування тестового середовища"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['WTF_CSRF_ENABLED'] = False
+        app.config['SECRET_KEY'] = 'test-secret-key'
+
+        self.app = app
+        self.client = app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+
+        self.city = City(name='Тестове місто')
+        db.session.add(self.city)
+        db.session.commit()
+
+        self.user = User(
+            username='session_user',
+            password_hash=generate_password_hash('password'),
+            city_id=self.city.id
+        )
+        db.session.add(self.user)
+        db.session.commit()
+
+        session_activity.flush()
+
+    def tearDown(self):
+        """Очищення після тестів"""
+        session_activity.flush()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def login(self):
+        response = self.client.post('/login', data={'username': 'session_user', 'password': 'password'})
+        self.assertEqual(response.status_code, 302)
+        return UserSession.query.filter_by(user_id=self.user.id).one()
+
+    def test_login_creates_session(self):
+        """Вхід створює запис сесії, вихід - деактивує"""
+        user_session = self.login()
+        self.assertTrue(user_session.is_active)
+
+        self.client.get('/logout')
+        db.session.expire_all()
+        self.assertFalse(db.session.get(UserSession, user_session.id).is_active)
+
+    def test_requests_batched_and_static_skipped(self):
+        """Активність накопичується в пам'яті, статика не враховується"""
+        user_session = self.login()
+        old_activity = datetime.utcnow() - timedelta(hours=1)
+        user_session.last_activity = old_activity
+        db.session.commit()
+
+        self.client.get('/static/manifest.json')
+        self.client.get('/health')
+        self.assertEqual(session_activity.stats()['pending'], 0)
+
+        for _ in range(3):
+            self.assertEqual(self.client.get('/api/search?q=x').status_code, 200)
+        self.assertEqual(session_activity.stats()['pending'], 1)
+
+        # До flush база не змінюється
+        db.session.expire_all()
+        self.assertEqual(db.session.get(UserSession, user_session.id).last_activity, old_activity)
+
+        self.assertEqual(session_activity.flush(), 1)
+        db.session.expire_all()
+        self.assertGreater(db.session.get(UserSession, user_session.id).last_activity, old_activity)
+
+    def test_cleanup_reads_flushed_activity(self):
+        """Очищення сесій враховує ще не записану активність"""
+        user_session = self.login()
+        user_session.last_activity = datetime.utcnow() - timedelta(hours=1)
+        db.session.commit()
+
+        self.client.get('/api/search?q=x')
+        self.assertEqual(cleanup_expired_sessions(inactivity_timeout_minutes=30), 0)
+
+        db.session.expire_all()
+        self.assertTrue(db.session.get(UserSession, user_session.id).is_active)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+"""
+Тести профілю SQLite (PRAGMA на з'єднанні, обслуговування, порівняльний тест)
+"""
+import unittest
+import sys
+import os
+import tempfile
+import shutil
+
+# Додаємо кореневий каталог проєкту до PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+
+from app import app
+from models import db
+from sqlite_profile import (
+    sqlite_profile, pragma_statements, listen_pragmas, is_memory_database, compare_profiles
+)
+
+
+class SQLiteProfileTestCase(unittest.TestCase):
+    """Тести PRAGMA профілю та задач обслуговування"""
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.app = app
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_app_engine_uses_profile(self):
+        """З'єднання бази додатку отримують PRAGMA профілю"""
+        self.assertTrue(sqlite_profile.enabled)
+        database = sqlite_profile.stats()['databases'][0]
+
+        self.assertEqual(database['journal_mode'], 'wal')
+        self.assertEqual(database['synchronous'], 1)  # NORMAL
+        self.assertEqual(database['busy_timeout'], app.config['SQLITE_BUSY_TIMEOUT_MS'])
+        self.assertEqual(database['cache_size'], -app.config['SQLITE_CACHE_SIZE_KB'])
+        self.assertEqual(database['temp_store'], 2)  # MEMORY
+
+    def test_pragma_statements(self):
+        """Для бази в пам'яті WAL і mmap пропускаються; недопустимі значення відхиляються"""
+        config = dict(app.config)
+        statements = pragma_statements(config)
+        self.assertIn('PRAGMA journal_mode=WAL', statements)
+        self.assertIn('PRAGMA synchronous=NORMAL', statements)
+
+        memory = pragma_statements(config, memory=True)
+        self.assertFalse([statement for statement in memory if 'journal_mode' in statement or 'mmap' in statement])
+        self.assertTrue(is_memory_database(make_url('sqlite:///:memory:')))
+        self.assertFalse(is_memory_database(make_url('sqlite:////tmp/inventory.db')))
+
+        config['SQLITE_SYNCHRONOUS'] = 'SOMETIMES'
+        with self.assertRaises(ValueError):
+            pragma_statements(config)
+
+    def test_listen_pragmas_on_new_engine(self):
+        """Кожне нове з'єднання рушія виконує PRAGMA"""
+        engine = create_engine(f"sqlite:///{os.path.join(self.folder, 'profile.db')}")
+        listen_pragmas(engine, pragma_statements(app.config))
+        try:
+            with engine.connect() as connection:
+                self.assertEqual(connection.exec_driver_sql('PRAGMA journal_mode').scalar(), 'wal')
+                self.assertEqual(connection.exec_driver_sql('PRAGMA busy_timeout').scalar(), 5000)
+        finally:
+            engine.dispose()
+
+    def test_checkpoint_and_optimize(self):
+        """Контрольна точка та PRAGMA optimize запам'ятовують результат"""
+        results = sqlite_profile.checkpoint('PASSIVE')
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]['mode'], 'PASSIVE')
+        self.assertFalse(results[0]['busy'])
+
+        report = sqlite_profile.optimize()
+        self.assertEqual(report['checkpoint'][0]['mode'], 'TRUNCATE')
+        stats = sqlite_profile.stats()
+        self.assertIsNotNone(stats['last_checkpoint'])
+        self.assertIsNotNone(stats['last_optimize'])
+
+        with self.assertRaises(ValueError):
+            sqlite_profile.checkpoint('SOON')
+
+    def test_benchmark_compares_profiles(self):
+        """Порівняльний тест проганяє обидва режими журналу"""
+        report = compare_profiles(app.config, seconds=0.3, readers=2, writers=1, devices=200)
+
+        self.assertEqual(report['rollback']['journal_mode'], 'delete')
+        self.assertEqual(report['profile']['journal_mode'], 'wal')
+        for key in ('rollback', 'profile'):
+            self.assertGreater(report[key]['reads'], 0)
+            self.assertGreater(report[key]['writes'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+"""
+Тести для агрегованої статистики пристроїв
+"""
+import unittest
+import sys
+import os
+import json
+from datetime import date, datetime
+
+# Додаємо кореневий каталог проєкту до PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from app import app
+from models import db, Device, City, User
+from stats_service import device_stats, last_months
+from werkzeug.security import generate_password_hash
+
+class StatsServiceTestCase(unittest.TestCase):
+    """Тести для DeviceStatsService"""
+
+    def setUp(self):
+        """Налаштування тестового середовища"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['WTF_CSRF_ENABLED'] = False
+        app.config['SECRET_KEY'] = 'test-secret-key'
+
+        self.app = app
+        self.client = app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+        device_stats.invalidate()
+
+        self.city = City(name='Київ')
+        self.other_city = City(name='Львів')
+        db.session.add_all([self.city, self.other_city])
+        db.session.commit()
+
+        self.admin = User(
+            username='stats_admin',
+            password_hash=generate_password_hash('password'),
+            city_id=self.city.id,
+            is_admin=True
+        )
+        db.session.add(self.admin)
+
+        statuses = ['В роботі', 'В роботі', 'На ремонті', 'Списано']
+        for i, status in enumerate(statuses):
+            db.session.add(Device(
+                name=f'Пристрій {i}',
+                type='Монітор' if i % 2 else 'Ноутбук',
+                serial_number=f'STATS_SN_{i}',
+                inventory_number=f'2025-{i+1:04d}',
+                status=status,
+                city_id=self.city.id
+            ))
+        db.session.add(Device(
+            name='Старий принтер',
+            type='Принтер',
+            serial_number='STATS_SN_OLD',
+            inventory_number='2020-0001',
+            status='В роботі',
+            city_id=self.other_city.id,
+            created_at=datetime(2020, 1, 15)
+        ))
+        db.session.commit()
+
+    def tearDown(self):
+        """Очищення після тестів"""
+        device_stats.invalidate()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def count_queries(self, func):
+        """Виконує func і повертає кількість SELECT до таблиць device та device_counters"""
+        statements = []
+
+        def on_execute(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().startswith('SELECT') and 'FROM device' in statement:
+                statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', on_execute)
+        try:
+            func()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', on_execute)
+        return len(statements)
+
+    def test_last_months_calendar(self):
+        """Останні 12 календарних місяців без наближення 30 днями"""
+        months = last_months(date(2025, 3, 31))
+        self.assertEqual(len(months), 12)
+        self.assertEqual(months[0], date(2024, 4, 1))
+        self.assertEqual(months[-1], date(2025, 3, 1))
+
+    def test_single_grouped_query(self):
+        """Усі лічильники - одним запитом до device_counters, повторне звернення - з кешу"""
+        queries = self.count_queries(lambda: device_stats.get())
+        self.assertEqual(queries, 1)
+
+        stats = device_stats.get()
+        self.assertEqual(stats['total'], 5)
+        self.assertEqual(stats['by_status'], {'В роботі': 3, 'На ремонті': 1, 'Списано': 1})
+        self.assertEqual(stats['by_city'], [('Київ', 4), ('Львів', 1)])
+        self.assertEqual(stats['by_month'][-1][1], 4)
+        self.assertEqual(sum(count for _, count in stats['by_month']), 4)
+
+        self.assertEqual(self.count_queries(lambda: device_stats.get()), 0)
+
+    def test_city_scope_and_invalidation(self):
+        """Статистика окремо для міста, кеш скидається після зміни пристроїв"""
+        counters = device_stats.status_counters(self.other_city.id)
+        self.assertEqual(counters, {
+            'total_devices': 1,
+            'active_devices': 1,
+            'repair_devices': 0,
+            'decommissioned_devices': 0,
+        })
+
+        device = Device.query.filter_by(serial_number='STATS_SN_OLD').one()
+        device.status = 'Списано'
+        db.session.commit()
+
+        counters = device_stats.status_counters(self.other_city.id)
+        self.assertEqual(counters['active_devices'], 0)
+        self.assertEqual(counters['decommissioned_devices'], 1)
+
+    def test_charts_share_query(self):
+        """Усі графіки панелі адміністратора використовують один агрегований запит"""
+        response = self.client.post('/login', data={'username': 'stats_admin', 'password': 'password'})
+        self.assertEqual(response.status_code, 302)
+
+        def load_dashboard():
+            for chart in ('devices-by-status', 'devices-by-type', 'devices-by-month', 'devices-by-city'):
+                self.assertEqual(self.client.get(f'/admin/api/chart/{chart}').status_code, 200)
+
+        self.assertEqual(self.count_queries(load_dashboard), 1)
+
+        data = json.loads(self.client.get('/admin/api/chart/devices-by-month').data)
+        self.assertEqual(len(data['labels']), 12)
+        self.assertEqual(data['data'][-1], 4)
+
+if __name__ == '__main__':
+    unittest.main()
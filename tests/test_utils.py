@@ -2,18 +2,22 @@ import unittest
 import sys
 import os
 import tempfile
-from datetime import datetime
+from datetime import datetime, timedelta
 
 # Додаємо кореневий каталог проєкту до PYTHONPATH
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app import app
-from models import db, Device, City, User, Notification
+from models import db, Device, City, User, Notification, ApiToken, TokenBlacklist, UserSession
 from utils import (
     generate_inventory_number,
+    reserve_inventory_numbers,
     allowed_file,
     backup_database,
-    check_maintenance_reminders
+    check_maintenance_reminders,
+    cleanup_expired_sessions,
+    cleanup_expired_blacklist,
+    cleanup_expired_api_tokens
 )
 from werkzeug.security import generate_password_hash
 
@@ -88,6 +92,80 @@ class UtilsTestCase(unittest.TestCase):
             expected_num = f'{datetime.now().year}-{i+1:04d}'
             self.assertEqual(device.inventory_number, expected_num)
     
+    def test_reserve_inventory_numbers_block(self):
+        """Тест резервування блоку номерів після існуючих (включно з номерами > 9999)"""
+        year = datetime.now().year
+        db.session.add(Device(name='Старий', type='Тест', serial_number='SN_OLD',
+                              inventory_number=f'{year}-9999', city_id=self.city.id))
+        db.session.add(Device(name='Новий', type='Тест', serial_number='SN_NEW',
+                              inventory_number=f'{year}-10000', city_id=self.city.id))
+        db.session.commit()
+        
+        block = reserve_inventory_numbers(3)
+        self.assertEqual(block, [f'{year}-10001', f'{year}-10002', f'{year}-10003'])
+        self.assertEqual(generate_inventory_number(), f'{year}-10004')
+        self.assertEqual(reserve_inventory_numbers(0), [])
+    
+    def test_reserve_inventory_numbers_concurrent(self):
+        """Тест конкурентного виділення номерів без дублікатів"""
+        import threading
+        
+        results = []
+        errors = []
+        
+        def worker():
+            try:
+                with app.app_context():
+                    for _ in range(5):
+                        results.extend(reserve_inventory_numbers(2))
+            except Exception as e:
+                errors.append(e)
+        
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(errors, [])
+        self.assertEqual(len(results), 40)
+        self.assertEqual(len(set(results)), 40)
+    
+    def test_cleanup_jobs_in_chunks(self):
+        """Очищення сесій, blacklist та API токенів пакетними UPDATE/DELETE"""
+        user = User(username='cleanup_user', password_hash='x', city_id=self.city.id)
+        db.session.add(user)
+        db.session.commit()
+        
+        now = datetime.utcnow()
+        for i in range(7):
+            db.session.add(UserSession(user_id=user.id, session_id=f'old_{i}', last_activity=now - timedelta(hours=2)))
+            db.session.add(TokenBlacklist(token_id=f'bl_old_{i}', user_id=user.id, expires_at=now - timedelta(minutes=1)))
+            db.session.add(ApiToken(token_id=f'api_old_{i}', user_id=user.id, expires_at=now - timedelta(days=30)))
+        db.session.add(UserSession(user_id=user.id, session_id='fresh', last_activity=now))
+        db.session.add(TokenBlacklist(token_id='bl_fresh', user_id=user.id, expires_at=now + timedelta(hours=1)))
+        # Прострочений нещодавно - ще зберігається протягом API_TOKEN_RETENTION_DAYS
+        db.session.add(ApiToken(token_id='api_recent', user_id=user.id, expires_at=now - timedelta(hours=1)))
+        db.session.commit()
+        
+        # Малий пакет - кожна задача виконується кількома UPDATE/DELETE
+        original_chunk_size = app.config.get('CLEANUP_CHUNK_SIZE')
+        app.config['CLEANUP_CHUNK_SIZE'] = 3
+        try:
+            self.assertEqual(cleanup_expired_sessions(inactivity_timeout_minutes=30), 7)
+            self.assertEqual(cleanup_expired_blacklist(), 7)
+            self.assertEqual(cleanup_expired_api_tokens(retention_days=7), 7)
+        finally:
+            app.config['CLEANUP_CHUNK_SIZE'] = original_chunk_size
+        
+        db.session.expire_all()
+        self.assertEqual([s.session_id for s in UserSession.query.filter_by(is_active=True)], ['fresh'])
+        self.assertEqual([t.token_id for t in TokenBlacklist.query.all()], ['bl_fresh'])
+        self.assertEqual([t.token_id for t in ApiToken.query.all()], ['api_recent'])
+        
+        # Повторний запуск нічого не змінює
+        self.assertEqual(cleanup_expired_sessions(inactivity_timeout_minutes=30), 0)
+    
     def test_check_maintenance_reminders_overdue(self):
         """Тест перевірки прострочених обслуговувань"""
         from datetime import date, timedelta
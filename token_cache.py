@@ -0,0 +1,165 @@
+"""
+Кеш перевірених JWT токенів для API
+
+Після першої успішної перевірки токена (blacklist + ApiToken в базі) його jti
+запам'ятовується в пам'яті процесу разом з user_id на JWT_VERIFY_CACHE_TTL
+секунд, але не довше за термін дії токена. Повторні запити з тим самим
+токеном не звертаються до blacklist та api_token.
+
+Відкликання (revoke_jwt_token, add_token_to_blacklist) видаляє jti з кешу
+одразу. В інших процесах (кілька worker'ів) відкликаний токен може діяти ще
+не більше TTL секунд.
+
+Оновлення last_used_at не пишуться в запиті: час останнього використання
+накопичується в пам'яті і фоновий потік записує його одним executemany
+кожні JWT_LAST_USED_FLUSH_SECONDS секунд (та при зупинці процесу).
+"""
+
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import bindparam, update
+
+from batch_flusher import BatchFlusher
+from models import db, ApiToken
+
+
+class VerifiedTokenCache(BatchFlusher):
+    """Кеш jti -> user_id з TTL та пакетним оновленням last_used_at"""
+
+    thread_name = 'jwt-last-used-flusher'
+
+    def __init__(self, app=None):
+        super().__init__()
+        self._entries = {}
+        self._last_used = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Реєструє кеш у додатку (app.extensions['token_cache'])"""
+        app.config.setdefault('JWT_VERIFY_CACHE_TTL', 60)
+        app.config.setdefault('JWT_VERIFY_CACHE_MAX_SIZE', 10000)
+        app.config.setdefault('JWT_LAST_USED_FLUSH_SECONDS', 30)
+
+        self.app = app
+        app.extensions['token_cache'] = self
+
+    def flush_interval(self):
+        return self.app.config['JWT_LAST_USED_FLUSH_SECONDS']
+
+    @property
+    def enabled(self):
+        return self.app is not None and self.app.config.get('JWT_VERIFY_CACHE_TTL', 0) > 0
+
+    def get(self, token_id):
+        """
+        Повертає user_id перевіреного токена або None (немає в кеші / TTL минув)
+        """
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            user_id, valid_until = entry
+            if now >= valid_until:
+                del self._entries[token_id]
+                self.misses += 1
+                return None
+            self.hits += 1
+            return user_id
+
+    def put(self, token_id, user_id, expires_at):
+        """
+        Запам'ятовує перевірений токен
+
+        Args:
+            token_id: JWT jti
+            user_id: ID власника токена
+            expires_at: Час закінчення дії токена (naive UTC datetime)
+        """
+        if not self.enabled:
+            return
+        now = time.time()
+        token_expires = (expires_at - datetime.utcnow()).total_seconds() + now
+        valid_until = min(now + self.app.config['JWT_VERIFY_CACHE_TTL'], token_expires)
+        if valid_until <= now:
+            return
+
+        with self._lock:
+            if len(self._entries) >= self.app.config['JWT_VERIFY_CACHE_MAX_SIZE']:
+                self._evict(now)
+            self._entries[token_id] = (user_id, valid_until)
+
+    def _evict(self, now):
+        """Видаляє прострочені записи, а якщо їх немає - найстаріші (викликається під lock)"""
+        expired = [token_id for token_id, (_, valid_until) in self._entries.items() if valid_until <= now]
+        for token_id in expired:
+            del self._entries[token_id]
+        if not expired:
+            # dict зберігає порядок вставки - перші записи найстаріші
+            for token_id in list(self._entries)[:max(1, len(self._entries) // 10)]:
+                del self._entries[token_id]
+
+    def invalidate(self, *token_ids):
+        """Видаляє токени з кешу (відкликання)"""
+        with self._lock:
+            for token_id in token_ids:
+                self._entries.pop(token_id, None)
+                self._last_used.pop(token_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._last_used.clear()
+
+    def touch(self, token_id):
+        """Фіксує використання токена (last_used_at запишеться у фоні)"""
+        if not self.enabled or self.app.testing:
+            self._write({token_id: datetime.utcnow()})
+            return
+        with self._lock:
+            self._last_used[token_id] = datetime.utcnow()
+        self._ensure_started()
+
+    def _write(self, pending):
+        """Записує last_used_at одним executemany у власному контексті додатку"""
+        with self.app.app_context():
+            try:
+                db.session.execute(
+                    update(ApiToken.__table__)
+                    .where(ApiToken.__table__.c.token_id == bindparam('b_token_id'))
+                    .values(last_used_at=bindparam('b_last_used_at')),
+                    [{'b_token_id': token_id, 'b_last_used_at': used_at} for token_id, used_at in pending.items()]
+                )
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.error(f"Помилка оновлення last_used_at токенів: {e}")
+            finally:
+                db.session.remove()
+
+    def _take(self):
+        """Забирає накопичені last_used_at: {jti: час}"""
+        with self._lock:
+            pending, self._last_used = self._last_used, {}
+        return pending
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'pending_last_used': len(self._last_used),
+            }
+
+
+token_cache = VerifiedTokenCache()
@@ -1,11 +1,10 @@
+from contextlib import contextmanager
 from functools import wraps
 from flask import abort, request, current_app
 from flask_login import current_user
 from datetime import datetime, timedelta
 import os
 import re
-import shutil
-import sqlite3
 import time
 import secrets
 import jwt
@@ -184,51 +183,20 @@ def convert_to_webp(image_path, quality=85):
 
 def cleanup_unused_photos():
     """
-    Видаляє невикористані фото з файлової системи
+    Видаляє файли фото, що більше не використовуються
+    
+    Обробляє маніфест photo_file пакетами (див. photo_gc), без сканування
+    каталогу завантажень.
     
     Returns:
         int: Кількість видалених файлів
     """
-    from models import DevicePhoto, db
-    import glob
+    from photo_gc import collect_orphan_photos
     
     try:
-        # Отримуємо всі фото з бази даних
-        used_photos = {photo.filename for photo in DevicePhoto.query.all()}
-        
-        # Отримуємо всі файли в папці uploads
-        upload_folder = current_app.config.get('UPLOAD_FOLDER', 'static/uploads')
-        all_files = set()
-        
-        # Шукаємо всі файли (включаючи thumbnail'и та WebP)
-        for pattern in ['*.jpg', '*.jpeg', '*.png', '*.gif', '*.webp']:
-            for file_path in glob.glob(os.path.join(upload_folder, pattern)):
-                filename = os.path.basename(file_path)
-                # Видаляємо суфікси thumbnail'ів (_thumb, _medium, _large)
-                base_filename = filename
-                for suffix in ['_thumb', '_medium', '_large']:
-                    if suffix in base_filename:
-                        base_filename = base_filename.replace(suffix, '')
-                        # Також видаляємо розширення для порівняння
-                        base_filename = os.path.splitext(base_filename)[0] + os.path.splitext(filename)[1]
-                        break
-                
-                # Перевіряємо чи файл використовується
-                if base_filename not in used_photos and filename not in used_photos:
-                    all_files.add(file_path)
-        
-        # Видаляємо невикористані файли
-        count = 0
-        for file_path in all_files:
-            try:
-                os.remove(file_path)
-                count += 1
-            except Exception as e:
-                print(f"Помилка видалення файлу {file_path}: {e}")
-        
-        return count
+        return collect_orphan_photos()
     except Exception as e:
-        print(f"Помилка очищення невикористаних фото: {e}")
+        current_app.logger.error(f"Помилка очищення невикористаних фото: {e}")
         return 0
 
 def admin_required(f):
@@ -257,14 +225,28 @@ def log_activity(action_description):
     return decorator
 
 def log_user_activity(user_id, action, ip_address=None, url=None):
-    """Записує активність користувача в базу даних"""
+    """
+    Записує активність користувача
+    
+    Запис передається в асинхронний журнал активності (activity_log), який
+    вставляє записи в базу пакетами у фоновому потоці.
+    """
+    from flask import has_request_context
+    
+    user_agent = request.headers.get('User-Agent') if has_request_context() else None
+    
+    sink = current_app.extensions.get('activity_log')
+    if sink is not None:
+        sink.submit(user_id, action, ip_address, user_agent, url)
+        return
+    
     from models import UserActivity, db
     
     activity = UserActivity(
         user_id=user_id,
         action=action,
         ip_address=ip_address,
-        user_agent=request.headers.get('User-Agent'),
+        user_agent=user_agent,
         url=url
     )
     db.session.add(activity)
@@ -413,6 +395,7 @@ def create_user_session(user_id, session_id, ip_address=None, user_agent=None):
     existing_session = UserSession.query.filter_by(session_id=session_id).first()
     if existing_session:
         # Оновлюємо існуючу сесію
+        existing_session.user_id = user_id
         existing_session.is_active = True
         existing_session.last_activity = datetime.utcnow()
         existing_session.ip_address = ip_address
@@ -445,11 +428,19 @@ def create_user_session(user_id, session_id, ip_address=None, user_agent=None):
 
 def update_session_activity(session_id):
     """
-    Оновлює час останньої активності для сесії
+    Фіксує активність сесії
+    
+    Час активності накопичується в session_activity і записується в базу
+    пакетами у фоні (не частіше ніж раз на SESSION_ACTIVITY_WRITE_INTERVAL).
     
     Args:
         session_id: Flask session ID
     """
+    tracker = current_app.extensions.get('session_activity')
+    if tracker is not None:
+        tracker.touch(session_id)
+        return
+    
     from models import UserSession, db
     
     session = UserSession.query.filter_by(session_id=session_id, is_active=True).first()
@@ -470,6 +461,10 @@ def deactivate_user_session(session_id):
     """
     from models import UserSession, db
     
+    tracker = current_app.extensions.get('session_activity')
+    if tracker is not None:
+        tracker.discard(session_id)
+    
     session = UserSession.query.filter_by(session_id=session_id).first()
     if session:
         session.is_active = False
@@ -511,35 +506,80 @@ def deactivate_all_user_sessions(user_id, exclude_session_id=None):
     
     return count
 
-def cleanup_expired_sessions(inactivity_timeout_minutes=30):
+def _cleanup_in_chunks(model, condition, description, values=None, chunk_size=None):
     """
-    Очищає прострочені сесії (неактивні більше 30 хвилин)
+    Видаляє (або оновлює, якщо передано values) рядки model за умовою пакетами
+    
+    Кожен пакет - один індексований UPDATE/DELETE з окремим комітом, тож
+    блокування таблиці коротке, а пам'ять не залежить від розміру таблиці.
+    Умова має перестати виконуватись для оброблених рядків (інакше цикл
+    оброблятиме ті самі рядки).
     
     Args:
-        inactivity_timeout_minutes: Таймаут неактивності в хвилинах
+        model: Модель SQLAlchemy з колонкою id
+        condition: Умова WHERE
+        description: Опис задачі для логу
+        values: Значення для UPDATE (None - DELETE)
+        chunk_size: Розмір пакета (за замовчуванням CLEANUP_CHUNK_SIZE з конфігурації)
     
     Returns:
-        int: Кількість очищених сесій
+        int: Кількість оброблених рядків
     """
-    from models import UserSession, db
-    
-    expired_sessions = UserSession.query.filter_by(is_active=True).all()
-    count = 0
-    
-    for session in expired_sessions:
-        if session.is_expired(inactivity_timeout_minutes):
-            session.is_active = False
-            count += 1
-    
-    if count > 0:
+    from models import db
+    from sqlalchemy import delete, select, update
+    
+    if chunk_size is None:
+        chunk_size = current_app.config.get('CLEANUP_CHUNK_SIZE', 1000)
+    started = time.perf_counter()
+    total = 0
+    
+    while True:
+        chunk_ids = select(model.id).where(condition).limit(chunk_size)
+        if values is None:
+            statement = delete(model).where(model.id.in_(chunk_ids))
+        else:
+            statement = update(model).where(model.id.in_(chunk_ids)).values(**values)
+        
         try:
+            result = db.session.execute(statement, execution_options={'synchronize_session': False})
             db.session.commit()
         except Exception as e:
             db.session.rollback()
-            print(f"Помилка очищення сесій: {e}")
-            return 0
+            current_app.logger.error(f"{description}: помилка після {total} рядків: {e}")
+            break
+        
+        total += result.rowcount
+        if result.rowcount < chunk_size:
+            break
     
-    return count
+    current_app.logger.info(f"{description}: {total} рядків за {time.perf_counter() - started:.3f} с")
+    return total
+
+def cleanup_expired_sessions(inactivity_timeout_minutes=30):
+    """
+    Очищає прострочені сесії (неактивні більше 30 хвилин)
+    
+    Args:
+        inactivity_timeout_minutes: Таймаут неактивності в хвилинах
+    
+    Returns:
+        int: Кількість очищених сесій
+    """
+    from models import UserSession
+    from sqlalchemy import or_
+    
+    # Дописуємо накопичену в пам'яті активність, щоб не деактивувати живі сесії
+    tracker = current_app.extensions.get('session_activity')
+    if tracker is not None:
+        tracker.flush()
+    
+    cutoff = datetime.utcnow() - timedelta(minutes=inactivity_timeout_minutes)
+    return _cleanup_in_chunks(
+        UserSession,
+        (UserSession.is_active == True) & or_(UserSession.last_activity < cutoff, UserSession.last_activity.is_(None)),
+        'Очищення прострочених сесій',
+        values={'is_active': False}
+    )
 
 def cleanup_expired_blacklist():
     """
@@ -548,42 +588,55 @@ def cleanup_expired_blacklist():
     Returns:
         int: Кількість очищених записів
     """
-    from models import TokenBlacklist, db
+    from models import TokenBlacklist
     
-    expired_blacklist = TokenBlacklist.query.all()
-    count = 0
+    return _cleanup_in_chunks(
+        TokenBlacklist,
+        TokenBlacklist.expires_at < datetime.utcnow(),
+        'Очищення прострочених записів blacklist'
+    )
+
+def cleanup_expired_api_tokens(retention_days=None):
+    """
+    Видаляє API токени, термін дії яких минув більше retention_days днів тому
     
-    for blacklisted in expired_blacklist:
-        if blacklisted.is_expired():
-            try:
-                db.session.delete(blacklisted)
-                count += 1
-            except Exception as e:
-                db.session.rollback()
-                print(f"Помилка видалення запису з blacklist: {e}")
-                continue
+    Args:
+        retention_days: Скільки днів зберігати прострочені токени
+            (за замовчуванням API_TOKEN_RETENTION_DAYS з конфігурації)
     
-    if count > 0:
-        try:
-            db.session.commit()
-        except Exception as e:
-            db.session.rollback()
-            print(f"Помилка очищення blacklist: {e}")
-            return 0
+    Returns:
+        int: Кількість видалених токенів
+    """
+    from models import ApiToken
     
-    return count
+    if retention_days is None:
+        retention_days = current_app.config.get('API_TOKEN_RETENTION_DAYS', 7)
+    
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    return _cleanup_in_chunks(
+        ApiToken,
+        ApiToken.expires_at < cutoff,
+        'Очищення прострочених API токенів'
+    )
 
 def record_device_history(device_id, user_id, action, field=None, old_value=None, new_value=None, device=None):
-    """Записує історію змін пристрою"""
+    """
+    Додає довільний запис історії пристрою до поточної транзакції
+    
+    Запис не комітиться окремо - він зберігається разом з комітом
+    викликаючого коду. Зміни полів пристрою записуються автоматично
+    (див. device_history.track_device_history), ця функція потрібна лише
+    для подій, які не є зміною атрибутів пристрою.
+    """
     from models import DeviceHistory, Device, db
     
     if device_id is None:
         current_app.logger.error(f"Спроба створити запис історії з NULL device_id: action={action}, user_id={user_id}")
         return
     
-    # Отримуємо інформацію про пристрій, якщо вона не передана
+    # Отримуємо інформацію про пристрій (з identity map сесії, без зайвого запиту)
     if device is None:
-        device = Device.query.get(device_id)
+        device = db.session.get(Device, device_id)
     
     history = DeviceHistory(
         device_id=device_id,
@@ -598,35 +651,165 @@ def record_device_history(device_id, user_id, action, field=None, old_value=None
         device_serial_number=device.serial_number if device else None
     )
     db.session.add(history)
-    try:
-        db.session.commit()
-    except Exception as e:
-        db.session.rollback()
-        current_app.logger.error(f"Помилка при записі історії пристрою: {e}")
+    return history
+
+def get_cached_cities():
+    """
+    Список міст зі спільного кешу (тег 'cities' інвалідується при зміні міст)
+    
+    Returns:
+        list: Словники id, name, created_at, відсортовані за назвою
+    """
+    from models import City
+    from cache_service import app_cache
+    
+    def load_cities():
+        return [
+            {'id': city.id, 'name': city.name, 'created_at': city.created_at}
+            for city in City.query.order_by(City.name).all()
+        ]
+    
+    return app_cache.get_or_set('cities:all', load_cities, timeout=3600, tags=('cities',))
 
 def generate_inventory_number():
     """Генерує унікальний інвентарний номер"""
+    return reserve_inventory_numbers(1)[0]
+
+def _last_inventory_number(year, connection):
+    """Найбільший номер року серед існуючих пристроїв (для початкового значення лічильника)"""
     from models import Device
+    from sqlalchemy import func, select
+    
+    # Спочатку за довжиною, щоб '2025-10000' був більшим за '2025-9999'
+    last_number = connection.execute(
+        select(Device.inventory_number)
+        .where(Device.inventory_number.like(f'{year}-%'))
+        .order_by(func.length(Device.inventory_number).desc(), Device.inventory_number.desc())
+        .limit(1)
+    ).scalar()
+    
+    if last_number:
+        match = re.search(r'(\d{4})-(\d+)', last_number)
+        if match:
+            return int(match.group(2))
+    return 0
+
+def _seed_inventory_counter(year, connection):
+    """Створює лічильник року, якщо його ще немає (конкурентно безпечно)"""
+    from models import InventoryCounter
+    from sqlalchemy import insert
+    
+    values = {'year': year, 'last_value': _last_inventory_number(year, connection)}
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        dialect_insert = None
     
-    current_year = datetime.now().year
+    if dialect_insert is not None:
+        connection.execute(dialect_insert(InventoryCounter).values(**values).on_conflict_do_nothing())
+    else:
+        from sqlalchemy.exc import IntegrityError
+        try:
+            with connection.begin_nested():
+                connection.execute(insert(InventoryCounter).values(**values))
+        except IntegrityError:
+            pass
+
+def _allocate_inventory_numbers(year, count, connection):
+    """
+    Атомарно збільшує лічильник року на count
     
-    # Знаходимо останній номер за поточний рік
-    last_device = Device.query.filter(
-        Device.inventory_number.like(f'{current_year}-%')
-    ).order_by(Device.inventory_number.desc()).first()
+    Returns:
+        int: Останній номер виділеного блоку
+    """
+    from models import InventoryCounter
+    from sqlalchemy import update
+    
+    statement = (
+        update(InventoryCounter)
+        .where(InventoryCounter.year == year)
+        .values(last_value=InventoryCounter.last_value + count)
+        .returning(InventoryCounter.last_value)
+    )
+    last_value = connection.execute(statement).scalar()
+    if last_value is None:
+        _seed_inventory_counter(year, connection)
+        last_value = connection.execute(statement).scalar()
+    return last_value
+
+@contextmanager
+def _inventory_counter_connection():
+    """
+    З'єднання для оновлення лічильника інвентарних номерів
     
-    if last_device:
-        # Витягуємо номер з інвентарного номера
-        match = re.search(r'(\d{4})-(\d+)', last_device.inventory_number)
-        if match:
-            last_number = int(match.group(2))
-            new_number = last_number + 1
-        else:
-            new_number = 1
+    Для файлової бази - окрема коротка транзакція, для бази в пам'яті
+    (одне спільне з'єднання) - транзакція поточної сесії.
+    """
+    from models import db
+    
+    if db.engine.url.database in (None, '', ':memory:'):
+        yield db.session.connection()
     else:
-        new_number = 1
+        with db.engine.begin() as connection:
+            yield connection
+
+def reserve_inventory_numbers(count, year=None):
+    """
+    Резервує блок з count послідовних інвентарних номерів року
     
-    return f"{current_year}-{new_number:04d}"
+    Номери видаються лічильником inventory_counter одним атомарним
+    UPDATE ... RETURNING, тож конкурентні створення пристроїв не отримують
+    однакових номерів. Для файлової бази лічильник оновлюється в окремій
+    короткій транзакції (блокування рядка не тримається до коміту запиту;
+    як і в послідовностях, номери не повертаються при відкаті). Для бази
+    в пам'яті (тести) використовується транзакція поточної сесії.
+    
+    Args:
+        count: Кількість номерів
+        year: Рік (за замовчуванням поточний)
+    
+    Returns:
+        list: Інвентарні номери у форматі YYYY-NNNN
+    """
+    if count <= 0:
+        return []
+    
+    year = year or datetime.now().year
+    
+    with _inventory_counter_connection() as connection:
+        last_value = _allocate_inventory_numbers(year, count, connection)
+    
+    first_value = last_value - count + 1
+    return [f"{year}-{number:04d}" for number in range(first_value, last_value + 1)]
+
+def sync_inventory_counter(year=None):
+    """
+    Вирівнює лічильник року з найбільшим існуючим номером
+    
+    Потрібно лише якщо номери вносились в обхід лічильника (ручне
+    редагування бази, відновлення старої копії).
+    
+    Returns:
+        int: Нове значення лічильника
+    """
+    from models import InventoryCounter
+    from sqlalchemy import select, update
+    
+    year = year or datetime.now().year
+    with _inventory_counter_connection() as connection:
+        last_value = _last_inventory_number(year, connection)
+        _seed_inventory_counter(year, connection)
+        connection.execute(
+            update(InventoryCounter)
+            .where(InventoryCounter.year == year, InventoryCounter.last_value < last_value)
+            .values(last_value=last_value)
+        )
+        return connection.execute(
+            select(InventoryCounter.last_value).where(InventoryCounter.year == year)
+        ).scalar()
 
 def nl2br(value):
     """Конвертує переноси рядків в HTML <br> теги"""
@@ -634,92 +817,66 @@ def nl2br(value):
         return ''
     return value.replace('\n', '<br>\n')
 
-def backup_database(backup_folder='backups'):
-    """Створює резервну копію бази даних"""
+def backup_database(backup_folder='backups', incremental=False):
+    """
+    Створює резервну копію бази даних у поточному потоці
+    
+    Онлайн-копія SQLite (backup API) зі стисненням або pg_dump для
+    PostgreSQL - див. backup_service. Для копіювання у фоні з прогресом
+    використовуйте backup_manager.start().
+    
+    Args:
+        backup_folder: Каталог резервних копій
+        incremental: Інкрементний знімок (лише SQLite)
+    
+    Returns:
+        dict: Дані створеної копії або None при помилці
+    """
+    from backup_service import backup_manager
+    
     try:
-        from models import db
-        import time
-        
-        # Отримуємо шлях до бази даних
-        db_path = db.engine.url.database
-        if db_path.startswith('sqlite:///'):
-            db_path = db_path.replace('sqlite:///', '')
-        
-        if not os.path.exists(db_path):
-            current_app.logger.error(f"База даних не знайдена: {db_path}")
-            return None
-        
-        # Створюємо директорію для backup, якщо її немає
-        os.makedirs(backup_folder, exist_ok=True)
-        
-        # Генеруємо ім'я файлу з timestamp
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_filename = f'inventory_backup_{timestamp}.db'
-        backup_path = os.path.join(backup_folder, backup_filename)
-        
-        # Копіюємо базу даних
-        shutil.copy2(db_path, backup_path)
-        
-        # Створюємо також SQL дамп
-        dump_filename = f'inventory_dump_{timestamp}.sql'
-        dump_path = os.path.join(backup_folder, dump_filename)
-        
-        conn = sqlite3.connect(db_path)
-        with open(dump_path, 'w', encoding='utf-8') as f:
-            for line in conn.iterdump():
-                f.write('%s\n' % line)
-        conn.close()
-        
-        current_app.logger.info(f"Резервна копія створена: {backup_path}")
+        result = backup_manager.run_backup(incremental=incremental, backup_folder=backup_folder)
         return {
-            'backup_path': backup_path,
-            'dump_path': dump_path,
-            'filename': backup_filename,
-            'size': os.path.getsize(backup_path),
-            'timestamp': datetime.now()
+            'backup_path': result['path'],
+            'filename': result['filename'],
+            'size': result['size'],
+            'kind': result['kind'],
+            'timestamp': result['created_at']
         }
     except Exception as e:
         current_app.logger.error(f"Помилка при створенні резервної копії: {e}")
         return None
 
-def cleanup_old_backups(backup_folder='backups', keep_days=30):
-    """Видаляє старі резервні копії"""
+def cleanup_old_backups(backup_folder='backups', keep_daily=None, keep_weekly=None, keep_monthly=None):
+    """
+    Видаляє старі резервні копії за політикою GFS (див. backup_service)
+    
+    Args:
+        backup_folder: Каталог резервних копій
+        keep_daily: Кількість днів (за замовчуванням BACKUP_KEEP_DAILY)
+        keep_weekly: Кількість тижнів (BACKUP_KEEP_WEEKLY)
+        keep_monthly: Кількість місяців (BACKUP_KEEP_MONTHLY)
+    
+    Returns:
+        list: Імена видалених файлів
+    """
+    from backup_service import apply_retention
+    
     try:
-        if not os.path.exists(backup_folder):
-            return
-        
-        cutoff_time = time.time() - (keep_days * 24 * 60 * 60)
-        
-        for filename in os.listdir(backup_folder):
-            file_path = os.path.join(backup_folder, filename)
-            if os.path.isfile(file_path):
-                # Перевіряємо час модифікації файлу
-                if os.path.getmtime(file_path) < cutoff_time:
-                    os.remove(file_path)
-                    current_app.logger.info(f"Видалено старий backup: {file_path}")
+        return apply_retention(backup_folder, keep_daily, keep_weekly, keep_monthly)
     except Exception as e:
         current_app.logger.error(f"Помилка при очищенні старих backup: {e}")
+        return []
 
 def get_backup_list(backup_folder='backups'):
-    """Повертає список резервних копій"""
+    """Повертає список резервних копій з каталогу (нові спочатку)"""
+    from backup_service import BackupCatalog
+    
     try:
-        if not os.path.exists(backup_folder):
-            return []
-        
-        backups = []
-        for filename in os.listdir(backup_folder):
-            if filename.startswith('inventory_backup_') and filename.endswith('.db'):
-                file_path = os.path.join(backup_folder, filename)
-                backups.append({
-                    'filename': filename,
-                    'path': file_path,
-                    'size': os.path.getsize(file_path),
-                    'timestamp': datetime.fromtimestamp(os.path.getmtime(file_path))
-                })
-        
-        # Сортуємо за датою (нові спочатку)
-        backups.sort(key=lambda x: x['timestamp'], reverse=True)
-        return backups
+        return [
+            dict(entry, timestamp=datetime.fromisoformat(entry['created_at']))
+            for entry in BackupCatalog(backup_folder).entries()
+        ]
     except Exception as e:
         current_app.logger.error(f"Помилка при отриманні списку backup: {e}")
         return []
@@ -895,6 +1052,11 @@ def add_token_to_blacklist(token_id, token_type, user_id, expires_at):
     """
     from models import TokenBlacklist, db
     
+    # Відкликаний токен більше не обслуговується з кешу перевірених токенів
+    token_cache = current_app.extensions.get('token_cache')
+    if token_cache is not None:
+        token_cache.invalidate(token_id)
+    
     # Перевіряємо чи токен вже в blacklist
     existing = TokenBlacklist.query.filter_by(token_id=token_id).first()
     if existing:
@@ -935,34 +1097,47 @@ def verify_jwt_token(token):
         if payload.get('type') != 'access':
             return None
         
-        # Перевіряємо чи токен в blacklist
         token_id = payload.get('jti')
-        if is_token_blacklisted(token_id):
-            return None
+        user_id = payload.get('user_id')
         
-        # Перевіряємо наявність токена в базі
-        api_token = ApiToken.query.filter_by(
-            token_id=token_id,
-            is_active=True
-        ).first()
+        # Токен вже перевірявся нещодавно - blacklist та api_token не запитуємо
+        token_cache = current_app.extensions.get('token_cache')
+        cached = token_cache is not None and token_cache.get(token_id) == user_id
         
-        if not api_token:
-            return None
+        if not cached:
+            # Перевіряємо чи токен в blacklist
+            if is_token_blacklisted(token_id):
+                return None
+            
+            # Перевіряємо наявність токена в базі
+            api_token = ApiToken.query.filter_by(
+                token_id=token_id,
+                is_active=True
+            ).first()
+            
+            if not api_token:
+                return None
+            
+            # Перевіряємо термін дії
+            if api_token.is_expired():
+                api_token.is_active = False
+                # Додаємо до blacklist
+                add_token_to_blacklist(token_id, 'access', api_token.user_id, api_token.expires_at)
+                db.session.commit()
+                return None
+            
+            if token_cache is not None:
+                token_cache.put(token_id, user_id, api_token.expires_at)
         
-        # Перевіряємо термін дії
-        if api_token.is_expired():
-            api_token.is_active = False
-            # Додаємо до blacklist
-            add_token_to_blacklist(token_id, 'access', api_token.user_id, api_token.expires_at)
+        # Оновлюємо час останнього використання (пакетно у фоні)
+        if token_cache is not None:
+            token_cache.touch(token_id)
+        else:
+            api_token.last_used_at = datetime.utcnow()
             db.session.commit()
-            return None
-        
-        # Оновлюємо час останнього використання
-        api_token.last_used_at = datetime.utcnow()
-        db.session.commit()
         
         # Отримуємо користувача
-        user = User.query.get(payload.get('user_id'))
+        user = db.session.get(User, user_id)
         
         if not user or not user.is_active:
             return None
@@ -1004,7 +1179,7 @@ def revoke_jwt_token(token_id):
     try:
         api_token = ApiToken.query.filter_by(token_id=token_id).first()
         if api_token:
-            # Деактивуємо токен
+            # Деактивуємо токен (add_token_to_blacklist також прибирає його з кешу перевірених токенів)
             api_token.is_active = False
             
             # Додаємо до blacklist
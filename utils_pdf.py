@@ -1,103 +1,116 @@
+"""
+Генерація PDF: інвентарні картки та реєстр обладнання
+
+Шрифти (TTF з кирилицею), стилі абзаців і стилі таблиць будуються один раз
+на процес (pdf_resources()). Документ будується потоково: flowables
+надходять з генератора порціями (_StreamingDocTemplate), тож у пам'яті
+немає списку на весь документ, а результат пишеться у
+SpooledTemporaryFile (у пам'яті до PDF_SPOOL_MAX_MEMORY байт, далі - на
+диску).
+
+Реєстр розбивається на таблиці по сторінці (текст комірок переноситься за
+шириною колонки, висота рядків рахується без побудови таблиці), а
+масовий режим карток виводить N пристроїв по одній картці на сторінку за
+один прохід. Після кожного документа в лог пишеться кількість сторінок і
+швидкість (стор./с); сумарні показники повертає pdf_engine.stats().
+"""
+
+import os
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+from functools import lru_cache
+from xml.sax.saxutils import escape
+
 from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import cm
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
+from reportlab.lib.utils import simpleSplit
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.lib.enums import TA_CENTER, TA_LEFT
-import io
-import qrcode
-from datetime import datetime
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image, PageBreak
 
-def generate_device_pdf(device):
-    """Генерує PDF інвентарної картки для пристрою"""
-    buffer = io.BytesIO()
-    
-    # Створюємо документ
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=A4,
-        rightMargin=2*cm,
-        leftMargin=2*cm,
-        topMargin=2*cm,
-        bottomMargin=2*cm
-    )
-    
-    # Елементи документу
-    elements = []
-    
-    # Стилі
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=18,
-        textColor=colors.HexColor('#343a40'),
-        spaceAfter=30,
-        alignment=TA_CENTER
-    )
-    
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=14,
-        textColor=colors.HexColor('#495057'),
-        spaceAfter=12
-    )
-    
-    # Заголовок
-    title = Paragraph("ІНВЕНТАРНА КАРТКА ОБЛАДНАННЯ", title_style)
-    elements.append(title)
-    elements.append(Spacer(1, 0.5*cm))
-    
-    # Генеруємо QR код
-    qr_data = f"""ID: {device.id}
-Назва: {device.name}
-Інв. номер: {device.inventory_number}
-S/N: {device.serial_number}"""
-    
-    qr = qrcode.QRCode(version=1, box_size=10, border=4)
-    qr.add_data(qr_data)
-    qr.make(fit=True)
-    qr_img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Зберігаємо QR код в буфер
-    qr_buffer = io.BytesIO()
-    qr_img.save(qr_buffer, format='PNG')
-    qr_buffer.seek(0)
-    
-    # Додаємо QR код
-    qr_image = Image(qr_buffer, width=4*cm, height=4*cm)
-    
-    # Таблиця з основною інформацією
-    data = [
-        ['Інвентарний номер:', device.inventory_number or ''],
-        ['Назва:', device.name or ''],
-        ['Тип:', device.type or ''],
-        ['Серійний номер:', device.serial_number or ''],
-        ['Місце розташування:', device.location or ''],
-        ['Статус:', device.status or ''],
-        ['Місто:', device.city.name if device.city else ''],
-        ['Дата додавання:', device.created_at.strftime('%d.%m.%Y') if device.created_at else ''],
-    ]
-    
-    # Додаємо інформацію про обслуговування, якщо є
-    if device.last_maintenance:
-        data.append(['Останнє обслуговування:', device.last_maintenance.strftime('%d.%m.%Y')])
-    if device.next_maintenance:
-        data.append(['Наступне обслуговування:', device.next_maintenance.strftime('%d.%m.%Y')])
-    if device.maintenance_interval:
-        data.append(['Інтервал обслуговування (днів):', str(device.maintenance_interval)])
-    
-    # Створюємо таблицю
-    t = Table(data, colWidths=[6*cm, 10*cm])
-    t.setStyle(TableStyle([
+PDF_MIMETYPE = 'application/pdf'
+
+# TTF зі звичайним і жирним накресленням, що містять кирилицю (перший знайдений)
+FONT_CANDIDATES = (
+    ('/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf', '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf'),
+    ('/usr/share/fonts/dejavu/DejaVuSans.ttf', '/usr/share/fonts/dejavu/DejaVuSans-Bold.ttf'),
+    ('/Library/Fonts/Arial Unicode.ttf', '/Library/Fonts/Arial Unicode.ttf'),
+    ('C:/Windows/Fonts/arial.ttf', 'C:/Windows/Fonts/arialbd.ttf'),
+)
+
+# Колонки реєстру: заголовок, ширина
+REGISTER_COLUMNS = (
+    ('№', 1 * cm), ('Інв. номер', 3 * cm), ('Назва', 4 * cm), ('Тип', 3 * cm),
+    ('S/N', 3 * cm), ('Місце', 3 * cm), ('Статус', 2 * cm),
+)
+REGISTER_ROW_HEIGHT = 0.55 * cm
+REGISTER_FONT_SIZE = 8
+# Висота кожного наступного рядка тексту в комірці та максимум рядків у комірці
+REGISTER_LINE_HEIGHT = 10
+REGISTER_MAX_LINES = 4
+# LEFTPADDING + RIGHTPADDING комірки таблиці
+REGISTER_CELL_PADDING = 12
+
+PDFResources = namedtuple('PDFResources', 'font bold styles card_table card_layout register_table')
+
+
+def _register_fonts(font_path=None, bold_path=None):
+    """Реєструє TTF шрифти (кирилиця); без них - вбудований Helvetica"""
+    candidates = ((font_path, bold_path or font_path),) if font_path else FONT_CANDIDATES
+    for regular, bold in candidates:
+        if os.path.exists(regular) and os.path.exists(bold):
+            pdfmetrics.registerFont(TTFont('InventorySans', regular))
+            pdfmetrics.registerFont(TTFont('InventorySans-Bold', bold))
+            return 'InventorySans', 'InventorySans-Bold'
+    return 'Helvetica', 'Helvetica-Bold'
+
+
+@lru_cache(maxsize=None)
+def pdf_resources(font_path=None, bold_path=None):
+    """
+    Шрифти та стилі PDF (будуються один раз на процес)
+
+    Args:
+        font_path: TTF звичайного накреслення (None - пошук у системі)
+        bold_path: TTF жирного накреслення
+
+    Returns:
+        PDFResources
+    """
+    font, bold = _register_fonts(font_path, bold_path)
+    sample = getSampleStyleSheet()
+    styles = {
+        'title': ParagraphStyle(
+            'CardTitle', parent=sample['Heading1'], fontName=bold, fontSize=18,
+            textColor=colors.HexColor('#343a40'), spaceAfter=30, alignment=TA_CENTER
+        ),
+        'register_title': ParagraphStyle(
+            'RegisterTitle', parent=sample['Heading1'], fontName=bold, fontSize=16,
+            textColor=colors.HexColor('#343a40'), spaceAfter=20, alignment=TA_CENTER
+        ),
+        'heading': ParagraphStyle(
+            'CardHeading', parent=sample['Heading2'], fontName=bold, fontSize=14,
+            textColor=colors.HexColor('#495057'), spaceAfter=12
+        ),
+        'normal': ParagraphStyle('CardNormal', parent=sample['Normal'], fontName=font),
+        'summary': ParagraphStyle(
+            'Summary', parent=sample['Normal'], fontName=font, fontSize=8,
+            textColor=colors.grey, alignment=TA_CENTER
+        ),
+    }
+    card_table = TableStyle([
         ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#e9ecef')),
         ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
         ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
         ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('FONTNAME', (0, 0), (0, -1), bold),
+        ('FONTNAME', (1, 0), (1, -1), font),
         ('FONTSIZE', (0, 0), (-1, -1), 10),
         ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
         ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
@@ -105,123 +118,329 @@ S/N: {device.serial_number}"""
         ('RIGHTPADDING', (0, 0), (-1, -1), 10),
         ('TOPPADDING', (0, 0), (-1, -1), 8),
         ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-    ]))
-    
-    # Таблиця з QR кодом і основною інформацією
-    main_table = Table([[t, qr_image]], colWidths=[12*cm, 5*cm])
-    main_table.setStyle(TableStyle([
+    ])
+    card_layout = TableStyle([
         ('VALIGN', (0, 0), (-1, -1), 'TOP'),
         ('ALIGN', (1, 0), (1, 0), 'CENTER'),
-    ]))
-    
-    elements.append(main_table)
-    elements.append(Spacer(1, 1*cm))
-    
-    # Примітки
-    if device.notes:
-        notes_heading = Paragraph("Примітки:", heading_style)
-        elements.append(notes_heading)
-        notes_text = Paragraph(device.notes.replace('\n', '<br/>'), styles['Normal'])
-        elements.append(notes_text)
-        elements.append(Spacer(1, 1*cm))
-    
-    # Футер
-    footer_style = ParagraphStyle(
-        'Footer',
-        parent=styles['Normal'],
-        fontSize=8,
-        textColor=colors.grey,
-        alignment=TA_CENTER
-    )
-    footer = Paragraph(
-        f"Згенеровано: {datetime.now().strftime('%d.%m.%Y %H:%M')} | Система інвентаризації обладнання",
-        footer_style
-    )
-    elements.append(Spacer(1, 2*cm))
-    elements.append(footer)
-    
-    # Будуємо PDF
-    doc.build(elements)
-    
-    buffer.seek(0)
-    return buffer
-
-def generate_bulk_devices_pdf(devices):
-    """Генерує PDF з декількома інвентарними картками"""
-    buffer = io.BytesIO()
-    
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=A4,
-        rightMargin=2*cm,
-        leftMargin=2*cm,
-        topMargin=2*cm,
-        bottomMargin=2*cm
-    )
-    
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        textColor=colors.HexColor('#343a40'),
-        spaceAfter=20,
-        alignment=TA_CENTER
-    )
-    
-    # Заголовок
-    title = Paragraph("РЕЄСТР ОБЛАДНАННЯ", title_style)
-    elements.append(title)
-    elements.append(Spacer(1, 0.5*cm))
-    
-    # Створюємо таблицю з пристроями
-    table_data = [['№', 'Інв. номер', 'Назва', 'Тип', 'S/N', 'Місце', 'Статус']]
-    
-    for idx, device in enumerate(devices, 1):
-        table_data.append([
-            str(idx),
-            device.inventory_number or '',
-            device.name or '',
-            device.type or '',
-            device.serial_number or '',
-            device.location or '',
-            device.status or ''
-        ])
-    
-    t = Table(table_data, colWidths=[1*cm, 3*cm, 4*cm, 3*cm, 3*cm, 3*cm, 2*cm])
-    t.setStyle(TableStyle([
+    ])
+    register_table = TableStyle([
         ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#343a40')),
         ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
         ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTNAME', (0, 0), (-1, 0), bold),
+        ('FONTNAME', (0, 1), (-1, -1), font),
         ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('FONTSIZE', (0, 1), (-1, -1), 8),
+        ('FONTSIZE', (0, 1), (-1, -1), REGISTER_FONT_SIZE),
+        ('LEADING', (0, 1), (-1, -1), REGISTER_LINE_HEIGHT),
         ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
         ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
         ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f8f9fa')]),
-    ]))
-    
-    elements.append(t)
-    elements.append(Spacer(1, 1*cm))
-    
-    # Футер
-    footer_style = ParagraphStyle(
-        'Footer',
-        parent=styles['Normal'],
-        fontSize=8,
-        textColor=colors.grey,
-        alignment=TA_CENTER
-    )
-    footer = Paragraph(
-        f"Згенеровано: {datetime.now().strftime('%d.%m.%Y %H:%M')} | Всього пристроїв: {len(devices)}",
-        footer_style
-    )
-    elements.append(footer)
-    
-    doc.build(elements)
-    
-    buffer.seek(0)
-    return buffer
+    ])
+    return PDFResources(font, bold, styles, card_table, card_layout, register_table)
+
+
+def _wrap_cell(text, font, width):
+    """
+    Розбиває текст комірки реєстру на рядки, що вміщуються в колонку
+
+    Слова, ширші за колонку (серійні номери), розбиваються по символах;
+    понад REGISTER_MAX_LINES рядків текст обрізається з "…".
+
+    Returns:
+        list: Рядки тексту
+    """
+    width -= REGISTER_CELL_PADDING
+
+    def fits(line):
+        return pdfmetrics.stringWidth(line, font, REGISTER_FONT_SIZE) <= width
+
+    if '\n' not in text and fits(text):
+        return [text]
+
+    lines = []
+    for line in simpleSplit(text, font, REGISTER_FONT_SIZE, width):
+        while not fits(line) and len(line) > 1:
+            cut = len(line) - 1
+            while cut > 1 and not fits(line[:cut]):
+                cut -= 1
+            lines.append(line[:cut])
+            line = line[cut:]
+        lines.append(line)
+
+    if len(lines) > REGISTER_MAX_LINES:
+        lines = lines[:REGISTER_MAX_LINES]
+        last = lines[-1]
+        while last and not fits(last + '…'):
+            last = last[:-1]
+        lines[-1] = last + '…'
+    return lines or ['']
+
+
+class _StreamingDocTemplate(SimpleDocTemplate):
+    """SimpleDocTemplate, що бере flowables з генератора порціями"""
+
+    def __init__(self, stream, source, **kwargs):
+        super().__init__(stream, **kwargs)
+        self._source = iter(source)
+
+    def fill(self, flowables, minimum=2):
+        """Доповнює чергу наступними порціями (build() завершується на порожній черзі)"""
+        while self._source is not None and len(flowables) < minimum:
+            try:
+                flowables.extend(next(self._source))
+            except StopIteration:
+                self._source = None
+
+    def handle_flowable(self, flowables):
+        # clean_hanging() також викликає handle_flowable для службової черги
+        if flowables is not self._hanging:
+            self.fill(flowables)
+        super().handle_flowable(flowables)
+
+
+class PDFEngine:
+    """Потокова генерація PDF зі спільними ресурсами та метриками швидкості"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._lock = threading.Lock()
+        self.documents = 0
+        self.pages = 0
+        self.seconds = 0.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Реєструє генератор у додатку (app.extensions['pdf_engine'])"""
+        app.config.setdefault('PDF_FONT_PATH', None)
+        app.config.setdefault('PDF_FONT_BOLD_PATH', None)
+        app.config.setdefault('PDF_SPOOL_MAX_MEMORY', 4 * 1024 * 1024)
+        app.config.setdefault('PDF_QUERY_BATCH_SIZE', 500)
+
+        self.app = app
+        app.extensions['pdf_engine'] = self
+
+    @property
+    def resources(self):
+        if self.app is None:
+            return pdf_resources()
+        return pdf_resources(self.app.config['PDF_FONT_PATH'], self.app.config['PDF_FONT_BOLD_PATH'])
+
+    # ------------------------------------------------------------------
+    # Побудова документа
+
+    def _build(self, kind, source, footer):
+        """
+        Будує PDF з генератора порцій flowables у тимчасовий файл
+
+        Returns:
+            SpooledTemporaryFile: PDF (позиція на початку)
+        """
+        resources = self.resources
+        max_memory = self.app.config['PDF_SPOOL_MAX_MEMORY'] if self.app else 4 * 1024 * 1024
+        output = tempfile.SpooledTemporaryFile(max_size=max_memory)
+        generated = datetime.now().strftime('%d.%m.%Y %H:%M')
+
+        def draw_footer(canvas, doc):
+            canvas.saveState()
+            canvas.setFont(resources.font, 8)
+            canvas.setFillColor(colors.grey)
+            canvas.drawCentredString(A4[0] / 2, 1.2 * cm, f"Згенеровано: {generated} | {footer} | стор. {doc.page}")
+            canvas.restoreState()
+
+        doc = _StreamingDocTemplate(
+            output, source,
+            pagesize=A4,
+            rightMargin=2 * cm,
+            leftMargin=2 * cm,
+            topMargin=2 * cm,
+            bottomMargin=2 * cm,
+            pageCompression=1,
+        )
+        started = time.perf_counter()
+        flowables = []
+        doc.fill(flowables)
+        doc.build(flowables, onFirstPage=draw_footer, onLaterPages=draw_footer)
+        elapsed = time.perf_counter() - started
+
+        with self._lock:
+            self.documents += 1
+            self.pages += doc.page
+            self.seconds += elapsed
+        if self.app is not None:
+            self.app.logger.info(
+                f"PDF {kind}: {doc.page} стор. за {elapsed:.2f} с ({doc.page / elapsed if elapsed else 0:.1f} стор./с)"
+            )
+
+        output.seek(0)
+        return output
+
+    def _card_flowables(self, device):
+        """Flowables інвентарної картки одного пристрою"""
+        from qr_service import qr_store
+
+        resources = self.resources
+        styles = resources.styles
+        qr_path, _ = qr_store.get(device)
+
+        data = [
+            ['Інвентарний номер:', device.inventory_number or ''],
+            ['Назва:', device.name or ''],
+            ['Тип:', device.type or ''],
+            ['Серійний номер:', device.serial_number or ''],
+            ['Місце розташування:', device.location or ''],
+            ['Статус:', device.status or ''],
+            ['Місто:', device.city.name if device.city else ''],
+            ['Дата додавання:', device.created_at.strftime('%d.%m.%Y') if device.created_at else ''],
+        ]
+        if device.last_maintenance:
+            data.append(['Останнє обслуговування:', device.last_maintenance.strftime('%d.%m.%Y')])
+        if device.next_maintenance:
+            data.append(['Наступне обслуговування:', device.next_maintenance.strftime('%d.%m.%Y')])
+        if device.maintenance_interval:
+            data.append(['Інтервал обслуговування (днів):', str(device.maintenance_interval)])
+
+        info_table = Table(data, colWidths=[6 * cm, 10 * cm], style=resources.card_table)
+        # QR-код з дискового сховища; lazy - файл читається лише під час малювання
+        main_table = Table(
+            [[info_table, Image(qr_path, width=4 * cm, height=4 * cm, lazy=2)]],
+            colWidths=[12 * cm, 5 * cm], style=resources.card_layout
+        )
+
+        flowables = [
+            Paragraph("ІНВЕНТАРНА КАРТКА ОБЛАДНАННЯ", styles['title']),
+            Spacer(1, 0.5 * cm),
+            main_table,
+            Spacer(1, 1 * cm),
+        ]
+        if device.notes:
+            flowables.append(Paragraph("Примітки:", styles['heading']))
+            flowables.append(Paragraph(escape(device.notes).replace('\n', '<br/>'), styles['normal']))
+        return flowables
+
+    def render_card(self, device):
+        """
+        Інвентарна картка одного пристрою
+
+        Returns:
+            SpooledTemporaryFile: PDF
+        """
+        return self._build('card', [self._card_flowables(device)], 'Система інвентаризації обладнання')
+
+    def render_cards(self, devices):
+        """
+        Картки багатьох пристроїв, по одній на сторінку, за один прохід
+
+        Args:
+            devices: Ітерабельна колекція пристроїв (можна потоковий запит)
+
+        Returns:
+            SpooledTemporaryFile: PDF
+        """
+        def source():
+            for index, device in enumerate(devices):
+                yield ([PageBreak()] if index else []) + self._card_flowables(device)
+
+        return self._build('cards', source(), 'Інвентарні картки')
+
+    def _register_page_height(self, first_page):
+        """Висота для рядків таблиці реєстру на сторінці (без рядка заголовка)"""
+        styles = self.resources.styles
+        # Висота рамки сторінки A4 без полів (2 см) та внутрішніх відступів рамки (2 x 6 pt)
+        available = A4[1] - 4 * cm - 12
+        if first_page:
+            title = Paragraph("РЕЄСТР ОБЛАДНАННЯ", styles['register_title'])
+            _, title_height = title.wrap(A4[0] - 4 * cm, available)
+            available -= title_height + styles['register_title'].spaceAfter + 0.5 * cm
+        # Мінус рядок заголовка таблиці
+        return available - REGISTER_ROW_HEIGHT
+
+    def render_register(self, devices, title="РЕЄСТР ОБЛАДНАННЯ"):
+        """
+        Реєстр обладнання: таблиця по сторінці, з заголовком на кожній сторінці
+
+        Args:
+            devices: Ітерабельна колекція пристроїв (можна потоковий запит)
+            title: Заголовок документа
+
+        Returns:
+            SpooledTemporaryFile: PDF
+        """
+        resources = self.resources
+        header = [column for column, _ in REGISTER_COLUMNS]
+        widths = [width for _, width in REGISTER_COLUMNS]
+        page_heights = (self._register_page_height(True), self._register_page_height(False))
+
+        def page_table(rows, heights):
+            return Table(
+                [header] + rows, colWidths=widths, rowHeights=[REGISTER_ROW_HEIGHT] + heights,
+                repeatRows=1, style=resources.register_table
+            )
+
+        def source():
+            yield [Paragraph(escape(title), resources.styles['register_title']), Spacer(1, 0.5 * cm)]
+            rows = []
+            heights = []
+            used = 0
+            count = 0
+            page = 0
+            for device in devices:
+                count += 1
+                # Номер рядка не переноситься, текстові поля - за шириною колонки
+                cells = [[str(count)]] + [
+                    _wrap_cell(value, resources.font, width)
+                    for value, width in zip([
+                        device.inventory_number or '',
+                        device.name or '',
+                        device.type or '',
+                        device.serial_number or '',
+                        device.location or '',
+                        device.status or '',
+                    ], widths[1:])
+                ]
+                height = REGISTER_ROW_HEIGHT + (max(len(lines) for lines in cells) - 1) * REGISTER_LINE_HEIGHT
+                # Рядок не вміщується - сторінка завершена; розрив лише коли далі є рядки
+                if rows and used + height > page_heights[min(page, 1)]:
+                    yield [page_table(rows, heights), PageBreak()]
+                    rows = []
+                    heights = []
+                    used = 0
+                    page += 1
+                rows.append(['\n'.join(lines) for lines in cells])
+                heights.append(height)
+                used += height
+            if rows:
+                yield [page_table(rows, heights)]
+            yield [Spacer(1, 0.5 * cm), Paragraph(f"Всього пристроїв: {count}", resources.styles['summary'])]
+
+        return self._build('register', source(), 'Реєстр обладнання')
+
+    def stats(self):
+        with self._lock:
+            return {
+                'documents': self.documents,
+                'pages': self.pages,
+                'seconds': round(self.seconds, 3),
+                'pages_per_second': round(self.pages / self.seconds, 1) if self.seconds else 0.0,
+            }
+
+
+pdf_engine = PDFEngine()
+
+
+def generate_device_pdf(device):
+    """Генерує PDF інвентарної картки для пристрою"""
+    return pdf_engine.render_card(device)
+
+
+def generate_bulk_devices_pdf(devices, mode='register'):
+    """
+    Генерує PDF для багатьох пристроїв
 
+    Args:
+        devices: Ітерабельна колекція пристроїв
+        mode: 'register' - таблиця-реєстр, 'cards' - картка на сторінку
+    """
+    if mode == 'cards':
+        return pdf_engine.render_cards(devices)
+    return pdf_engine.render_register(devices)
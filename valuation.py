@@ -0,0 +1,226 @@
+"""
+Оцінка вартості парку обладнання на довільні дати (сценарії "що як")
+
+Вартість покупки, дата покупки та ставка амортизації всіх пристроїв
+читаються з бази один раз у колонки NumPy (load_fleet). Далі лінійна
+амортизація рахується векторно для кожної дати оцінки та кожного
+сценарію ставки - без об'єктів Device і без повторних запитів, а суми
+по містах і типах збираються через np.bincount.
+
+Правила ті самі, що й у Device.current_value: вартість не нижча за нуль,
+пристрої без ціни або дати покупки не оцінюються. Пристрої, куплені
+після дати оцінки, на цю дату не враховуються.
+
+    flask valuation --months 24 --rate 20 --rate 25
+"""
+
+import calendar
+import time
+from datetime import date
+
+from sqlalchemy import select
+
+from models import db, City, Device, DAYS_PER_YEAR
+
+try:
+    import numpy as np
+except ImportError:  # NumPy потрібен лише для оцінки парку
+    np = None
+
+# Обмеження для запитів з адмін-панелі
+MAX_AS_OF_DATES = 120
+MAX_RATE_SCENARIOS = 10
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("Для оцінки парку потрібен пакет numpy")
+
+
+def month_ends(count, until=None):
+    """
+    Останні дні count календарних місяців, що закінчились не пізніше until
+
+    Args:
+        count: Кількість місяців
+        until: Дата (за замовчуванням - сьогодні)
+
+    Returns:
+        list: Об'єкти date від найстарішого
+    """
+    until = until or date.today()
+    year, month = until.year, until.month
+    if calendar.monthrange(year, month)[1] != until.day:
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    ends = []
+    for _ in range(count):
+        ends.append(date(year, month, calendar.monthrange(year, month)[1]))
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    ends.reverse()
+    return ends
+
+
+class FleetColumns:
+    """Фінансові поля парку в колонках NumPy (рядок - пристрій)"""
+
+    def __init__(self, price, purchased, rate, group, groups):
+        self.price = price          # float64: вартість покупки
+        self.purchased = purchased  # int64: дата покупки (date.toordinal)
+        self.rate = rate            # float64: ставка амортизації, % на рік
+        self.group = group          # int64: індекс групи (місто, тип)
+        self.groups = groups        # список (city_id, city_name, type)
+
+    def __len__(self):
+        return len(self.price)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Будує колонки з рядків (city_id, city_name, type, price, purchase_date, rate)
+
+        Args:
+            rows: Ітерабельна колекція рядків
+
+        Returns:
+            FleetColumns
+        """
+        _require_numpy()
+        group_index = {}
+        groups = []
+        prices, purchased, rates, codes = [], [], [], []
+        for city_id, city_name, device_type, price, purchase_date, rate in rows:
+            key = (city_id, device_type)
+            code = group_index.get(key)
+            if code is None:
+                code = group_index[key] = len(groups)
+                groups.append((city_id, city_name, device_type))
+            prices.append(float(price))
+            purchased.append(purchase_date.toordinal())
+            rates.append(float(rate or 0))
+            codes.append(code)
+        return cls(
+            np.array(prices, dtype=np.float64),
+            np.array(purchased, dtype=np.int64),
+            np.array(rates, dtype=np.float64),
+            np.array(codes, dtype=np.int64),
+            groups,
+        )
+
+
+def load_fleet(city_id=None, batch_size=10000):
+    """
+    Читає фінансові поля пристроїв у колонки (один потоковий запит)
+
+    Args:
+        city_id: Обмежити одним містом (None - усі міста)
+        batch_size: Розмір пакета читання з бази
+
+    Returns:
+        FleetColumns
+    """
+    _require_numpy()
+    query = (
+        select(Device.city_id, City.name, Device.type, Device.purchase_price,
+               Device.purchase_date, Device.depreciation_rate)
+        .join(City, City.id == Device.city_id)
+        .where(Device.purchase_price > 0, Device.purchase_date.is_not(None))
+        .execution_options(yield_per=batch_size)
+    )
+    if city_id is not None:
+        query = query.where(Device.city_id == city_id)
+    result = db.session.execute(query)
+    try:
+        return FleetColumns.from_rows(result)
+    finally:
+        result.close()
+
+
+def evaluate(fleet, as_of_dates, rates=(None,)):
+    """
+    Балансова вартість парку на кожну дату для кожного сценарію ставки
+
+    Args:
+        fleet: FleetColumns
+        as_of_dates: Дати оцінки
+        rates: Сценарії ставки, % на рік (None - ставки пристроїв)
+
+    Returns:
+        dict: as_of, scenarios (rate, totals по датах, groups по містах і типах), devices, seconds
+    """
+    _require_numpy()
+    started = time.perf_counter()
+    as_of_dates = sorted(as_of_dates)
+    group_count = len(fleet.groups)
+
+    scenarios = []
+    for rate in rates:
+        rate_column = fleet.rate if rate is None else float(rate)
+        # Амортизація за день для кожного пристрою
+        daily = fleet.price * (rate_column / 100.0) / DAYS_PER_YEAR
+        book_values = np.zeros((len(as_of_dates), group_count))
+        devices = np.zeros((len(as_of_dates), group_count), dtype=np.int64)
+
+        for index, as_of in enumerate(as_of_dates):
+            age = as_of.toordinal() - fleet.purchased
+            owned = age >= 0
+            value = np.where(owned, np.maximum(fleet.price - daily * age, 0.0), 0.0)
+            book_values[index] = np.bincount(fleet.group, weights=value, minlength=group_count)
+            devices[index] = np.bincount(fleet.group, weights=owned, minlength=group_count)
+
+        scenarios.append({
+            'rate': rate,
+            'totals': [
+                {'as_of': as_of.isoformat(), 'devices': int(devices[index].sum()),
+                 'book_value': round(float(book_values[index].sum()), 2)}
+                for index, as_of in enumerate(as_of_dates)
+            ],
+            'groups': [
+                {
+                    'city_id': city_id,
+                    'city_name': city_name,
+                    'type': device_type,
+                    'devices': devices[:, code].tolist(),
+                    'book_value': np.round(book_values[:, code], 2).tolist(),
+                }
+                for code, (city_id, city_name, device_type) in enumerate(fleet.groups)
+            ],
+        })
+
+    return {
+        'as_of': [as_of.isoformat() for as_of in as_of_dates],
+        'devices': len(fleet),
+        'purchase_total': round(float(fleet.price.sum()), 2),
+        'scenarios': scenarios,
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+
+
+def register_commands(app):
+    """Реєструє команду flask valuation"""
+    import click
+
+    @app.cli.command('valuation')
+    @click.option('--as-of', 'as_of', multiple=True, type=click.DateTime(formats=['%Y-%m-%d']),
+                  help='Дата оцінки (можна кілька)')
+    @click.option('--months', type=int, default=None, help='Кінці останніх N місяців')
+    @click.option('--rate', multiple=True, type=float, help='Сценарій ставки амортизації, %% на рік (можна кілька)')
+    @click.option('--city-id', type=int, default=None, help='Лише одне місто')
+    def valuation_command(as_of, months, rate, city_id):
+        """Балансова вартість парку на дати та за сценаріями ставки"""
+        as_of_dates = [value.date() for value in as_of]
+        if months:
+            as_of_dates.extend(month_ends(months))
+        as_of_dates = sorted(set(as_of_dates or [date.today()]))
+
+        started = time.perf_counter()
+        fleet = load_fleet(city_id)
+        loaded = time.perf_counter() - started
+        report = evaluate(fleet, as_of_dates, [None] + list(rate))
+
+        print(f"Пристроїв: {report['devices']}, вартість покупки: {report['purchase_total']:.2f} грн")
+        for scenario in report['scenarios']:
+            label = 'ставки пристроїв' if scenario['rate'] is None else f"{scenario['rate']:g}% на рік"
+            print(f"\nСценарій: {label}")
+            for total in scenario['totals']:
+                print(f"  {total['as_of']}  {total['devices']:>8}  {total['book_value']:>16.2f} грн")
+        print(f"\nЗавантаження: {loaded:.2f} с, розрахунок: {report['seconds']:.2f} с")